@@ -0,0 +1,259 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from gui.filehandler import FileHandler
+from gui.selectionstore import POINT_TYPES, SelectionStore
+
+DIMENSIONS = ["x", "y", "z"]
+PROGRESS_FILE = "progress.jsonl"
+OVERLAY_ALPHA = 0.4
+SNAPSHOT_PANEL_INCHES = 4
+
+
+def read_manifest(path):
+    """
+    Read the studies to render from a CSV manifest with an `image` column and optional `mask`,
+    `points` and `id` columns. Relative paths are resolved against the directory of the manifest.
+    Rows without an image are kept with an image of None, so that they are reported as failed studies
+    instead of stopping the batch. They are named after their line if they have no id.
+
+    Args:
+        path (str): Path to the manifest
+
+    Returns:
+        list: One dict per study with the keys "id", "image", "mask" and "points"
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    studies = []
+    with open(path, newline="") as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            study = {}
+            for key in ("image", "mask", "points"):
+                value = (row.get(key) or "").strip()
+                study[key] = os.path.join(directory, value) if value else None
+            name = os.path.basename(study["image"]).split(".nii")[0] if study["image"] else f"line-{reader.line_num}"
+            study["id"] = (row.get("id") or "").strip() or name
+            studies.append(study)
+    return studies
+
+
+def read_progress(path):
+    """
+    Read the ids of the studies already rendered by a previous run.
+
+    Args:
+        path (str): Path to the progress file
+
+    Returns:
+        set: The ids of the rendered studies
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be incomplete if the previous run was killed while writing it
+                continue
+            if entry.get("status") == "ok":
+                done.add(entry["id"])
+    return done
+
+
+def read_points_csv(path):
+    """
+    Read selection points saved by the viewer.
+
+    Args:
+        path (str): Path to the CSV file with the columns dimension, slice, x, y and type
+
+    Returns:
+        SelectionStore: The points
+    """
+    selections = SelectionStore()
+    with open(path, newline="") as file:
+        for row in csv.DictReader(file):
+            selections.add(row["dimension"], int(row["slice"]), int(row["x"]), int(row["y"]), row["type"])
+    return selections
+
+
+def limit_memory(memory_limit_mb):
+    """
+    Limit the data memory of the current worker process, so that a study that does not fit fails
+    with a MemoryError instead of pushing the machine into swap. RLIMIT_DATA counts the heap and private
+    writable mappings, while read-only file mappings are not counted as the address space limit would.
+
+    Args:
+        memory_limit_mb (int): The limit in megabytes, 0 for no limit
+    """
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def snapshot_slices(file_handler):
+    """
+    Pick the slice shown for each dimension: the middle of the labeled range if the mask has labels,
+    otherwise the middle of the volume.
+
+    Args:
+        file_handler (FileHandler): File handler with a loaded image and optional mask
+
+    Returns:
+        dict: The slice index per dimension
+    """
+    indices = dict(file_handler.current_slice)
+    if file_handler.label_index is not None:
+        for dim in DIMENSIONS:
+            labeled = np.flatnonzero(file_handler.label_index.presence[dim][:, 1:].any(axis=1))
+            if len(labeled):
+                indices[dim] = int(labeled[(len(labeled) - 1) // 2])
+    return indices
+
+
+def render_snapshot(file_handler, selections, path, dpi):
+    """
+    Render the orthogonal slices of a study with the mask overlay and the selection points to a PNG,
+    with the same orientation and colors as the viewer panels.
+
+    Args:
+        file_handler (FileHandler): File handler with a loaded image and optional mask
+        selections (SelectionStore): The selection points, or None
+        path (str): Destination of the PNG
+        dpi (int): Resolution of the PNG
+    """
+    figure = Figure(figsize=(SNAPSHOT_PANEL_INCHES * len(DIMENSIONS), SNAPSHOT_PANEL_INCHES), facecolor="black")
+    FigureCanvasAgg(figure)
+    for position, (dim, index) in enumerate(snapshot_slices(file_handler).items(), start=1):
+        ax = figure.add_subplot(1, len(DIMENSIONS), position)
+        slice_data = file_handler.apply_window(file_handler.get_slice(dim, index))
+        height, width = slice_data.shape
+        extent = (0, width, height, 0)
+        ax.imshow(slice_data, cmap="gray", vmin=0, vmax=255, aspect="equal", extent=extent, interpolation="nearest")
+        if file_handler.nii_mask is not None:
+            ax.imshow(file_handler.get_mask_slice(dim, index), alpha=OVERLAY_ALPHA, aspect="equal", extent=extent, interpolation="nearest")
+        if selections is not None:
+            points = selections.points_on(dim, index)
+            is_positive = points["type"] == POINT_TYPES.index("P")
+            ax.plot(points["x"][is_positive], height - points["y"][is_positive], "go")
+            ax.plot(points["x"][~is_positive], height - points["y"][~is_positive], "ro")
+        ax.set_xlim(0, width)
+        ax.set_ylim(height, 0)
+        ax.set_title(f"{dim}: {index}", color="white")
+        ax.axis("off")
+    figure.savefig(path, dpi=dpi, facecolor=figure.get_facecolor())
+
+
+def render_study(task):
+    """
+    Load a study and render its snapshot. Runs in a worker process, errors are reported in the result
+    and their traceback is written next to the snapshot as `<id>.err`.
+
+    Args:
+        task (tuple): The study dict, the output directory, the PNG resolution and the number of
+            decompression threads
+
+    Returns:
+        dict: The study id, its status ("ok" or "failed"), the rendering time and the output, or the error
+            and the path of its traceback file
+    """
+    study, output_dir, dpi, decompression_threads = task
+    start = time.perf_counter()
+    result = {"id": study["id"], "pid": os.getpid()}
+    if study["image"] is None:
+        result.update(status="failed", error="No image in the manifest row", seconds=0.0)
+        return result
+    try:
+        file_handler = FileHandler(lazy=True, decompression_threads=decompression_threads)
+        file_handler.load_nifti_file(study["image"])
+        if study["mask"]:
+            file_handler.load_nifti_mask(study["mask"])
+            file_handler.show_mask = [True] * file_handler.nii_mask_channels
+        selections = read_points_csv(study["points"]) if study["points"] else None
+        output = os.path.join(output_dir, f"{study['id']}.png")
+        render_snapshot(file_handler, selections, output, dpi)
+        result.update(status="ok", output=output)
+    except MemoryError:
+        result.update(status="failed", error="memory limit exceeded")
+    except Exception as e:
+        error_path = os.path.join(output_dir, f"{study['id']}.err")
+        with open(error_path, "w") as file:
+            file.write(traceback.format_exc())
+        result.update(status="failed", error=f"{type(e).__name__}: {e}", error_file=error_path)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render overlay snapshots of many studies without a display.")
+    parser.add_argument("manifest", help="CSV file with an image column and optional mask, points and id columns")
+    parser.add_argument("output_dir", help="Directory for the PNG snapshots and the progress file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--memory-limit-mb", type=int, default=4096, help="Data memory limit per worker (RLIMIT_DATA), 0 for none")
+    parser.add_argument("--tasks-per-worker", type=int, default=50, help="Studies rendered before a worker is replaced")
+    parser.add_argument("--dpi", type=int, default=100, help="Resolution of the snapshots")
+    parser.add_argument("--restart", action="store_true", help="Render all studies again instead of resuming")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    progress_path = os.path.join(args.output_dir, PROGRESS_FILE)
+    if args.restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    studies = read_manifest(args.manifest)
+    done = read_progress(progress_path)
+    pending = [study for study in studies if study["id"] not in done]
+    print(f"{len(studies)} studies, {len(studies) - len(pending)} already rendered, {len(pending)} to render", file=sys.stderr)
+
+    results = {"ok": 0, "failed": 0}
+    render_seconds = 0.0
+    start = time.perf_counter()
+    # The workers share the cores instead of each inflating compressed files on all of them
+    workers = max(1, args.workers)
+    decompression_threads = max(1, (os.cpu_count() or 1) // workers)
+    tasks = [(study, args.output_dir, args.dpi, decompression_threads) for study in pending]
+    with open(progress_path, "a") as progress, multiprocessing.Pool(
+        workers, initializer=limit_memory, initargs=(args.memory_limit_mb,),
+        maxtasksperchild=args.tasks_per_worker or None,
+    ) as pool:
+        for count, result in enumerate(pool.imap_unordered(render_study, tasks), start=1):
+            # One flushed line per study, so that an interrupted run resumes after the last rendered study
+            progress.write(json.dumps(result) + "\n")
+            progress.flush()
+            results[result["status"]] += 1
+            render_seconds += result["seconds"]
+            if result["status"] == "failed":
+                print(f"\r{result['id']}: {result['error']}" + (f" (see {result['error_file']})" if 'error_file' in result else ""), file=sys.stderr)
+            print(f"\r{count}/{len(tasks)}", end="", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    if tasks:
+        print(file=sys.stderr)
+
+    summary = {
+        "studies": len(studies),
+        "skipped": len(studies) - len(pending),
+        "rendered": results["ok"],
+        "failed": results["failed"],
+        "workers": args.workers,
+        "elapsed_s": elapsed,
+        "studies_per_s": len(tasks) / elapsed if elapsed > 0 else 0.0,
+        "mean_study_s": render_seconds / len(tasks) if tasks else 0.0,
+    }
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if results["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Render offscreen so the suite runs without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import nibabel as nib
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from gui.controller import GuiController
+from gui.exporter import write_nifti
+from gui.filehandler import FileHandler
+from gui.instrumentation import INSTRUMENTATION
+from gui.pargzip import records_member_sizes
+from gui.view import GuiView, PANEL_BACKENDS
+
+DIMENSIONS = ["x", "y", "z"]
+
+
+def create_synthetic_volume(directory, shape, channels=1, compressed=True):
+    """
+    Write a synthetic int16 Nifti volume to a directory.
+
+    Args:
+        directory (str): Directory to write the file to
+        shape (tuple): Spatial shape of the volume
+        channels (int, optional): Number of channels
+        compressed (bool, optional): Write a .nii.gz instead of a .nii file
+
+    Returns:
+        str: Path to the written file
+    """
+    rng = np.random.default_rng(0)
+    full_shape = tuple(shape) + ((channels,) if channels > 1 else ())
+    data = rng.integers(-1000, 3000, size=full_shape, dtype=np.int16)
+    path = os.path.join(directory, "volume.nii.gz" if compressed else "volume.nii")
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path)
+    return path
+
+
+def create_synthetic_mask(directory, shape, labels, compressed=True):
+    """
+    Write a synthetic label mask with one box per label to a directory.
+
+    Args:
+        directory (str): Directory to write the file to
+        shape (tuple): Spatial shape of the mask
+        labels (int): Number of labels besides the background
+        compressed (bool, optional): Write a .nii.gz instead of a .nii file
+
+    Returns:
+        str: Path to the written file
+    """
+    rng = np.random.default_rng(1)
+    mask = np.zeros(shape, dtype=np.uint16 if labels > 255 else np.uint8)
+    for label in range(1, labels + 1):
+        size = [max(1, dim // 8) for dim in shape]
+        start = [rng.integers(0, dim - extent + 1) for dim, extent in zip(shape, size)]
+        mask[tuple(slice(begin, begin + extent) for begin, extent in zip(start, size))] = label
+    path = os.path.join(directory, "mask.nii.gz" if compressed else "mask.nii")
+    nib.save(nib.Nifti1Image(mask, np.eye(4)), path)
+    return path
+
+
+def summarize(samples):
+    """
+    Summarize latency samples.
+
+    Args:
+        samples (list): Latencies in seconds
+
+    Returns:
+        dict: Mean, p50 and p99 latency in milliseconds
+    """
+    samples_ms = np.array(samples) * 1000
+    return {
+        "mean_ms": float(samples_ms.mean()),
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p99_ms": float(np.percentile(samples_ms, 99)),
+    }
+
+
+def time_calls(function, arguments):
+    """
+    Time a function for each set of arguments.
+
+    Args:
+        function (callable): The function to time
+        arguments (list): Argument tuples to call the function with
+
+    Returns:
+        dict: Latency summary of the calls
+    """
+    samples = []
+    for args in arguments:
+        start = time.perf_counter()
+        function(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def spread_indices(size, count):
+    """
+    Get evenly spread slice indices along an axis.
+
+    Args:
+        size (int): Length of the axis
+        count (int): Number of indices
+
+    Returns:
+        list: The slice indices
+    """
+    return [int(index) for index in np.linspace(0, size - 1, count)]
+
+
+def benchmark_load(file_handler_options, image_path, mask_path):
+    """
+    Measure the load time and peak traced memory of an image and its mask.
+
+    Args:
+        file_handler_options (dict): Keyword arguments for the FileHandler
+        image_path (str): Path to the image
+        mask_path (str): Path to the mask
+
+    Returns:
+        tuple: The loaded FileHandler and the load measurements
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    file_handler = FileHandler(**file_handler_options)
+    file_handler.load_nifti_file(image_path)
+    image_seconds = time.perf_counter() - start
+    file_handler.load_nifti_mask(mask_path)
+    total_seconds = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    file_handler.show_mask = [True] * file_handler.nii_mask_channels
+    return file_handler, {
+        "image_s": image_seconds,
+        "total_s": total_seconds,
+        "peak_traced_mb": peak_bytes / 1e6,
+    }
+
+
+def benchmark_decompression(image_path, threads):
+    """
+    Compare reading a compressed image with `nib.load(...).get_fdata()` against the FileHandler
+    gzip path, on the single member file written by nibabel and on a copy written by the exporter
+    whose members are inflated in parallel. The single member file is inflated on one thread whatever
+    the number of threads, so its speedup is reported separately.
+
+    Args:
+        image_path (str): Path to a .nii.gz image
+        threads (int): Number of decompression threads
+
+    Returns:
+        dict: Read times in seconds and speedups against nibabel
+    """
+    image = nib.load(image_path)
+    member_path = image_path.replace(".nii.gz", "_members.nii.gz")
+    write_nifti(member_path, np.asarray(image.dataobj), image.affine, image.header)
+
+    def read_nibabel(path):
+        nib.load(path).get_fdata()
+
+    def read_file_handler(path):
+        FileHandler(decompression_threads=threads).read_native(nib.load(path))
+
+    results = {
+        "threads": threads,
+        "single_member_parallel": records_member_sizes(image_path),
+        "members_parallel": records_member_sizes(member_path),
+    }
+    for name, function, path in (
+        ("nibabel_get_fdata_s", read_nibabel, image_path),
+        ("single_member_s", read_file_handler, image_path),
+        ("nibabel_get_fdata_members_s", read_nibabel, member_path),
+        ("parallel_members_s", read_file_handler, member_path),
+    ):
+        start = time.perf_counter()
+        function(path)
+        results[name] = time.perf_counter() - start
+    results["single_member_speedup"] = results["nibabel_get_fdata_s"] / results["single_member_s"]
+    results["parallel_members_speedup"] = results["nibabel_get_fdata_members_s"] / results["parallel_members_s"]
+    return results
+
+
+def benchmark_slicing(file_handler, repeat):
+    """
+    Measure the per-axis latency of image and mask slice extraction.
+
+    Args:
+        file_handler (FileHandler): File handler with a loaded image and mask
+        repeat (int): Number of slices per axis
+
+    Returns:
+        dict: Latency summaries per function and axis
+    """
+    results = {"get_slice": {}, "get_mask_slice": {}}
+    for axis, dim in enumerate(DIMENSIONS):
+        indices = spread_indices(file_handler.nii_data.shape[axis], repeat)
+        # Copy the slice so that views pay for reading the plane as well
+        results["get_slice"][dim] = time_calls(
+            lambda index: np.array(file_handler.get_slice(dim, index)), [(index,) for index in indices]
+        )
+        results["get_mask_slice"][dim] = time_calls(file_handler.get_mask_slice, [(dim, index) for index in indices])
+    return results
+
+
+def benchmark_rendering(controller, repeat, scroll_frames):
+    """
+    Measure the panel update and view latency and the sustained scroll frame rate.
+
+    Args:
+        controller (GuiController): Controller with a loaded study
+        repeat (int): Number of slices per axis
+        scroll_frames (int): Number of frames rendered in the scroll test
+
+    Returns:
+        dict: Latency summaries per stage and axis and the scroll frame rate
+    """
+    app = QApplication.instance()
+    view = controller.view
+    file_handler = controller.file_handler
+    panels = {"x": view.panel1, "y": view.panel2, "z": view.panel4}
+    results = {"update_panel_cold": {}, "update_panel_warm": {}, "update_slice": {}}
+    for axis, dim in enumerate(DIMENSIONS):
+        indices = spread_indices(file_handler.nii_data.shape[axis], repeat)
+
+        def update_panel(index, clear_cache):
+            if clear_cache:
+                controller.slice_cache.clear()
+            file_handler.current_slice[dim] = index
+            controller.update_panel(dim, 0)
+
+        results["update_panel_cold"][dim] = time_calls(update_panel, [(index, True) for index in indices])
+        results["update_panel_warm"][dim] = time_calls(update_panel, [(index, False) for index in indices])
+        slices = [
+            (file_handler.apply_window(file_handler.get_slice(dim, index)), file_handler.get_mask_slice(dim, index), index)
+            for index in indices
+        ]
+        results["update_slice"][dim] = time_calls(
+            lambda slice_data, mask_data, index: view.update_slice(panels[dim], slice_data, index, mask_data),
+            slices,
+        )
+    app.processEvents()
+
+    controller.slice_cache.clear()
+    file_handler.current_slice["z"] = 0
+    start = time.perf_counter()
+    for frame in range(scroll_frames):
+        # Alternate the direction at the volume borders to scroll continuously
+        direction = -120 if (frame // (file_handler.nii_data.shape[2] - 1)) % 2 == 0 else 120
+        controller.scroll_slice("z", direction)
+        controller.render_scheduler.flush()
+        app.processEvents()
+    elapsed = time.perf_counter() - start
+    results["scroll_fps"] = scroll_frames / elapsed
+    results["slice_cache"] = controller.slice_cache.stats()
+    return results
+
+
+def git_revision():
+    """
+    Get the current git revision of the repository, if available.
+
+    Returns:
+        str: The revision hash, or None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    """
+    Flatten nested benchmark results into dotted metric names.
+
+    Args:
+        results (dict): The nested results
+        prefix (str, optional): Prefix of the metric names
+
+    Returns:
+        dict: Numeric metrics by dotted name
+    """
+    metrics = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def compare(results, baseline):
+    """
+    Print the relative change of every metric against a baseline report.
+
+    Args:
+        results (dict): The current report
+        baseline (dict): The baseline report
+    """
+    current = flatten(results["results"])
+    previous = flatten(baseline["results"])
+    print(f"Comparison against {baseline.get('revision') or 'baseline'}:")
+    for name in sorted(current.keys() & previous.keys()):
+        if previous[name]:
+            change = (current[name] - previous[name]) / previous[name] * 100
+            print(f"  {name:<45} {previous[name]:>12.3f} -> {current[name]:>12.3f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless benchmark of the FileHandler and rendering pipeline.")
+    parser.add_argument("--shape", type=int, nargs=3, default=[256, 256, 128], help="Spatial shape of the synthetic volume")
+    parser.add_argument("--channels", type=int, default=1, help="Number of image channels")
+    parser.add_argument("--labels", type=int, default=8, help="Number of mask labels")
+    parser.add_argument("--uncompressed", action="store_true", help="Write .nii instead of .nii.gz files")
+    parser.add_argument("--lazy", action="store_true", help="Load the volumes lazily")
+    parser.add_argument("--layout-budget", type=int, default=0, help="Byte budget for the per-axis layout")
+    parser.add_argument("--repeat", type=int, default=30, help="Number of slices measured per axis")
+    parser.add_argument("--panels", choices=PANEL_BACKENDS, default="matplotlib", help="Slice panel implementation")
+    parser.add_argument("--scroll-frames", type=int, default=200, help="Number of frames rendered in the scroll test")
+    parser.add_argument("--decompression-threads", type=int, default=os.cpu_count() or 1, help="Threads inflating compressed files")
+    parser.add_argument("--trace", help="Record stage timings and write them as a Chrome trace to this file")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--compare", help="Compare against a previous JSON report")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    INSTRUMENTATION.enabled = bool(args.trace)
+    file_handler_options = {"lazy": args.lazy, "axis_layout_budget": args.layout_budget, "decompression_threads": args.decompression_threads}
+    with tempfile.TemporaryDirectory() as directory:
+        image_path = create_synthetic_volume(directory, args.shape, args.channels, not args.uncompressed)
+        mask_path = create_synthetic_mask(directory, args.shape, args.labels, not args.uncompressed)
+
+        file_handler, load_results = benchmark_load(file_handler_options, image_path, mask_path)
+        slicing_results = benchmark_slicing(file_handler, args.repeat)
+        if not args.uncompressed:
+            slicing_results["decompression"] = benchmark_decompression(image_path, args.decompression_threads)
+
+        view = GuiView(panel_backend=args.panels)
+        view.show()
+        controller = GuiController(file_handler, view)
+        controller.update_sliders()
+        app.processEvents()
+        rendering_results = benchmark_rendering(controller, args.repeat, args.scroll_frames)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "config": vars(args),
+        "results": {
+            "load": load_results,
+            **slicing_results,
+            **rendering_results,
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    }
+    if args.trace:
+        report["results"]["stages"] = INSTRUMENTATION.stage_stats()
+        INSTRUMENTATION.export_chrome_trace(args.trace)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare(report, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from PyQt5.QtWidgets import QGridLayout, QWidget
+from PyQt5.QtCore import Qt, pyqtSignal
+from gui.imagepanel import ImagePanel
+
+COMPARE_DIMENSIONS = ["x", "y", "z"]
+COMPARE_PANEL_SIZE = 240
+
+class CompareView(QWidget):
+    """
+    Window showing several channels side by side, one column per channel and one row per dimension.
+    The panels paint with QPainter, the controller keeps them on the same slices as the main view.
+
+    Args:
+        channels (list): The channel indices to show
+        parent (QWidget, optional): The main window, the compare window is closed with it
+    """
+    closed = pyqtSignal()
+
+    def __init__(self, channels, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("Compare Channels")
+        self.channels = list(channels)
+        self.layout = QGridLayout()
+        self.layout.setSpacing(2)
+        self.setLayout(self.layout)
+        # Panels by (dimension, channel)
+        self.panels = {}
+        for row, dimension in enumerate(COMPARE_DIMENSIONS):
+            for column, channel in enumerate(self.channels):
+                panel = ImagePanel(f"{channel + 1}: {dimension.upper()}-Slice")
+                self.layout.addWidget(panel, row, column)
+                self.panels[(dimension, channel)] = panel
+        self.resize(COMPARE_PANEL_SIZE * len(self.channels), COMPARE_PANEL_SIZE * len(COMPARE_DIMENSIONS))
+
+    def update_slice(self, dimension, channel, slice_data, mask_data, positive, negative, label, full_shape=None):
+        """
+        Display a slice of a channel.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y" or "z")
+            channel (int): The channel of the slice
+            slice_data (np.ndarray): The uint8 display slice, or None to clear the panel
+            mask_data (np.ndarray): (height, width, 4) uint8 RGBA mask colors, or None
+            positive (tuple): Column and row sequences of the positive selection points
+            negative (tuple): Column and row sequences of the negative selection points
+            label (str): Text shown in the lower right corner
+            full_shape (tuple, optional): Full resolution shape of a downsampled slice
+        """
+        panel = self.panels.get((dimension, channel))
+        if panel is None:
+            return
+        if slice_data is None:
+            panel.clear()
+        else:
+            panel.set_slice(slice_data, mask_data, positive, negative, label, full_shape)
+
+    def closeEvent(self, event):
+        self.closed.emit()
+        super().closeEvent(event)
@@ -1,31 +1,84 @@
-from PyQt5.QtWidgets import QAction, QActionGroup, QListWidgetItem
-from PyQt5.QtCore import Qt
+import math
+import os
+from PyQt5.QtWidgets import QAction, QActionGroup, QApplication, QFileDialog
+from PyQt5.QtCore import Qt, QThread, QTimer
+from gui.compareview import CompareView
+from gui.exporter import ExportWorker
+from gui.loader import NiftiLoadWorker
+from gui.scheduler import RenderScheduler
+from gui.selectionmodel import SelectionListModel
+from gui.selectionstore import SelectionStore
+from gui.session import PROJECTION_CACHE_BYTES, Study, StudySession
+from gui.slicecache import SliceCache
+from gui.windowlevel import CT_PRESETS, PERCENTILE_PRESETS
 from gui.view import MAIN_SPLITTER_SIZES, LEFT_SPLITTER_SIZES, RIGHT_SPLITTER_SIZES
 from gui.filepopup import LoadFileDialog
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from gui.instrumentation import FRAME_SPAN, INSTRUMENTATION, span, timed
+from gui.projection import (
+    PROJECTION_MODES, LABEL_MODE, ProjectionWorker, colorize_labels, label_bit_lut, project, rotation_source
+)
+from gui.imagepanel import ImagePanel
+
+# Number of slices prefetched ahead of the current slice in the scroll direction
+PREFETCH_SLICES = 3
+# Delay without scrolling after which low resolution panels are refined to full resolution
+REFINE_DELAY_MS = 150
+# Rotation of the 3D view per wheel step or menu action in degrees
+ROTATION_STEP = 15
 
 class GuiController:
     """
     Controller class to manage interactions between the GUI view and the file_handler.
     """
-    def __init__(self, filehandler, view):
+    def __init__(self, filehandler, view, slice_cache=None, session=None):
         """
         Initialize the GUI Controller.
 
         Args:
             filehandler: The data filehandler containing the application's state and data.
             view: The GUI view for displaying and interacting with the user.
+            slice_cache (SliceCache, optional): Cache for rendered slice buffers. Defaults to a new SliceCache.
+            session (StudySession, optional): The open studies and their memory budget. Defaults to a new StudySession.
         """
         self.file_handler = filehandler
         self.view = view
         self.is_layers_locked = False
         self.expanded_panel = None
         self.is_updating_slider = False
-        self.selection_list = []
+        self.selections = SelectionStore()
+        self.selection_model = SelectionListModel(self.selections)
+        self.view.list_view.setModel(self.selection_model)
         self.is_selection_mode = False
+        self.slice_cache = slice_cache if slice_cache is not None else SliceCache()
+        self.scroll_direction = {"x": 1, "y": 1, "z": 1}
+        self.is_prefetch_pending = False
+        self.load_thread = None
+        self.load_worker = None
+        self.session = session if session is not None else StudySession()
+        # Evicted study whose files are being loaded again
+        self.reloading_study = None
+        self.export_thread = None
+        self.export_worker = None
+        self.window_drag_position = None
+        self.is_scrubbing = False
+        self.refine_timer = QTimer()
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.setInterval(REFINE_DELAY_MS)
+        self.refine_timer.timeout.connect(self.refine_panels)
+        self.projection_mode = PROJECTION_MODES[0]
+        self.projection_angle = 0
+        self.projection_cache = SliceCache(PROJECTION_CACHE_BYTES)
+        self.projection_thread = None
+        self.projection_worker = None
+        self.label_bits = (None, None)
+        self.compare_view = None
+        self.render_scheduler = RenderScheduler(
+            lambda dimensions: self.update_panels(self.file_handler.current_modality_channel, dimensions)
+        )
 
         self._initialize_actions()
         self._connect_panel_events()
+        self.view.panels_created.connect(self._connect_panel_events)
         self._initialize_sliders()
 
     def _initialize_sliders(self):
@@ -38,6 +91,16 @@ class GuiController:
         self.view.exit_action.triggered.connect(self.view.close)
         self.view.dark_mode_action.triggered.connect(self.toggle_dark_mode)
         self.view.load_action.triggered.connect(self.load_nifti_file)
+        self.view.save_action.triggered.connect(self.save_files)
+        self.view.record_timings_action.toggled.connect(self.set_recording)
+        self.view.hud_action.toggled.connect(self.set_hud)
+        self.view.export_trace_action.triggered.connect(self.export_trace)
+        self.view.studies_menu.aboutToShow.connect(self.update_studies_menu)
+        self.view.cancel_load_button.clicked.connect(self.cancel_loading)
+        self.view.cancel_save_button.clicked.connect(self.cancel_saving)
+        QApplication.instance().aboutToQuit.connect(lambda: self.cancel_loading(wait=True))
+        QApplication.instance().aboutToQuit.connect(self.wait_for_saving)
+        QApplication.instance().aboutToQuit.connect(self.wait_for_projection)
         self.view.apply_light_mode()
 
         self.view.checkbox_lock_layers.stateChanged.connect(self.lock_layers)
@@ -48,6 +111,7 @@ class GuiController:
         self.view.z_slice_slider.valueChanged.connect(lambda value: self.on_slider_value_changed("z", value))
 
         self.view.reset_selection_button.clicked.connect(self.clear_selection_list)
+        self.view.delete_selection_action.triggered.connect(self.delete_selected_points)
         self.view.checkbox_selection_mode.stateChanged.connect(self.toggle_selection_mode)
 
     def _connect_panel_events(self):
@@ -55,7 +119,11 @@ class GuiController:
         for dimension, panel in zip(["x", "y", "z", "3d"], [self.view.panel1, self.view.panel2, self.view.panel4]):
             panel.mouseDoubleClickEvent = lambda event, dim=dimension: self.toggle_panel(f"Panel-{dim}")
             panel.wheelEvent = lambda event, dim=dimension: self.scroll_slice(dim, event.angleDelta().y())
-            panel.mousePressEvent = lambda event, dim=dimension: self.mouse_click_selection(event, dim)
+            panel.mousePressEvent = lambda event, dim=dimension: self.mouse_press(event, dim)
+            panel.mouseMoveEvent = lambda event: self.mouse_drag_window(event)
+            panel.mouseReleaseEvent = lambda event: self.end_window_drag()
+        self.view.panel3.mouseDoubleClickEvent = lambda event: self.toggle_panel("Panel-3d")
+        self.view.panel3.wheelEvent = lambda event: self.rotate_projection(ROTATION_STEP if event.angleDelta().y() > 0 else -ROTATION_STEP)
 
     def update_sliders(self):
         dimension = ['x', 'y', 'z']
@@ -68,7 +136,7 @@ class GuiController:
                 slider.setEnabled(True)
             else:
                 slider.setEnabled(False)
-        if self.expanded_panel is not None:
+        if self.expanded_panel is not None and self.expanded_panel != "Panel-3d":
             cur_slider = getattr(self.view, f"{self.expanded_panel[-1]}_slice_slider")
             cur_slider.setEnabled(True)
 
@@ -76,9 +144,17 @@ class GuiController:
         """
         Clear the selection list.
         """
-        self.selection_list = []
+        self.selection_model.clear()
         self.update_panels(self.file_handler.current_modality_channel)
-        self.update_list_view()
+
+    def delete_selected_points(self):
+        """
+        Remove the points selected in the list view.
+        """
+        rows = [index.row() for index in self.view.list_view.selectionModel().selectedRows()]
+        if rows:
+            self.selection_model.remove_rows(rows)
+            self.update_panels(self.file_handler.current_modality_channel)
 
     def toggle_selection_mode(self):
         """
@@ -86,6 +162,43 @@ class GuiController:
         """
         self.is_selection_mode = self.view.checkbox_selection_mode.isChecked()
 
+    def mouse_press(self, event, dimension):
+        """
+        Handle a mouse press in a slice view panel: add a selection point in selection mode,
+        otherwise start adjusting the window/level with the left button.
+
+        Args:
+            event: The mouse event.
+            dimension (str): The dimension of the slice view panel ("x", "y", or "z").
+        """
+        if self.is_selection_mode:
+            self.mouse_click_selection(event, dimension)
+        elif event.button() == Qt.LeftButton and self.file_handler.nii_data is not None:
+            self.window_drag_position = event.pos()
+
+    def mouse_drag_window(self, event):
+        """
+        Adjust the window/level of the current channel while dragging with the left button.
+        Dragging horizontally changes the width, vertically the level.
+
+        Args:
+            event: The mouse event.
+        """
+        if self.window_drag_position is None:
+            return
+        delta = event.pos() - self.window_drag_position
+        self.window_drag_position = event.pos()
+        window_level = self.file_handler.window_levels[self.file_handler.current_modality_channel]
+        window_level.drag(delta.x(), delta.y())
+        self.view.statusBar().showMessage(f"W: {window_level.width:.0f} L: {window_level.level:.0f}")
+        self.render_scheduler.request(["x", "y", "z", "3d"])
+
+    def end_window_drag(self):
+        """
+        Stop adjusting the window/level.
+        """
+        self.window_drag_position = None
+
     def mouse_click_selection(self, event, dimension):
         """
         Handle mouse click selection event in a slice view panel.
@@ -103,31 +216,39 @@ class GuiController:
         if panel is None: 
             return
 
-        canvas = panel.figure.gca()
-        image_extent = canvas.get_images()[0].get_extent()  # Get image extent (left, right, bottom, top)
-        left, right, top, bottom = image_extent
-        # Get mouse click position in canvas coordinates
-        click_x = event.pos().x()
-        click_y = event.pos().y()
-        
-        # Transform canvas coordinates into image coordinates
-        inv = canvas.transData.inverted()
-        image_coords = inv.transform((click_x, click_y))
-        image_x, image_y = image_coords
+        current_slice = self.file_handler.current_slice[dimension]
+        if isinstance(panel, ImagePanel):
+            pixel = panel.map_to_pixel(event.pos())
+            if pixel is None:
+                return
+            # Store y from the bottom of the slice like the matplotlib panels
+            pixel_x, pixel_y = pixel[0], panel.full_shape[0] - pixel[1]
+        else:
+            canvas = panel.figure.gca()
+            image_extent = canvas.get_images()[0].get_extent()  # Get image extent (left, right, bottom, top)
+            left, right, top, bottom = image_extent
+            # Get mouse click position in canvas coordinates
+            click_x = event.pos().x()
+            click_y = event.pos().y()
+
+            # Transform canvas coordinates into image coordinates
+            inv = canvas.transData.inverted()
+            image_coords = inv.transform((click_x, click_y))
+            image_x, image_y = image_coords
 
-        # Check if the click is within the image bounds
-        if left <= image_x <= right and bottom <= image_y <= top:
+            # Check if the click is within the image bounds
+            if not (left <= image_x <= right and bottom <= image_y <= top):
+                return
             # Convert to pixel coordinates of the image
             img_width = right - left
             img_height = top - bottom
-            current_slice = self.file_handler.current_slice[dimension]
-            
+
             dimension_map = {
                 "x": self.file_handler.nii_data[0],
                 "y": self.file_handler.nii_data[1],
                 "z": self.file_handler.nii_data
             }
-            
+
             nii_data = dimension_map[dimension]
             # Determine shape based on whether it's "z" or others
             if dimension in ["x", "y"]:
@@ -138,13 +259,12 @@ class GuiController:
             pixel_x = int((image_x - left) / img_width * shape_x)
             pixel_y = int((image_y - bottom) / img_height * shape_y)
 
-            if event.button() == Qt.LeftButton:
-                self.selection_list.append((dimension, current_slice, pixel_x, pixel_y, "P"))
-            elif event.button() == Qt.RightButton:
-                self.selection_list.append((dimension, current_slice, pixel_x, pixel_y, "N"))
+        if event.button() == Qt.LeftButton:
+            self.selection_model.add_point(dimension, current_slice, pixel_x, pixel_y, "P")
+        elif event.button() == Qt.RightButton:
+            self.selection_model.add_point(dimension, current_slice, pixel_x, pixel_y, "N")
 
-            self.update_panels(self.file_handler.current_modality_channel)
-            self.update_list_view()
+        self.update_panels(self.file_handler.current_modality_channel)
 
     def toggle_show_mask(self, mask_index):
         """
@@ -174,8 +294,11 @@ class GuiController:
         if not self.is_updating_slider:
             self.is_updating_slider = True  # Prevent recursion
 
+            if value != self.file_handler.current_slice[dimension]:
+                self.scroll_direction[dimension] = 1 if value > self.file_handler.current_slice[dimension] else -1
             self.file_handler.current_slice[dimension] = value
-            self.update_panels(self.file_handler.current_modality_channel)
+            self.begin_scrubbing()
+            self.render_scheduler.request([dimension])
             if dimension == "x":
                 self.view.x_slice_label.setText(f"X: {value}")
             elif dimension == "y":
@@ -213,8 +336,15 @@ class GuiController:
             return
 
         def update_current_slices(dimensions):
+            skip_empty = self.view.checkbox_skip_empty.isChecked() and self.file_handler.label_index is not None
             for dim in dimensions:
-                if delta_y > 0:
+                self.scroll_direction[dim] = -1 if delta_y > 0 else 1
+                if skip_empty:
+                    # Jump to the next slice containing a label, stay if there is none
+                    next_index = self.file_handler.next_labeled_slice(dim, self.file_handler.current_slice[dim], self.scroll_direction[dim])
+                    if next_index is not None:
+                        self.file_handler.current_slice[dim] = next_index
+                elif delta_y > 0:
                     self.file_handler.current_slice[dim] = max(self.file_handler.current_slice[dim] - 1, 0)
                 else:
                     self.file_handler.current_slice[dim] = min(self.file_handler.current_slice[dim] + 1,
@@ -225,12 +355,62 @@ class GuiController:
         if self.file_handler.nii_data is not None:
             self.is_updating_slider = True
             if self.is_layers_locked and self.expanded_panel is None:
-                update_current_slices(["x", "y", "z"])
+                dimensions = ["x", "y", "z"]
             else:
-                update_current_slices([dimension])
-            self.update_panels(self.file_handler.current_modality_channel)
+                dimensions = [dimension]
+            update_current_slices(dimensions)
+            self.begin_scrubbing()
+            self.render_scheduler.request(dimensions)
             self.is_updating_slider = False
 
+    def begin_scrubbing(self):
+        """
+        Render panels at a reduced resolution until scrolling pauses for `REFINE_DELAY_MS`.
+        """
+        self.is_scrubbing = True
+        self.refine_timer.start()
+
+    def refine_panels(self):
+        """
+        Re-render the panels at full resolution once scrolling has paused.
+        """
+        self.is_scrubbing = False
+        self.render_scheduler.request(["x", "y", "z"])
+
+    def display_level(self, dimension):
+        """
+        Get the pyramid level to render a panel with: the coarsest available level that still has
+        at least as many pixels as the panel while scrolling, full resolution otherwise.
+
+        Args:
+            dimension (str): The dimension of the panel ("x", "y", or "z").
+
+        Returns:
+            int: The pyramid level
+        """
+        pyramid = self.file_handler.data_pyramid
+        if not self.is_scrubbing or pyramid is None or pyramid.available_levels < 2:
+            return 0
+        panel = {"x": self.view.panel1, "y": self.view.panel2, "z": self.view.panel4}[dimension]
+        height, width = self.plane_shape(dimension)
+        ratio = min(height / max(panel.height(), 1), width / max(panel.width(), 1))
+        if ratio < 2:
+            return 0
+        return min(int(math.log2(ratio)), pyramid.available_levels - 1)
+
+    def plane_shape(self, dimension):
+        """
+        Get the full resolution shape of the slices along a dimension.
+
+        Args:
+            dimension (str): The dimension of the slices ("x", "y", or "z").
+
+        Returns:
+            tuple: The height and width of the slices
+        """
+        shape = self.file_handler.nii_data.shape
+        return {"x": (shape[1], shape[2]), "y": (shape[0], shape[2]), "z": (shape[0], shape[1])}[dimension]
+
     def toggle_dark_mode(self):
         """
         Toggle between dark mode and light mode in the view.
@@ -295,45 +475,288 @@ class GuiController:
     def load_nifti_file(self):
         """
         Open a dialog to load a NIfTI file and optionally a NIfTI mask file.
-        Update the view with the loaded data.
-
-        Raises:
-            Exception: If an error occurs while loading the NIfTI file or mask.
+        The files are loaded in a background thread, the current data stays displayed until they are ready.
         """
         # Create the dialog for loading files
         dialog = LoadFileDialog(self.view.dark_mode_action.isChecked())
-        if dialog.exec_():
-            try:
-                self.file_handler.nii_data = None
-                self.file_handler.nii_mask = None
-                # Load the primary NIfTI file
-                if hasattr(dialog, 'nifti_path'):
-                    self.file_handler.load_nifti_file(dialog.nifti_path)
-                    self.update_modality_menu()
-                    self.update_sliders()
-                # Load the optional mask file if the checkbox is checked
-                if dialog.checkbox.isChecked() and hasattr(dialog, 'mask_path'):
-                    self.file_handler.load_nifti_mask(dialog.mask_path)
-                    self.update_mask_menu()
-                    
-                self.update_panels(self.file_handler.current_modality_channel)
-                
-            except Exception as e:
-                self.view.display_error(f"Failed to load files: {str(e)}")
-
-    def update_panels(self, channel=0, dimensions=["x", "y", "z"]):
+        if dialog.exec_() and hasattr(dialog, 'nifti_path'):
+            # Load the optional mask file if the checkbox is checked
+            mask_path = dialog.mask_path if dialog.checkbox.isChecked() and hasattr(dialog, 'mask_path') else None
+            study = self.session.find(dialog.nifti_path, mask_path)
+            if study is not None:
+                self.switch_study(study)
+            else:
+                self.start_loading(dialog.nifti_path, mask_path)
+
+    def start_loading(self, nifti_path, mask_path=None):
+        """
+        Start loading a NIfTI file and an optional mask in a worker thread.
+
+        Args:
+            nifti_path (str): Path to the NIfTI file.
+            mask_path (str, optional): Path to the NIfTI mask file.
+        """
+        if self.load_worker is not None:
+            return
+        if self.load_thread is not None:
+            # Wait for the previous worker thread to finish quitting before replacing it
+            self.load_thread.quit()
+            self.load_thread.wait()
+        self.load_thread = QThread()
+        self.load_worker = NiftiLoadWorker(self.file_handler.empty_copy(), nifti_path, mask_path)
+        self.load_worker.moveToThread(self.load_thread)
+        self.load_thread.started.connect(self.load_worker.run)
+        self.load_worker.progress.connect(self.view.show_load_progress)
+        self.load_worker.preview_ready.connect(self.on_load_preview)
+        self.load_worker.finished.connect(self.on_load_finished)
+        self.load_worker.failed.connect(self.on_load_failed)
+        self.load_worker.cancelled.connect(self.on_load_cancelled)
+        for signal in (self.load_worker.finished, self.load_worker.failed, self.load_worker.cancelled):
+            signal.connect(self.load_thread.quit)
+        self.view.load_action.setEnabled(False)
+        self.view.show_load_progress(0)
+        self.load_thread.start()
+
+    def cancel_loading(self, wait=False):
+        """
+        Cancel the file loading in progress, if any.
+
+        Args:
+            wait (bool): Block until the worker thread has stopped.
+        """
+        if self.load_worker is not None:
+            self.load_worker.cancel()
+        if wait and self.load_thread is not None:
+            self.load_thread.quit()
+            self.load_thread.wait()
+
+    def on_load_preview(self, index, slice_data):
+        """
+        Display the middle Z slice of a file that is still loading.
+
+        Args:
+            index (int): The index of the slice.
+            slice_data (np.ndarray): The slice data.
+        """
+        self.view.update_slice(self.view.panel4, slice_data, index)
+
+    def on_load_finished(self, file_handler):
+        """
+        Open the loaded files as a new study, or as the reloaded files of an evicted study, and display it.
+        The previous study stays open in the session.
+
+        Args:
+            file_handler (FileHandler): The file handler holding the loaded files.
+        """
+        study = self.reloading_study
+        self.on_load_stopped()
+        if study is None:
+            study = Study(file_handler, self.slice_cache.max_bytes, self.projection_cache.max_bytes)
+        else:
+            file_handler.restore_display_state(study.file_handler)
+            study.file_handler = file_handler
+        self.show_study(study)
+        file_handler.write_volume_cache()
+
+    def switch_study(self, study):
+        """
+        Display another open study, reloading its files first if it was evicted.
+
+        Args:
+            study (Study): The study to display.
+        """
+        if study is self.session.active and study.is_loaded:
+            return
+        if study.is_loaded:
+            self.show_study(study)
+        elif self.load_worker is None:
+            self.start_loading(study.nifti_path, study.mask_path)
+            self.reloading_study = study
+
+    def show_study(self, study):
+        """
+        Make a study active and display it with its own selections and caches.
+
+        Args:
+            study (Study): The study to display.
+        """
+        self.file_handler = study.file_handler
+        if self.file_handler.pyramid and self.file_handler.data_pyramid is None:
+            self.file_handler.start_pyramids()
+        # Activated once its pyramids are started, so that the budget reserves their levels
+        self.session.activate(study)
+        self.selections = study.selections
+        self.selection_model.set_selections(study.selections)
+        self.slice_cache = study.slice_cache
+        self.projection_cache = study.projection_cache
+        self.label_bits = (None, None)
+        if self.file_handler.nii_mask is not None:
+            self.label_bits = label_bit_lut(self.file_handler.label_index.labels, self.file_handler.nii_mask_max_label)
+        self.update_modality_menu()
+        self.update_window_menu()
+        self.update_projection_menu()
+        self.update_sliders()
+        if self.file_handler.nii_mask is not None:
+            self.update_mask_menu()
+        else:
+            self.view.mask_menu.clear()
+            self.view.mask_menu.setEnabled(False)
+        self.update_panels(self.file_handler.current_modality_channel)
+
+    def on_load_failed(self, message):
+        """
+        Report a file loading error.
+
+        Args:
+            message (str): The error message.
+        """
+        self.on_load_stopped()
+        self.discard_load_preview()
+        self.view.display_error(f"Failed to load files: {message}")
+
+    def on_load_cancelled(self):
+        """
+        Reset the loading state after a cancelled load.
+        """
+        self.on_load_stopped()
+        self.discard_load_preview()
+
+    def discard_load_preview(self):
+        """
+        Replace the preview of an abandoned load with the displayed study, or clear it without a study.
+        """
+        if self.file_handler.nii_data is not None:
+            self.update_panels(self.file_handler.current_modality_channel, ["z"])
+        else:
+            self.view.clear_panel(self.view.panel4)
+
+    def on_load_stopped(self):
+        """
+        Reset the loading state once the worker is done.
+        """
+        self.load_worker = None
+        self.reloading_study = None
+        self.view.load_action.setEnabled(True)
+        self.view.hide_load_progress()
+
+    def save_files(self):
+        """
+        Ask for a destination and save the mask and the selection points in a background thread.
+        The points are written next to the mask as "<name>_points.csv", without a mask only the
+        points are saved.
+        """
+        if self.export_worker is not None:
+            return
+        has_mask = self.file_handler.nii_mask is not None
+        if not has_mask and len(self.selections) == 0:
+            self.view.display_error("There is no mask or selection to save.")
+            return
+        if has_mask:
+            path, _ = QFileDialog.getSaveFileName(self.view, "Save Mask", "", "Nifti Files (*.nii.gz *.nii)")
+            if path and not path.endswith((".nii", ".nii.gz")):
+                path += ".nii.gz"
+            stem = path[:-len(".nii.gz")] if path.endswith(".nii.gz") else path[:-len(".nii")]
+            points_path = f"{stem}_points.csv"
+        else:
+            path, _ = QFileDialog.getSaveFileName(self.view, "Save Selection", "", "CSV Files (*.csv)")
+            points_path = path
+        if path:
+            self.start_saving(path if has_mask else None, points_path if len(self.selections) else None)
+
+    def start_saving(self, mask_path=None, points_path=None):
+        """
+        Start saving the mask and the selection points in a worker thread.
+        The points are copied so that selecting can continue while saving.
+
+        Args:
+            mask_path (str, optional): Destination of the mask, ".nii.gz" files are compressed.
+            points_path (str, optional): Destination of the selection points CSV.
+        """
+        if self.export_worker is not None:
+            return
+        if self.export_thread is not None:
+            self.export_thread.quit()
+            self.export_thread.wait()
+        points = self.selections.points[:len(self.selections)].copy() if points_path else None
+        self.export_thread = QThread()
+        self.export_worker = ExportWorker(
+            self.file_handler.nii_mask if mask_path else None, self.file_handler.nii_mask_affine,
+            self.file_handler.nii_mask_header, mask_path, points, points_path,
+        )
+        self.export_worker.moveToThread(self.export_thread)
+        self.export_thread.started.connect(self.export_worker.run)
+        self.export_worker.progress.connect(self.view.show_save_progress)
+        self.export_worker.finished.connect(self.on_save_finished)
+        self.export_worker.failed.connect(self.on_save_failed)
+        self.export_worker.cancelled.connect(self.on_save_stopped)
+        for signal in (self.export_worker.finished, self.export_worker.failed, self.export_worker.cancelled):
+            signal.connect(self.export_thread.quit)
+        self.view.save_action.setEnabled(False)
+        self.view.show_save_progress(0)
+        self.export_thread.start()
+
+    def cancel_saving(self):
+        """
+        Cancel the saving in progress, if any. Partially written files are removed.
+        """
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+
+    def wait_for_saving(self):
+        """
+        Block until the saving worker thread has stopped, so that files are not left half written.
+        """
+        if self.export_thread is not None:
+            self.export_thread.quit()
+            self.export_thread.wait()
+
+    def on_save_finished(self, paths):
+        """
+        Report the saved files.
+
+        Args:
+            paths (list): The written paths.
+        """
+        self.on_save_stopped()
+        self.view.statusBar().showMessage(f"Saved {', '.join(os.path.basename(path) for path in paths)}")
+
+    def on_save_failed(self, message):
+        """
+        Report a saving error.
+
+        Args:
+            message (str): The error message.
+        """
+        self.on_save_stopped()
+        self.view.display_error(f"Failed to save files: {message}")
+
+    def on_save_stopped(self):
+        """
+        Reset the saving state once the worker is done.
+        """
+        self.export_worker = None
+        self.view.save_action.setEnabled(True)
+        self.view.hide_save_progress()
+
+    def update_panels(self, channel=0, dimensions=["x", "y", "z", "3d"]):
         """
         Update all slice views for given dimensions and modality channel.
 
         Args:
-            dimensions (list): List of dimensions to update.
+            dimensions (list): List of dimensions to update, "3d" for the 3D view.
             channel (int): The modality channel index.
         """
         if self.expanded_panel is not None:
-            self.update_panel(self.expanded_panel[-1], channel)
-        else:
+            dimensions = [self.expanded_panel.split("-")[1]]
+        with span(FRAME_SPAN):
             for dimension in dimensions:
-                self.update_panel(dimension, channel)
+                if dimension == "3d":
+                    self.update_projection_panel()
+                else:
+                    self.update_panel(dimension, channel)
+        if self.view.hud_action.isChecked():
+            self.view.set_hud_text(INSTRUMENTATION.hud_text())
+        self.schedule_prefetch()
 
     def update_panel(self, dimension, channel=0):
         """
@@ -344,15 +767,434 @@ class GuiController:
             channel (int): The modality channel index.
         """
         panel_map = {"x": self.view.panel1, "y": self.view.panel2, "z": self.view.panel4}
-        slice_data = self.file_handler.get_slice(dimension, self.file_handler.current_slice[dimension], channel)
-        mask_data = self.file_handler.get_mask_slice(dimension, self.file_handler.current_slice[dimension]) if self.file_handler.nii_mask is not None else None
+        level = self.display_level(dimension)
+        index = self.file_handler.current_slice[dimension]
+        slices = self.get_display_slices(dimension, index, self.display_channels(channel), level)
+        slice_data, mask_data = slices[channel]
         if slice_data is not None:
-            self.view.update_slice(panel_map[dimension], slice_data, self.file_handler.get_current_slice_index(dimension), mask_data, self.selection_list)
+            self.view.update_slice(panel_map[dimension], slice_data, self.file_handler.get_current_slice_index(dimension), mask_data, self.selections,
+                                   full_shape=self.plane_shape(dimension))
+        if self.compare_view is not None:
+            self.update_compare_panels(dimension, index, slices)
+
+    def display_channels(self, channel=0):
+        """
+        Get the channels displayed at the same time: the given channel and the channels of the compare view.
+
+        Args:
+            channel (int): The modality channel index of the main view.
+
+        Returns:
+            list: The channel indices, starting with `channel`
+        """
+        if self.compare_view is None:
+            return [channel]
+        return [channel] + [other for other in self.compare_view.channels if other != channel]
+
+    def get_display_slice(self, dimension, index, channel=0, level=0):
+        """
+        Get the image and colored mask slice to display, served from the slice cache when possible.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y", or "z").
+            index (int): The slice index.
+            channel (int): The modality channel index.
+            level (int): The pyramid level of the slice.
+
+        Returns:
+            tuple: The image slice and the colored mask slice (None without a mask)
+        """
+        return self.get_display_slices(dimension, index, [channel], level)[channel]
+
+    def get_display_slices(self, dimension, index, channels, level=0):
+        """
+        Get the display slices of several channels at the same position. Slices missing from the
+        slice cache are rendered from one extraction of the plane shared by all channels.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y", or "z").
+            index (int): The slice index.
+            channels (list): The modality channel indices.
+            level (int): The pyramid level of the slices.
+
+        Returns:
+            dict: The image slice and the colored mask slice by channel
+        """
+        slices = {}
+        for channel in channels:
+            cached = self.slice_cache.get(self.slice_cache_key(dimension, index, channel, level))
+            if cached is not None:
+                slices[channel] = cached
+        missing = [channel for channel in channels if channel not in slices]
+        if missing:
+            # The colored mask does not depend on the channel, a cached one is reused
+            mask_data = next(iter(slices.values()))[1] if slices else None
+            slices.update(self.fill_slices(dimension, index, missing, level, mask_data))
+        return slices
+
+    @timed("controller.fill_slices")
+    def fill_slices(self, dimension, index, channels, level=0, mask_data=None):
+        """
+        Render the display slices of several channels and store them in the slice cache.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y", or "z").
+            index (int): The slice index.
+            channels (list): The modality channel indices.
+            level (int): The pyramid level of the slices.
+            mask_data (np.ndarray, optional): The colored mask slice if it is already known.
+
+        Returns:
+            dict: The image slice and the colored mask slice by channel
+        """
+        if len(channels) == 1:
+            slices = {channels[0]: self.render_slice(dimension, index, channels[0], level)}
+        else:
+            plane = self.file_handler.get_plane(dimension, index, level)
+            if mask_data is None and self.file_handler.nii_mask is not None:
+                mask_data = self.file_handler.get_mask_slice(dimension, index, level)
+            slices = {
+                channel: (self.file_handler.apply_window(plane[..., channel], channel) if plane is not None else None, mask_data)
+                for channel in channels
+            }
+        for channel, (slice_data, channel_mask_data) in slices.items():
+            if slice_data is not None:
+                self.slice_cache.put(self.slice_cache_key(dimension, index, channel, level), (slice_data, channel_mask_data))
+        return slices
+
+    def render_slice(self, dimension, index, channel=0, level=0):
+        """
+        Extract the image slice and colorize the mask slice, bypassing the slice cache.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y", or "z").
+            index (int): The slice index.
+            channel (int): The modality channel index.
+            level (int): The pyramid level of the slice.
+
+        Returns:
+            tuple: The image slice and the colored mask slice (None without a mask)
+        """
+        slice_data = self.file_handler.get_slice(dimension, index, channel, level)
+        if slice_data is not None:
+            slice_data = self.file_handler.apply_window(slice_data, channel)
+        mask_data = self.file_handler.get_mask_slice(dimension, index, level) if self.file_handler.nii_mask is not None else None
+        return slice_data, mask_data
+
+    def slice_cache_key(self, dimension, index, channel=0, level=0):
+        """
+        Get the slice cache key for a slice in the current display state.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y", or "z").
+            index (int): The slice index.
+            channel (int): The modality channel index.
+            level (int): The pyramid level of the slice.
+
+        Returns:
+            tuple: The cache key
+        """
+        return (dimension, index, channel, level, self.file_handler.mask_state_key(), self.file_handler.window_key(channel))
+
+    def schedule_prefetch(self):
+        """
+        Prefetch the next slices in the scroll direction once the event loop is idle.
+        """
+        if not self.is_prefetch_pending:
+            self.is_prefetch_pending = True
+            QTimer.singleShot(0, self.prefetch_slices)
+
+    @timed("controller.prefetch_slices")
+    def prefetch_slices(self):
+        """
+        Fill the slice cache with the slices following the current ones in the scroll direction.
+        """
+        self.is_prefetch_pending = False
+        if self.file_handler.nii_data is None:
+            return
+        channels = self.display_channels(self.file_handler.current_modality_channel)
+        dimensions = [self.expanded_panel.split("-")[1]] if self.expanded_panel is not None else ["x", "y", "z"]
+        for dimension in dimensions:
+            if dimension == "3d":
+                continue
+            size = self.file_handler.nii_data.shape[{"x": 0, "y": 1, "z": 2}[dimension]]
+            level = self.display_level(dimension)
+            for step in range(1, PREFETCH_SLICES + 1):
+                index = self.file_handler.current_slice[dimension] + self.scroll_direction[dimension] * step
+                if not 0 <= index < size:
+                    break
+                missing = [channel for channel in channels if self.slice_cache_key(dimension, index, channel, level) not in self.slice_cache]
+                if missing:
+                    self.fill_slices(dimension, index, missing, level)
+
+    def update_projection_panel(self):
+        """
+        Display the projection of the current channel in the 3D view.
+        Missing projections are computed in a worker thread and displayed once they are ready,
+        mask visibility changes only recolor the cached label projection.
+        """
+        if self.file_handler.nii_data is None:
+            return
+        channel = self.file_handler.current_modality_channel
+        image_key, label_key = self.projection_keys()
+        image = self.projection_cache.get(image_key)
+        labels = self.projection_cache.get(label_key) if label_key is not None else (None,)
+        if image is None or labels is None:
+            self.start_projection(image_key if image is None else None, label_key if labels is None else None)
+            return
+        mask_data = None
+        if labels[0] is not None:
+            colors = self.file_handler.get_mask_lut()
+            if self.label_bits[0] is not None:
+                # Bits are label positions instead of label ids
+                colors = colors[self.file_handler.label_index.labels]
+            mask_data = colorize_labels(labels[0], colors)
+        self.view.update_slice(self.view.panel3, self.file_handler.apply_window(image[0], channel), None, mask_data,
+                               label=f"{self.projection_mode} {self.projection_angle}°")
+
+    def projection_keys(self):
+        """
+        Get the projection cache keys of the image and label projections for the current view.
+
+        Returns:
+            tuple: The image key and the label key, or None if no mask is loaded
+        """
+        image_key = ("image", self.file_handler.current_modality_channel, self.projection_mode, self.projection_angle)
+        label_key = ("labels", self.projection_angle) if self.file_handler.nii_mask is not None else None
+        return image_key, label_key
+
+    def start_projection(self, image_key=None, label_key=None):
+        """
+        Compute projections in a worker thread unless one is already running.
+
+        Args:
+            image_key (tuple, optional): The cache key of the image projection to compute.
+            label_key (tuple, optional): The cache key of the label projection to compute.
+        """
+        if self.projection_worker is not None:
+            return
+        file_handler = self.file_handler
+        angle = self.projection_angle
+        rotated = angle % 90 != 0
+        tasks = {}
+        if image_key is not None:
+            _, channel, mode, _ = image_key
+            tasks[image_key] = lambda: project(
+                file_handler.nii_data, mode, angle, channel=channel,
+                source=rotation_source(file_handler.nii_data, file_handler.data_pyramid, channel) if rotated else None,
+            )
+        if label_key is not None:
+            bit_lut, bit_dtype = self.label_bits
+            tasks[label_key] = lambda: project(
+                file_handler.nii_mask, LABEL_MODE, angle, bit_lut=bit_lut, bit_dtype=bit_dtype,
+                source=rotation_source(file_handler.nii_mask, file_handler.mask_pyramid) if rotated else None,
+            )
+        if self.projection_thread is not None:
+            self.projection_thread.quit()
+            self.projection_thread.wait()
+        self.projection_thread = QThread()
+        self.projection_worker = ProjectionWorker(tasks)
+        self.projection_worker.moveToThread(self.projection_thread)
+        self.projection_thread.started.connect(self.projection_worker.run)
+        self.projection_worker.finished.connect(lambda results, file_handler=file_handler: self.on_projection_finished(results, file_handler))
+        self.projection_worker.failed.connect(self.on_projection_failed)
+        for signal in (self.projection_worker.finished, self.projection_worker.failed):
+            signal.connect(self.projection_thread.quit)
+        self.projection_thread.start()
+
+    def on_projection_finished(self, results, file_handler):
+        """
+        Cache the computed projections and display the current one.
+
+        Args:
+            results (dict): The projections by cache key.
+            file_handler (FileHandler): The file handler the projections were computed from.
+        """
+        self.projection_worker = None
+        if file_handler is not self.file_handler:
+            # A new file was loaded while the projections were computed
+            self.update_projection_panel()
+            return
+        for key, projection in results.items():
+            self.projection_cache.put(key, (projection,))
+        # Computes the next projection if the view changed in the meantime
+        self.update_projection_panel()
+
+    def on_projection_failed(self, message):
+        """
+        Report a projection error.
+
+        Args:
+            message (str): The error message.
+        """
+        self.projection_worker = None
+        self.view.statusBar().showMessage(f"Failed to compute the 3D view: {message}")
+
+    def wait_for_projection(self):
+        """
+        Block until the projection worker thread has stopped.
+        """
+        if self.projection_thread is not None:
+            self.projection_thread.quit()
+            self.projection_thread.wait()
+
+    def set_projection_mode(self, mode):
+        """
+        Set the projection mode of the 3D view.
+
+        Args:
+            mode (str): One of `PROJECTION_MODES`.
+        """
+        self.projection_mode = mode
+        self.update_projection_panel()
+
+    def rotate_projection(self, degrees):
+        """
+        Rotate the 3D view about the z axis.
+
+        Args:
+            degrees (int): The change of the view angle in degrees.
+        """
+        if self.file_handler.nii_data is None:
+            return
+        self.projection_angle = (self.projection_angle + degrees) % 360
+        self.update_projection_panel()
+
+    def update_projection_menu(self):
+        """
+        Update the 3D view menu with the projection modes and rotation actions.
+        """
+        self.view.projection_menu.clear()
+        self.view.projection_group = QActionGroup(self.view.projection_menu)
+        self.view.projection_group.setExclusive(True)
+        for mode in PROJECTION_MODES:
+            action = QAction(mode, self.view)
+            action.setCheckable(True)
+            action.setChecked(mode == self.projection_mode)
+            action.triggered.connect(lambda checked, mode=mode: self.set_projection_mode(mode))
+            self.view.projection_group.addAction(action)
+            self.view.projection_menu.addAction(action)
+        self.view.projection_menu.addSeparator()
+        for name, degrees in ((f"Rotate Left {ROTATION_STEP}°", -ROTATION_STEP), (f"Rotate Right {ROTATION_STEP}°", ROTATION_STEP)):
+            action = QAction(name, self.view)
+            action.triggered.connect(lambda checked, degrees=degrees: self.rotate_projection(degrees))
+            self.view.projection_menu.addAction(action)
+        reset_action = QAction("Reset Rotation", self.view)
+        reset_action.triggered.connect(lambda checked: self.rotate_projection(-self.projection_angle))
+        self.view.projection_menu.addAction(reset_action)
+        self.view.projection_menu.setEnabled(True)
+
+    def update_compare_panels(self, dimension, index, slices):
+        """
+        Display the slices of the compared channels at the position of the main view.
+
+        Args:
+            dimension (str): The dimension of the slices ("x", "y", or "z").
+            index (int): The slice index.
+            slices (dict): The image slice and the colored mask slice by channel.
+        """
+        panel = {"x": self.view.panel1, "y": self.view.panel2, "z": self.view.panel4}[dimension]
+        shape = self.plane_shape(dimension)
+        positive, negative = self.view.visible_points(panel, index, self.selections, shape[0])
+        for channel in self.compare_view.channels:
+            slice_data, mask_data = slices[channel]
+            self.compare_view.update_slice(dimension, channel, slice_data, mask_data, positive, negative, f"Slice: {index}", shape)
+
+    def set_compare_view(self, enabled):
+        """
+        Open or close the window comparing all channels side by side.
+
+        Args:
+            enabled (bool): True to open the window.
+        """
+        if not enabled:
+            self.close_compare_view()
+            return
+        if self.compare_view is not None or self.file_handler.nii_data is None:
+            return
+        self.compare_view = CompareView(range(self.file_handler.nii_data.shape[3]), self.view)
+        self.compare_view.closed.connect(self.on_compare_view_closed)
+        self.compare_view.show()
+        self.update_panels(self.file_handler.current_modality_channel, ["x", "y", "z"])
+
+    def close_compare_view(self):
+        """
+        Close the compare window, if it is open.
+        """
+        if self.compare_view is not None:
+            compare_view = self.compare_view
+            self.compare_view = None
+            compare_view.close()
+
+    def on_compare_view_closed(self):
+        """
+        Forget the compare window once it is closed.
+        """
+        self.compare_view = None
+        self.view.compare_action.setChecked(False)
+
+    def set_recording(self, enabled):
+        """
+        Start or stop recording the stage timings. Stopping also hides the performance HUD.
+
+        Args:
+            enabled (bool): Whether timings are recorded.
+        """
+        INSTRUMENTATION.enabled = enabled
+        if not enabled:
+            self.view.hud_action.setChecked(False)
+
+    def set_hud(self, enabled):
+        """
+        Show or hide the frame rate and frame latency overlay, recording timings while it is shown.
+
+        Args:
+            enabled (bool): Whether the overlay is shown.
+        """
+        if enabled:
+            self.view.record_timings_action.setChecked(True)
+        self.view.set_hud_text(INSTRUMENTATION.hud_text() if enabled else "")
+
+    def export_trace(self):
+        """
+        Save the recorded stage timings as a Chrome trace JSON file.
+        """
+        path, _ = QFileDialog.getSaveFileName(self.view, "Export Trace", "trace.json", "Chrome Trace (*.json)")
+        if not path:
+            return
+        try:
+            INSTRUMENTATION.export_chrome_trace(path)
+        except OSError as e:
+            self.view.display_error(f"Failed to export trace: {e}")
+
+    def update_studies_menu(self):
+        """
+        Update the studies menu with the open studies and the memory they use.
+        """
+        self.view.studies_menu.clear()
+        self.view.studies_group = QActionGroup(self.view.studies_menu)
+        self.view.studies_group.setExclusive(True)
+        for study in self.session.studies:
+            name = study.name if study.mask_path is None else f"{study.name} + {os.path.basename(study.mask_path)}"
+            if not study.is_loaded:
+                name += " (unloaded)"
+            action = QAction(name, self.view, checkable=True)
+            action.setChecked(study is self.session.active)
+            action.triggered.connect(lambda checked, study=study: self.switch_study(study))
+            self.view.studies_group.addAction(action)
+            self.view.studies_menu.addAction(action)
+        self.view.studies_menu.addSeparator()
+        memory_action = QAction(
+            f"Memory: {self.session.resident_bytes() / 1024 ** 2:.0f} / {self.session.budget_bytes / 1024 ** 2:.0f} MB", self.view
+        )
+        memory_action.setEnabled(False)
+        self.view.studies_menu.addAction(memory_action)
 
     def update_modality_menu(self):
         """
         Update the modality menu with available channels from the NIfTI data.
         """
+        self.close_compare_view()
         self.view.modality_menu.clear()
         self.view.modality_group = QActionGroup(self.view.modality_menu)
         self.view.modality_group.setExclusive(True)
@@ -364,8 +1206,39 @@ class GuiController:
             action.triggered.connect(lambda checked, i=i: self.change_modality(i))
             self.view.modality_group.addAction(action)
             self.view.modality_menu.addAction(action)
+        self.view.modality_menu.addSeparator()
+        self.view.compare_action = QAction("Compare Channels", self.view, checkable=True)
+        self.view.compare_action.setEnabled(self.file_handler.nii_data.shape[3] > 1)
+        self.view.compare_action.toggled.connect(self.set_compare_view)
+        self.view.modality_menu.addAction(self.view.compare_action)
         self.view.modality_menu.setEnabled(True)
 
+    def update_window_menu(self):
+        """
+        Update the window menu with the window/level presets.
+        """
+        self.view.window_menu.clear()
+        for name in PERCENTILE_PRESETS:
+            action = QAction(name, self.view)
+            action.triggered.connect(lambda checked, name=name: self.apply_window_preset(name))
+            self.view.window_menu.addAction(action)
+        self.view.window_menu.addSeparator()
+        for name in CT_PRESETS:
+            action = QAction(name, self.view)
+            action.triggered.connect(lambda checked, name=name: self.apply_window_preset(name))
+            self.view.window_menu.addAction(action)
+        self.view.window_menu.setEnabled(True)
+
+    def apply_window_preset(self, name):
+        """
+        Apply a window/level preset to the current modality channel.
+
+        Args:
+            name (str): The name of the preset.
+        """
+        self.file_handler.window_levels[self.file_handler.current_modality_channel].set_preset(name)
+        self.update_panels(self.file_handler.current_modality_channel)
+
     def change_modality(self, channel):
         """
         Change the current modality channel and update the view.
@@ -406,22 +1279,41 @@ class GuiController:
         self.view.mask_group.addAction(all_action)
         self.view.mask_menu.addAction(all_action)
 
+        labels = self.file_handler.label_index.labels
         for i in range(1, self.file_handler.nii_mask_channels):
-            action = QAction(str(i), self.view)
+            action = QAction(str(labels[i]), self.view)
             action.setCheckable(True)
             action.setChecked(self.file_handler.show_mask[i])
             action.setEnabled(not self.file_handler.show_mask[0])
             action.triggered.connect(lambda checked, i=i: self.toggle_show_mask(i))
             self.view.mask_group.addAction(action)
             self.view.mask_menu.addAction(action)
+
+        self.view.mask_menu.addSeparator()
+        jump_menu = self.view.mask_menu.addMenu("Jump to")
+        for i in range(1, self.file_handler.nii_mask_channels):
+            action = QAction(f"{labels[i]} ({self.file_handler.label_index.counts[i]} voxels)", self.view)
+            action.triggered.connect(lambda checked, label=labels[i]: self.jump_to_label(label))
+            jump_menu.addAction(action)
+        jump_menu.setEnabled(self.file_handler.nii_mask_channels > 1)
         self.view.mask_menu.setEnabled(True)
-        
-    def update_list_view(self):
+
+    def jump_to_label(self, label):
         """
-        Update the list view with the current selection list.
+        Move all slices to the center of the bounding box of a mask label.
+
+        Args:
+            label (int): The label to jump to.
         """
-        self.view.list_view.clear()
-        for item in self.selection_list:
-            text = f"slice: {item[0]}, layer: {item[1]}, x: {item[2]}, y: {item[3]}, Type: {item[4]}"
-            list_item = QListWidgetItem(text)
-            self.view.list_view.addItem(list_item)
+        bounding_box = self.file_handler.label_index.bounding_box(label)
+        if bounding_box is None:
+            return
+        # The sliders are moved without queuing their own renders, the panels are rendered once below
+        self.is_updating_slider = True
+        for dim, (first, last) in bounding_box.items():
+            self.file_handler.current_slice[dim] = (first + last) // 2
+            getattr(self.view, f"{dim}_slice_label").setText(f"{dim.upper()}: {self.file_handler.current_slice[dim]}")
+        self.update_sliders()
+        self.is_updating_slider = False
+        self.update_panels(self.file_handler.current_modality_channel)
+        
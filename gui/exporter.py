@@ -0,0 +1,231 @@
+import collections
+import csv
+import io
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from gui.pargzip import compress_member
+from gui.selectionstore import DIMENSIONS, POINT_TYPES
+from gui.volume import SLAB_SIZE, iter_slabs
+
+# Uncompressed bytes per gzip member, members are compressed independently
+GZIP_MEMBER_BYTES = 4 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+DEFAULT_COMPRESSION_THREADS = os.cpu_count() or 1
+
+class ExportCancelledError(Exception):
+    """
+    Raised when writing a file is cancelled before it is complete.
+    """
+
+def nifti_header_bytes(shape, dtype, affine, header=None):
+    """
+    Serialize a single file Nifti header for unscaled data, padded up to the data offset.
+
+    Args:
+        shape (tuple): The shape of the data
+        dtype (np.dtype): The type of the data
+        affine (np.ndarray): The voxel to world affine
+        header (nib.Nifti1Header, optional): Header to take the remaining fields from
+
+    Returns:
+        bytes: The header, extensions and padding
+    """
+    # Imported on first use to keep nibabel out of the application startup
+    import nibabel as nib
+    image = nib.Nifti1Image(np.broadcast_to(np.zeros((), dtype=dtype), shape), affine, header)
+    image.update_header()
+    image_header = image.header
+    image_header.set_data_dtype(dtype)
+    image_header.set_slope_inter(np.nan, np.nan)
+    # Let the header compute the smallest offset for its extensions
+    image_header["vox_offset"] = 0
+    buffer = io.BytesIO()
+    image_header.write_to(buffer)
+    offset = int(image_header["vox_offset"])
+    return buffer.getvalue().ljust(offset, b"\x00")
+
+def iter_volume_bytes(volume, slab_size=SLAB_SIZE):
+    """
+    Iterate over the bytes of a volume in Nifti file order, reading it in slabs along the third axis.
+
+    Args:
+        volume (np.ndarray or LazyVolume): 3D or 4D volume
+        slab_size (int, optional): Number of slices per slab
+
+    Yields:
+        bytes: Consecutive parts of the data
+    """
+    channels = volume.shape[3] if len(volume.shape) == 4 else None
+    for channel in range(channels or 1):
+        for _, slab in iter_slabs(volume, slab_size, (channel,) if channels else ()):
+            yield slab.tobytes(order="F")
+
+def iter_blocks(parts, block_size):
+    """
+    Regroup a stream of byte strings into blocks of a fixed size, the last block may be shorter.
+
+    Args:
+        parts (iterable): The byte strings
+        block_size (int): The size of the blocks
+
+    Yields:
+        bytes: The blocks
+    """
+    buffer = bytearray()
+    for part in parts:
+        buffer += part
+        while len(buffer) >= block_size:
+            yield bytes(buffer[:block_size])
+            del buffer[:block_size]
+    if buffer:
+        yield bytes(buffer)
+
+def write_nifti(path, volume, affine, header=None, compression_threads=DEFAULT_COMPRESSION_THREADS, progress_callback=None, is_cancelled=None):
+    """
+    Write a volume as a Nifti file without building the whole file in memory.
+    ".nii.gz" files are written as a sequence of gzip members compressed in parallel, which any gzip
+    reader decompresses as one stream. The members record their size so that they can also be
+    decompressed in parallel. Other files are written uncompressed.
+    The file is written next to its destination and only moved there once it is complete.
+
+    Args:
+        path (str): The destination path
+        volume (np.ndarray or LazyVolume): 3D or 4D volume
+        affine (np.ndarray): The voxel to world affine
+        header (nib.Nifti1Header, optional): Header to take the remaining fields from
+        compression_threads (int, optional): Number of threads compressing gzip members
+        progress_callback (callable, optional): Called as `progress_callback(written, total)` with uncompressed bytes
+        is_cancelled (callable, optional): Polled between blocks, writing stops when it returns True
+
+    Raises:
+        ExportCancelledError: If `is_cancelled` returned True before the file was complete
+    """
+    header_bytes = nifti_header_bytes(volume.shape, volume.dtype, affine, header)
+    total = len(header_bytes) + int(np.prod(volume.shape)) * np.dtype(volume.dtype).itemsize
+    blocks = iter_blocks(itertools.chain([header_bytes], iter_volume_bytes(volume)), GZIP_MEMBER_BYTES)
+    temporary_path = f"{path}.part"
+    written = 0
+    try:
+        with open(temporary_path, "wb") as file:
+            if not str(path).endswith(".gz"):
+                for block in blocks:
+                    if is_cancelled is not None and is_cancelled():
+                        raise ExportCancelledError()
+                    file.write(block)
+                    written += len(block)
+                    if progress_callback is not None:
+                        progress_callback(written, total)
+            else:
+                threads = max(1, compression_threads)
+                with ThreadPoolExecutor(threads) as pool:
+                    # Keep a bounded number of members in flight so memory does not grow with the file size
+                    pending = collections.deque()
+                    for block in blocks:
+                        if is_cancelled is not None and is_cancelled():
+                            raise ExportCancelledError()
+                        pending.append((len(block), pool.submit(compress_member, block, COMPRESSION_LEVEL)))
+                        if len(pending) >= 2 * threads:
+                            written += write_member(file, *pending.popleft())
+                            if progress_callback is not None:
+                                progress_callback(written, total)
+                    while pending:
+                        written += write_member(file, *pending.popleft())
+                        if progress_callback is not None:
+                            progress_callback(written, total)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+def write_member(file, size, future):
+    """
+    Write a compressed gzip member once it is ready.
+
+    Args:
+        file: The open destination file
+        size (int): The uncompressed size of the member
+        future (Future): The compression of the member
+
+    Returns:
+        int: The uncompressed size of the member
+    """
+    file.write(future.result())
+    return size
+
+def write_points_csv(path, points):
+    """
+    Write selection points to a CSV file.
+
+    Args:
+        path (str): The destination path
+        points (np.ndarray): Structured array of points with the fields of `POINT_DTYPE`
+    """
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["dimension", "slice", "x", "y", "type"])
+        for point in points.tolist():
+            dimension, slice_index, x, y, point_type = point
+            writer.writerow([DIMENSIONS[dimension], slice_index, x, y, POINT_TYPES[point_type]])
+
+class ExportWorker(QObject):
+    """
+    Worker that saves a mask and selection points outside the GUI thread.
+
+    Args:
+        mask (np.ndarray or LazyVolume): The mask to save, or None
+        affine (np.ndarray): The affine of the mask
+        header (nib.Nifti1Header): The header of the mask
+        mask_path (str): Destination of the mask
+        points (np.ndarray): The selection points to save, or None
+        points_path (str): Destination of the points
+        compression_threads (int, optional): Number of threads compressing the mask
+    """
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(list)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, mask, affine, header, mask_path, points, points_path, compression_threads=DEFAULT_COMPRESSION_THREADS):
+        super().__init__()
+        self.mask = mask
+        self.affine = affine
+        self.header = header
+        self.mask_path = mask_path
+        self.points = points
+        self.points_path = points_path
+        self.compression_threads = compression_threads
+        self.is_cancelled = False
+
+    def cancel(self):
+        """
+        Request the saving to stop at the next block boundary.
+        """
+        self.is_cancelled = True
+
+    def run(self):
+        """
+        Save the files and emit `finished` with the written paths, `cancelled` or `failed`.
+        """
+        paths = []
+        try:
+            if self.mask is not None:
+                write_nifti(
+                    self.mask_path, self.mask, self.affine, self.header, self.compression_threads,
+                    progress_callback=lambda written, total: self.progress.emit(99 * written // total),
+                    is_cancelled=lambda: self.is_cancelled,
+                )
+                paths.append(self.mask_path)
+            if self.points is not None:
+                write_points_csv(self.points_path, self.points)
+                paths.append(self.points_path)
+        except ExportCancelledError:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.progress.emit(100)
+            self.finished.emit(paths)
@@ -1,44 +1,458 @@
-import nibabel as nib
+import colorsys
+import importlib.util
+import threading
 import numpy as np
+from gui.instrumentation import timed
+from gui.labelindex import LabelIndex
+from gui.pargzip import DEFAULT_DECOMPRESSION_THREADS, decompress_into
+from gui.pyramid import VolumePyramid
+from gui.sparsemask import SparseMask
+from gui.volume import LazyVolume, build_axis_copies, iter_slabs, resident_nbytes, take_plane
+from gui.windowlevel import ChannelStatistics, WindowLevel
+
+AXIS_INDEX = {"x": 0, "y": 1, "z": 2}
+# Number of slices sampled for the intensity statistics of lazily read volumes
+LAZY_STATS_SLICES = 32
+
+def load_nifti(path, **kwargs):
+    """
+    Load a Nifti file. nibabel is imported with the first file rather than at application startup.
+
+    Args:
+        path (str): Path to the Nifti file
+        **kwargs: Keyword arguments of `nibabel.load`
+
+    Returns:
+        nib.Nifti1Image: The image
+    """
+    import nibabel as nib
+    return nib.load(path, **kwargs)
+
+class LoadCancelledError(Exception):
+    """
+    Raised when loading a Nifti file is cancelled before it completes.
+    """
 
 class FileHandler:
     """
     Class to handle the loading of Nifti files and the extraction of slices.
+
+    Args:
+        lazy (bool, optional): Keep volumes as on-disk array proxies and read only the requested slices.
+        axis_layout_budget (int, optional): Bytes that may be spent on per-axis contiguous copies of
+            in-memory volumes so that slicing along any axis costs the same. 0 disables the copies.
+        pyramid (bool, optional): Build downsampled levels of the image and mask in the background
+            after loading, for fast low resolution slicing.
+        sparse_mask (bool, optional): Keep the mask run-length encoded so that its memory scales with
+            the labeled region. Slices are decoded on demand.
+        volume_cache (VolumeCache, optional): On-disk cache of decoded compressed or scaled files, so that
+            they are memory-mapped instead of decoded again when they are reopened. New entries are written
+            by `write_volume_cache` once the loaded files are displayed.
+        decompression_threads (int, optional): Number of threads inflating compressed files whose gzip
+            members record their size, such as the masks saved by this application. Other compressed
+            files, including most .nii.gz files written by scanners and other tools, are inflated on one
+            thread at every open, unless the volume cache keeps their decoded copy.
     """
-    def __init__(self):
+    def __init__(self, lazy=False, axis_layout_budget=0, pyramid=False, sparse_mask=False, volume_cache=None,
+                 decompression_threads=DEFAULT_DECOMPRESSION_THREADS):
+        self.lazy = lazy
+        self.axis_layout_budget = axis_layout_budget
+        self.pyramid = pyramid
+        self.sparse_mask = sparse_mask
+        self.volume_cache = volume_cache
+        # Decoded volumes waiting to be written to the volume cache, as tuples of source path and data
+        self.pending_cache_entries = []
+        self.decompression_threads = decompression_threads
+        self.data_pyramid = None
+        self.mask_pyramid = None
         self.nii_data = None
         self.nii_mask = None
+        self.nii_path = None
+        self.nii_mask_path = None
+        # Affine and header of the loaded files, kept for saving
+        self.nii_affine = None
+        self.nii_header = None
+        self.nii_mask_affine = None
+        self.nii_mask_header = None
+        self.data_axis_copies = {}
+        self.mask_axis_copies = {}
+        self.window_levels = []
         self.current_slice = {"x": 0, "y": 0, "z": 0}
         self.current_modality_channel = 0
         self.show_mask = []
         self.nii_mask_channels = 0
+        self.nii_mask_max_label = 0
+        self.label_index = None
+        self.mask_colors = {}
+        self._mask_lut = None
+        self._mask_lut_key = None
+
+    def empty_copy(self):
+        """
+        Create a new file handler with the same loading options and no data.
+
+        Returns:
+            FileHandler: The new file handler
+        """
+        return FileHandler(
+            lazy=self.lazy, axis_layout_budget=self.axis_layout_budget, pyramid=self.pyramid, sparse_mask=self.sparse_mask,
+            volume_cache=self.volume_cache, decompression_threads=self.decompression_threads,
+        )
+
+    def start_pyramids(self):
+        """
+        Start building the downsampled levels of the loaded image and mask in background threads.
+        """
+        self.stop_pyramids()
+        if not self.pyramid:
+            return
+        if self.nii_data is not None:
+            self.data_pyramid = VolumePyramid(self.nii_data)
+            self.data_pyramid.start()
+        if self.nii_mask is not None:
+            self.mask_pyramid = VolumePyramid(self.nii_mask, is_mask=True)
+            self.mask_pyramid.start()
+
+    def stop_pyramids(self):
+        """
+        Stop building and drop the downsampled levels. The build threads are joined, so that the memory of
+        their levels is released with the pyramids.
+        """
+        pyramids = [pyramid for pyramid in (self.data_pyramid, self.mask_pyramid) if pyramid is not None]
+        for pyramid in pyramids:
+            pyramid.cancel()
+        for pyramid in pyramids:
+            pyramid.join()
+        self.data_pyramid = None
+        self.mask_pyramid = None
+
+    def resident_bytes(self):
+        """
+        Get the number of bytes held in RAM by the loaded volumes, their axis copies and pyramid levels.
+        Memory-mapped volumes are not counted. Pyramids count with all their levels from the start,
+        so that levels built in the background stay within a budget checked before they exist.
+
+        Returns:
+            int: The resident bytes
+        """
+        total = resident_nbytes(self.nii_data) + resident_nbytes(self.nii_mask)
+        for copies in (self.data_axis_copies, self.mask_axis_copies):
+            total += sum(copy.nbytes for copy in copies.values())
+        for pyramid in (self.data_pyramid, self.mask_pyramid):
+            if pyramid is not None:
+                total += pyramid.planned_nbytes
+        return total
+
+    def release_memory(self):
+        """
+        Drop the axis copies and pyramids and replace volumes read into RAM with memory maps of their
+        file or of their volume cache entry, where one exists. Slicing keeps working from disk.
+        """
+        self.stop_pyramids()
+        self.data_axis_copies = {}
+        self.mask_axis_copies = {}
+        if resident_nbytes(self.nii_data):
+            mapped = self.map_file(self.nii_path)
+            if mapped is not None:
+                self.nii_data = mapped if mapped.ndim == 4 else mapped[..., np.newaxis]
+        if isinstance(self.nii_mask, np.ndarray) and resident_nbytes(self.nii_mask):
+            mapped = self.map_file(self.nii_mask_path)
+            if mapped is not None:
+                # The file keeps its original labels type, reads are converted to the compact type
+                self.nii_mask = LazyVolume(mapped, dtype=self.nii_mask.dtype)
+
+    def map_file(self, path):
+        """
+        Memory-map the decoded data of a file: the file itself if it is uncompressed and unscaled,
+        otherwise its volume cache entry.
+
+        Args:
+            path (str): Path to the Nifti file
+
+        Returns:
+            np.memmap: The data, or None if it cannot be mapped
+        """
+        if path is None:
+            return None
+        nifti_img = load_nifti(path, mmap="r")
+        if not LazyVolume(nifti_img.dataobj).is_scaled and not str(path).endswith(".gz"):
+            return np.asanyarray(nifti_img.dataobj)
+        if self.volume_cache is not None:
+            return self.volume_cache.get(path)
+        return None
 
-    def load_nifti_file(self, path):
+    def unload(self):
+        """
+        Drop the loaded volumes and everything derived from them. The display state, such as the
+        current slices, windows and mask visibility, is kept.
+        """
+        self.stop_pyramids()
+        self.nii_data = None
+        self.nii_mask = None
+        self.data_axis_copies = {}
+        self.mask_axis_copies = {}
+
+    def restore_display_state(self, other):
+        """
+        Take over the display state of another file handler holding the same files, e.g. after reloading them.
+
+        Args:
+            other (FileHandler): The file handler to copy the state from
+        """
+        self.current_slice = dict(other.current_slice)
+        if other.current_modality_channel < len(self.window_levels):
+            self.current_modality_channel = other.current_modality_channel
+        if len(other.window_levels) == len(self.window_levels):
+            self.window_levels = other.window_levels
+        if len(other.show_mask) == len(self.show_mask):
+            self.show_mask = list(other.show_mask)
+        self.mask_colors = dict(other.mask_colors)
+
+    def load_nifti_file(self, path, progress_callback=None, is_cancelled=None):
         """
         Load a Nifti file from a given path and store the data in the class attribute `nii_data`.
 
         Args:
             path (str): Path to the Nifti file to load
+            progress_callback (callable, optional): Called as `progress_callback(data, loaded, total)` while decoding
+            is_cancelled (callable, optional): Polled while decoding, loading stops when it returns True
+
+        Raises:
+            LoadCancelledError: If `is_cancelled` returned True before the file was fully decoded
         """
-        nifti_img = nib.load(path)
-        self.nii_data = nifti_img.get_fdata()
+        if self.is_lazy_readable(path):
+            nifti_img = load_nifti(path, mmap="r", keep_file_open=True)
+            self.nii_data = LazyVolume(nifti_img.dataobj, add_channel_axis=True)
+        else:
+            nifti_img = load_nifti(path)
+            self.nii_data = self.read_native(nifti_img, progress_callback, is_cancelled)
+        self.nii_path = path
+        self.nii_affine = nifti_img.affine
+        self.nii_header = nifti_img.header.copy()
         self.current_slice = {"x": self.nii_data.shape[0] // 2, "y": self.nii_data.shape[1] // 2, "z": self.nii_data.shape[2] // 2}
         # If the data is 3D, add a channel dimension
         if len(self.nii_data.shape) == 3:
             self.nii_data = np.expand_dims(self.nii_data, axis=-1)
+        self.data_axis_copies = build_axis_copies(self.nii_data, self.axis_layout_budget)
+        self.compute_intensity_statistics()
+
+    def compute_intensity_statistics(self):
+        """
+        Compute the intensity statistics of every channel and reset their display windows.
+        Lazily read volumes are sampled instead of read completely.
+        """
+        max_slices = LAZY_STATS_SLICES if isinstance(self.nii_data, LazyVolume) else None
+        self.window_levels = [WindowLevel(stats) for stats in ChannelStatistics.compute_all(self.nii_data, max_slices)]
+
+    @timed("filehandler.apply_window")
+    def apply_window(self, slice_data, channel=0):
+        """
+        Map an image slice to uint8 display values with the window of its channel.
+
+        Args:
+            slice_data (np.ndarray): The image slice
+            channel (int, optional): The channel of the slice
+
+        Returns:
+            np.ndarray: The uint8 display slice
+        """
+        return self.window_levels[channel].apply(slice_data)
 
-    def load_nifti_mask(self, path):
+    def window_key(self, channel=0):
+        """
+        Get a hashable key describing the display window of a channel.
+
+        Args:
+            channel (int, optional): The channel
+
+        Returns:
+            tuple: The window width and level, or None if no image is loaded
+        """
+        if channel >= len(self.window_levels):
+            return None
+        return self.window_levels[channel].key
+
+    def load_nifti_mask(self, path, progress_callback=None, is_cancelled=None):
         """
         Load a Nifti mask file from a given path and store the data in the class attribute `nii_mask`.
 
         Args:
             path (str): Path to the Nifti mask file to load
+            progress_callback (callable, optional): Called as `progress_callback(data, loaded, total)` while decoding
+            is_cancelled (callable, optional): Polled while decoding, loading stops when it returns True
+
+        Raises:
+            LoadCancelledError: If `is_cancelled` returned True before the file was fully decoded
         """
-        nifti_mask_img = nib.load(path)
-        self.nii_mask = nifti_mask_img.get_fdata()
+        if self.is_lazy_readable(path):
+            nifti_mask_img = load_nifti(path, mmap="r", keep_file_open=True)
+            self.nii_mask = LazyVolume(nifti_mask_img.dataobj)
+        else:
+            nifti_mask_img = load_nifti(path)
+            self.nii_mask = self.read_native(nifti_mask_img, progress_callback, is_cancelled)
+        self.nii_mask_path = path
+        self.nii_mask_affine = nifti_mask_img.affine
+        self.nii_mask_header = nifti_mask_img.header.copy()
         self.find_mask_channels()
+        # The mask is laid out with what the image copies left of the budget
+        used_bytes = sum(copy.nbytes for copy in self.data_axis_copies.values())
+        self.mask_axis_copies = build_axis_copies(self.nii_mask, self.axis_layout_budget - used_bytes)
 
-    def get_slice(self, dimension, index, channel=0):
+    def read_native(self, nifti_img, progress_callback=None, is_cancelled=None):
+        """
+        Read the data of a Nifti image without promoting it to float64.
+        Unscaled data keeps its on-disk dtype, scaled data is read as float32.
+        Compressed files are inflated straight into the data array and scaled files are decoded in
+        slabs along the last spatial axis, so that progress can be reported and loading can be
+        cancelled. Both are memory-mapped from the volume cache if they were decoded before, otherwise
+        the decoded data is queued for `write_volume_cache` so that the load does not wait for the write.
+
+        Args:
+            nifti_img (nib.Nifti1Image): The image to read
+            progress_callback (callable, optional): Called as `progress_callback(data, loaded, total)` after each slab
+            is_cancelled (callable, optional): Polled before each slab, reading stops when it returns True
+
+        Returns:
+            np.ndarray: The image data
+
+        Raises:
+            LoadCancelledError: If `is_cancelled` returned True before the image was fully read
+        """
+        proxy = nifti_img.dataobj
+        is_scaled = LazyVolume(proxy).is_scaled
+        total = proxy.shape[2]
+        if not is_scaled and not str(nifti_img.get_filename()).endswith(".gz"):
+            # Uncompressed data is memory-mapped without decoding
+            data = np.asanyarray(proxy)
+            if progress_callback is not None:
+                progress_callback(data, total, total)
+            return data
+
+        path = nifti_img.get_filename()
+        if self.volume_cache is not None:
+            data = self.volume_cache.get(path)
+            if data is not None:
+                if progress_callback is not None:
+                    progress_callback(data, total, total)
+                return data
+
+        if str(path).endswith(".gz"):
+            data = self.read_gzip(nifti_img, progress_callback, is_cancelled)
+        else:
+            data = np.empty(proxy.shape, dtype=np.float32 if is_scaled else proxy.dtype, order="F")
+            for start, slab in iter_slabs(proxy):
+                if is_cancelled is not None and is_cancelled():
+                    raise LoadCancelledError()
+                stop = start + slab.shape[2]
+                data[:, :, start:stop] = slab
+                if progress_callback is not None:
+                    progress_callback(data, stop, total)
+        if self.volume_cache is not None:
+            self.pending_cache_entries.append((path, data))
+        return data
+
+    def write_volume_cache(self):
+        """
+        Write the volumes decoded by the last loads to the volume cache in a background thread.
+        Called once the loaded files are displayed, so that the first open of a study does not wait
+        for its decoded copy to be written. The thread is not a daemon, so that quitting finishes the entry.
+
+        Returns:
+            threading.Thread: The writing thread, or None if there is nothing to write
+        """
+        entries, self.pending_cache_entries = self.pending_cache_entries, []
+        if self.volume_cache is None or not entries:
+            return None
+
+        def write():
+            for path, data in entries:
+                try:
+                    self.volume_cache.put(path, data)
+                except OSError:
+                    # A full or read-only cache directory only costs the next open its decoding time
+                    pass
+
+        thread = threading.Thread(target=write, name="volume-cache-writer")
+        thread.start()
+        return thread
+
+    def read_gzip(self, nifti_img, progress_callback=None, is_cancelled=None):
+        """
+        Inflate the data of a compressed Nifti image directly into an array in file order, in parallel
+        if its gzip members record their size. Reading slabs through the array proxy instead would
+        inflate the file from its start for every slab. A single member file, the usual output of
+        scanners and other tools, has no recorded member sizes and is inflated sequentially on one
+        thread. No seek index is kept for it, only the volume cache avoids decoding it again.
+
+        Args:
+            nifti_img (nib.Nifti1Image): The image to read
+            progress_callback (callable, optional): Called as `progress_callback(data, loaded, total)` with
+                the number of slices along the last spatial axis that are decoded
+            is_cancelled (callable, optional): Polled while inflating, reading stops when it returns True
+
+        Returns:
+            np.ndarray: The image data, float32 if the image is scaled
+
+        Raises:
+            LoadCancelledError: If `is_cancelled` returned True before the image was fully read
+        """
+        proxy = nifti_img.dataobj
+        total = proxy.shape[2]
+        raw = np.empty(proxy.shape, dtype=proxy.dtype, order="F")
+
+        def report(written, size):
+            if progress_callback is not None:
+                progress_callback(raw, written * total // size if size else total, total)
+
+        # A flat byte view of the Fortran ordered array matches the byte order of the file
+        destination = raw.reshape(-1, order="F").view(np.uint8)
+        if not decompress_into(nifti_img.get_filename(), destination, proxy.offset, self.decompression_threads, report, is_cancelled):
+            raise LoadCancelledError()
+        if not raw.dtype.isnative:
+            raw = raw.astype(raw.dtype.newbyteorder("="))
+        if not LazyVolume(proxy).is_scaled:
+            return raw
+        data = np.empty(proxy.shape, dtype=np.float32, order="F")
+        slope, inter = np.float32(proxy.slope), np.float32(proxy.inter)
+        for start, slab in iter_slabs(raw):
+            data[:, :, start:start + slab.shape[2]] = slab * slope + inter
+        return data
+
+    def compact_mask(self, max_label):
+        """
+        Store the mask in the smallest unsigned integer type that holds all its labels.
+        Lazy masks are converted slice by slice when they are read.
+
+        Args:
+            max_label (int): The largest label in the mask
+        """
+        label_dtype = np.min_scalar_type(int(round(max_label)))
+        if isinstance(self.nii_mask, LazyVolume):
+            self.nii_mask.dtype = label_dtype
+        elif self.nii_mask.dtype != label_dtype:
+            if not np.issubdtype(self.nii_mask.dtype, np.integer):
+                self.nii_mask = np.rint(self.nii_mask)
+            self.nii_mask = self.nii_mask.astype(label_dtype)
+
+    def is_lazy_readable(self, path):
+        """
+        Check whether a file should be kept as an on-disk proxy instead of being read into memory.
+        Compressed files are only read lazily when `indexed_gzip` is available for random access.
+
+        Args:
+            path (str): Path to the Nifti file
+
+        Returns:
+            bool: True if the file is read lazily
+        """
+        if not self.lazy:
+            return False
+        if str(path).endswith(".gz"):
+            return importlib.util.find_spec("indexed_gzip") is not None
+        return True
+
+    @timed("filehandler.get_slice")
+    def get_slice(self, dimension, index, channel=0, level=0):
         """
         Get a slice of the Nifti data along a given dimension.
 
@@ -46,13 +460,26 @@ class FileHandler:
             dimension (str): Dimension along which to extract the slice. Can be "x", "y" or "z"
             index (int): Index of the slice to extract
             channel (int, optional): Channel of the data to extract
+            level (int, optional): Pyramid level to extract the slice from, falls back to the finest
+                available level. Each level halves the resolution.
 
         Returns:
             np.ndarray: Slice of the Nifti data
         """
         if self.nii_data is None:
             return None
-    
+
+        if level > 0 and self.data_pyramid is not None and dimension in AXIS_INDEX:
+            level, volume, level_index = self.data_pyramid.level_slice(level, dimension, index)
+            if level > 0 and index < self.nii_data.shape[AXIS_INDEX[dimension]]:
+                return take_plane(volume, AXIS_INDEX[dimension], level_index)[..., channel]
+
+        axis = AXIS_INDEX.get(dimension)
+        if axis in self.data_axis_copies:
+            if index < self.nii_data.shape[axis]:
+                return self.data_axis_copies[axis][channel, index]
+            return None
+
         if dimension == "x":
             if index < self.nii_data.shape[0]:
                 return self.nii_data[index, :, :, channel]
@@ -65,6 +492,33 @@ class FileHandler:
 
         return None
 
+    @timed("filehandler.get_plane")
+    def get_plane(self, dimension, index, level=0):
+        """
+        Get a slice of every channel of the Nifti data with a single extraction.
+
+        Args:
+            dimension (str): Dimension along which to extract the slice. Can be "x", "y" or "z"
+            index (int): Index of the slice to extract
+            level (int, optional): Pyramid level to extract the slice from, falls back to the finest
+                available level
+
+        Returns:
+            np.ndarray: The slices with the channels along the last axis, or None if the index is out of range
+        """
+        axis = AXIS_INDEX.get(dimension)
+        if self.nii_data is None or axis is None or index >= self.nii_data.shape[axis]:
+            return None
+
+        if level > 0 and self.data_pyramid is not None:
+            level, volume, level_index = self.data_pyramid.level_slice(level, dimension, index)
+            if level > 0:
+                return take_plane(volume, axis, level_index)
+
+        if axis in self.data_axis_copies:
+            return np.moveaxis(self.data_axis_copies[axis][:, index], 0, -1)
+        return np.asarray(take_plane(self.nii_data, axis, index))
+
     def get_current_slice_index(self, dimension):
         """
         Get the index of the current slice along a given dimension.
@@ -77,64 +531,142 @@ class FileHandler:
         """
         return self.current_slice.get(dimension, 1)
 
-    def get_mask_slice(self, dimension, index):
+    @timed("filehandler.get_mask_slice")
+    def get_mask_slice(self, dimension, index, level=0):
         """
         Get a slice of the Nifti mask data along a given dimension.
 
         Args:
             dimension (str): Dimension along which to extract the slice. Can be "x", "y" or "z"
             index (int): Index of the slice to extract
+            level (int, optional): Pyramid level to extract the slice from, falls back to the finest
+                available level
 
         Returns:
-            np.ndarray: Slice of the Nifti mask data with different colors for each channel
+            np.ndarray: uint8 RGBA slice of the Nifti mask data with different colors for each channel
         """
         if self.nii_mask is None:
             return None
 
-        if dimension == "x":
-            if index < self.nii_mask.shape[0]:
-                mask_slice = self.nii_mask[index, :, :]
-        elif dimension == "y":
-            if index < self.nii_mask.shape[1]:
-                mask_slice = self.nii_mask[:, index, :]
-        elif dimension == "z":
-            if index < self.nii_mask.shape[2]:
-                mask_slice = self.nii_mask[:, :, index]
+        axis = AXIS_INDEX.get(dimension)
+        if axis is None or not 0 <= index < self.nii_mask.shape[axis]:
+            return None
+        if level > 0 and self.mask_pyramid is not None:
+            level, volume, level_index = self.mask_pyramid.level_slice(level, dimension, index)
         else:
+            level = 0
+        if level > 0:
+            mask_slice = take_plane(volume, axis, level_index)
+        elif axis in self.mask_axis_copies:
+            mask_slice = self.mask_axis_copies[axis][index]
+        else:
+            mask_slice = take_plane(self.nii_mask, axis, index)
+        # Color the whole slice with a single gather from the lookup table
+        return np.take(self.get_mask_lut(), mask_slice, axis=0, mode="clip")
+
+    def get_mask_lut(self):
+        """
+        Get the RGBA lookup table mapping each mask label to its display color.
+        The table is only rebuilt when the mask visibility or the colors change.
+
+        Returns:
+            np.ndarray: uint8 array of shape (max_label + 1, 4), transparent for hidden labels
+        """
+        key = self.mask_state_key()
+        if self._mask_lut is None or self._mask_lut_key != key:
+            lut = np.zeros((self.nii_mask_max_label + 1, 4), dtype=np.uint8)
+            for i, label in enumerate(self.label_index.labels):
+                if self.show_mask[i]:
+                    lut[label] = np.round(np.array(self.get_mask_color(label)) * 255)
+            self._mask_lut = lut
+            self._mask_lut_key = key
+        return self._mask_lut
+
+    def mask_state_key(self):
+        """
+        Get a hashable key describing everything that affects the colors of mask slices.
+
+        Returns:
+            tuple: The mask visibility, colors and label range, or None if no mask is loaded
+        """
+        if self.nii_mask is None:
             return None
-        # Create a colored mask
-        # Set colors only for enabled channels
-        colored_mask = np.zeros((*mask_slice.shape, 4))
+        return (tuple(self.show_mask), tuple(self.mask_colors.items()), self.nii_mask_max_label)
 
-        for i in range(self.nii_mask_channels):
-            if self.show_mask[i]:
-                colored_mask[mask_slice == i] = self.get_mask_color(i)
+    def next_labeled_slice(self, dimension, index, step):
+        """
+        Find the next slice in a direction that contains a visible label.
+        If no label is visible, any label other than the background is considered.
 
-        return colored_mask
+        Args:
+            dimension (str): Dimension along which to search. Can be "x", "y" or "z"
+            index (int): Index of the current slice
+            step (int): 1 to search forward, -1 to search backward
+
+        Returns:
+            int: Index of the next slice with a label, or None if there is none
+        """
+        if self.label_index is None:
+            return None
+        positions = [i for i in range(1, self.nii_mask_channels) if self.show_mask[i]]
+        if not positions:
+            positions = list(range(1, self.nii_mask_channels))
+        return self.label_index.next_slice(dimension, index, step, positions)
+
+    def set_mask_color(self, label, color):
+        """
+        Override the color associated with a given mask label.
+
+        Args:
+            label (int): Label for which to set the color
+            color (tuple): RGBA color with components between 0 and 1
+        """
+        self.mask_colors[int(label)] = tuple(color)
 
     def find_mask_channels(self):
         """
-        Find the number of channels in the mask data.
+        Find the labels in the mask data and build the label index.
+        Channel `i` of the mask is the label `label_index.labels[i]`, channel 0 is the background.
         """
-        unique_values = np.unique(self.nii_mask.astype(int))
-        self.nii_mask_channels = len(unique_values)
+        if isinstance(self.nii_mask, LazyVolume):
+            # Stream over the proxy so the whole mask is never resident at once
+            min_label, max_label = np.inf, -np.inf
+            for _, slab in iter_slabs(self.nii_mask):
+                min_label = min(min_label, np.min(slab))
+                max_label = max(max_label, np.max(slab))
+        else:
+            min_label, max_label = np.min(self.nii_mask), np.max(self.nii_mask)
+        if np.rint(min_label) < 0:
+            raise ValueError("Mask labels must be non-negative")
+        self.compact_mask(max_label)
+        if self.sparse_mask:
+            self.nii_mask = SparseMask.from_volume(self.nii_mask)
+        self.nii_mask_max_label = int(np.rint(max_label))
+        self.label_index = LabelIndex.build(self.nii_mask, self.nii_mask_max_label)
+        self.nii_mask_channels = len(self.label_index.labels)
         self.show_mask = [False] * self.nii_mask_channels
 
-    def get_mask_color(self, channel):
+    def get_mask_color(self, label):
         """
-        Get the color associated with a given mask channel.
+        Get the color associated with a given mask label.
 
         Args:
-            channel (int): Channel for which to get the color
+            label (int): Label for which to get the color
 
         Returns:
-            tuple: ARGB color associated with the given channel
+            tuple: RGBA color associated with the given label
         """
-        if channel == 1:
+        if label in self.mask_colors:
+            return self.mask_colors[label]
+        if label == 0:
+            return (0, 0, 0, 0)
+        elif label == 1:
             return (0, 0, 1, 1)
-        elif channel == 2:
+        elif label == 2:
             return (1, 0, 0, 1)
-        elif channel == 3:
+        elif label == 3:
             return (1, 1, 0, 1)
         else:
-            return (0, 0, 0, 0)
+            # Spread further labels around the hue circle using the golden ratio
+            hue = (label * 0.618033988749895) % 1.0
+            return (*colorsys.hsv_to_rgb(hue, 0.85, 1.0), 1)
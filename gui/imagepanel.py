@@ -0,0 +1,197 @@
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QSizePolicy
+from PyQt5.QtCore import Qt, QRectF, QPointF
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter, QPen, QPolygonF
+from gui.instrumentation import timed
+
+OVERLAY_OPACITY = 0.4
+MARKER_RADIUS = 4
+POSITIVE_COLOR = QColor(0, 128, 0)
+NEGATIVE_COLOR = QColor(255, 0, 0)
+HUD_COLOR = QColor("yellow")
+TEXT_FONT_SIZE = 12
+
+def to_qimage(data):
+    """
+    Wrap a 2D uint8 or (height, width, 4) uint8 RGBA array as a QImage without copying the pixels.
+    Non contiguous arrays are copied once.
+
+    Args:
+        data (np.ndarray): The image data
+
+    Returns:
+        tuple: The QImage and the array it points into, which must be kept alive as long as the image
+    """
+    if data.ndim == 2 and data.dtype != np.uint8:
+        # Raw intensities, e.g. the preview of a file that is still loading, are stretched to 8 bit
+        low, high = float(data.min()), float(data.max())
+        data = ((data.astype(np.float32) - low) * (255 / max(high - low, 1e-12))).astype(np.uint8)
+    if not data.flags.c_contiguous:
+        data = np.ascontiguousarray(data)
+    height, width = data.shape[:2]
+    image_format = QImage.Format_Grayscale8 if data.ndim == 2 else QImage.Format_RGBA8888
+    image = QImage(data.ctypes.data, width, height, data.strides[0], image_format)
+    return image, data
+
+class ImagePanel(QWidget):
+    """
+    Slice panel that paints NumPy buffers directly with QPainter instead of going through matplotlib.
+    It shows the slice with the mask overlay, selection markers, the panel title and the slice label,
+    keeping the aspect ratio of the full resolution slice.
+
+    Args:
+        title (str): The title shown in the lower left corner
+    """
+    def __init__(self, title):
+        super().__init__()
+        self.title = title
+        self.full_shape = None
+        self.image = None
+        self.overlay = None
+        # Arrays the QImages point into
+        self.buffers = (None, None)
+        self.positive = ([], [])
+        self.negative = ([], [])
+        self.label = ""
+        # Performance overlay text
+        self.hud = ""
+        self.message = "No data"
+        self.message_color = QColor("white")
+        self.message_font_size = TEXT_FONT_SIZE
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    @timed("panel.set_slice")
+    def set_slice(self, slice_data, mask_data, positive, negative, label, full_shape=None):
+        """
+        Display a slice and repaint the panel.
+
+        Args:
+            slice_data (np.ndarray): 2D slice, uint8 display values or raw intensities
+            mask_data (np.ndarray): (height, width, 4) uint8 RGBA mask colors, or None
+            positive (tuple): Column and row sequences of the positive selection points
+            negative (tuple): Column and row sequences of the negative selection points
+            label (str): Text shown in the lower right corner
+            full_shape (tuple, optional): Full resolution shape of a downsampled slice
+        """
+        self.full_shape = tuple(full_shape) if full_shape is not None else slice_data.shape[:2]
+        self.image, image_buffer = to_qimage(slice_data)
+        self.overlay, overlay_buffer = to_qimage(mask_data) if mask_data is not None else (None, None)
+        self.buffers = (image_buffer, overlay_buffer)
+        self.positive = positive
+        self.negative = negative
+        self.label = label
+        self.message = None
+        self.update()
+
+    def clear(self, message="No Data", color="red", font_size=20):
+        """
+        Remove the slice and display a message instead.
+
+        Args:
+            message (str, optional): The message
+            color (str, optional): The color of the message
+            font_size (int, optional): The point size of the message
+        """
+        self.full_shape = None
+        self.image = self.overlay = None
+        self.buffers = (None, None)
+        self.label = ""
+        self.message = message
+        self.message_color = QColor(color)
+        self.message_font_size = font_size
+        self.update()
+
+    def set_hud(self, text):
+        """
+        Set the performance overlay text, repainting only if it changed.
+
+        Args:
+            text (str): The text, empty to hide the overlay
+        """
+        if text != self.hud:
+            self.hud = text
+            self.update()
+
+    def image_rect(self):
+        """
+        Get the widget area the slice is painted into, centered with the aspect ratio of the slice.
+
+        Returns:
+            QRectF: The image area, or None if no slice is displayed
+        """
+        if self.full_shape is None:
+            return None
+        height, width = self.full_shape
+        scale = min(self.width() / width, self.height() / height)
+        return QRectF((self.width() - width * scale) / 2, (self.height() - height * scale) / 2, width * scale, height * scale)
+
+    def map_to_pixel(self, position):
+        """
+        Map a widget position to full resolution slice pixel coordinates.
+
+        Args:
+            position (QPoint): The position in widget coordinates
+
+        Returns:
+            tuple: The column and row of the pixel, or None if the position is outside the slice
+        """
+        rect = self.image_rect()
+        if rect is None or not rect.contains(QPointF(position)):
+            return None
+        height, width = self.full_shape
+        column = int((position.x() - rect.left()) / rect.width() * width)
+        row = int((position.y() - rect.top()) / rect.height() * height)
+        return min(column, width - 1), min(row, height - 1)
+
+    @timed("panel.paint")
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        rect = self.image_rect()
+        if rect is not None:
+            painter.drawImage(rect, self.image)
+            if self.overlay is not None:
+                painter.setOpacity(OVERLAY_OPACITY)
+                painter.drawImage(rect, self.overlay)
+                painter.setOpacity(1.0)
+            self.paint_markers(painter, rect)
+
+        painter.setPen(QColor("white"))
+        font = QFont()
+        font.setPointSize(TEXT_FONT_SIZE)
+        painter.setFont(font)
+        margin_x, margin_y = self.width() * 0.05, self.height() * 0.05
+        text_rect = QRectF(margin_x, 0, self.width() - 2 * margin_x, self.height() - margin_y)
+        painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignBottom, self.title)
+        if self.label:
+            painter.drawText(text_rect, Qt.AlignRight | Qt.AlignBottom, self.label)
+        if self.hud:
+            painter.setPen(HUD_COLOR)
+            painter.drawText(QRectF(margin_x, margin_y, self.width() - 2 * margin_x, self.height()), Qt.AlignLeft | Qt.AlignTop, self.hud)
+        if self.message:
+            font.setPointSize(self.message_font_size)
+            painter.setFont(font)
+            painter.setPen(self.message_color)
+            painter.drawText(self.rect(), Qt.AlignCenter, self.message)
+        painter.end()
+
+    def paint_markers(self, painter, rect):
+        """
+        Paint the selection points at their slice coordinates, one draw call per point type.
+
+        Args:
+            painter (QPainter): The active painter
+            rect (QRectF): The area the slice is painted into
+        """
+        height, width = self.full_shape
+        scale_x, scale_y = rect.width() / width, rect.height() / height
+        painter.setRenderHint(QPainter.Antialiasing)
+        for points, color in ((self.positive, POSITIVE_COLOR), (self.negative, NEGATIVE_COLOR)):
+            if len(points[0]) == 0:
+                continue
+            # Round points as wide as the markers are drawn as filled circles
+            painter.setPen(QPen(color, 2 * MARKER_RADIUS, Qt.SolidLine, Qt.RoundCap))
+            painter.drawPoints(QPolygonF([
+                QPointF(rect.left() + x * scale_x, rect.top() + y * scale_y) for x, y in zip(*points)
+            ]))
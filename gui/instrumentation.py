@@ -0,0 +1,231 @@
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+# Spans kept for the trace export, the oldest are dropped first
+MAX_SPANS = 100000
+# Frames the on-screen statistics are computed over
+FRAME_WINDOW = 120
+FRAME_SPAN = "frame"
+
+class Span:
+    """
+    Context manager recording the duration of a block as a named span.
+
+    Args:
+        instrumentation (Instrumentation): The recorder of the span
+        name (str): The stage name
+    """
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record(self.name, self.start, time.perf_counter_ns() - self.start)
+        return False
+
+class NullSpan:
+    """
+    Context manager doing nothing, used while the instrumentation is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Instrumentation:
+    """
+    Recorder of per-stage timings of the display pipeline. While disabled, `span` and `timed` cost
+    a single attribute check. Spans are kept in a bounded buffer for the Chrome trace export, per-stage
+    counts and totals are kept for the whole recording, and the durations of the last frames are kept
+    for the on-screen FPS and latency percentiles.
+
+    Args:
+        enabled (bool, optional): Whether spans are recorded
+        max_spans (int, optional): Number of spans kept for the trace export
+    """
+    def __init__(self, enabled=False, max_spans=MAX_SPANS):
+        self.enabled = enabled
+        self.spans = collections.deque(maxlen=max_spans)
+        self.stages = {}
+        self.frames = collections.deque(maxlen=FRAME_WINDOW)
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+        # Spans are recorded from the loader, projection and export threads as well as the GUI thread
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        """
+        Get a context manager recording the duration of a block.
+
+        Args:
+            name (str): The stage name
+
+        Returns:
+            Span or NullSpan: The context manager
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, start, duration):
+        """
+        Record a span. Safe to call from worker threads.
+
+        Args:
+            name (str): The stage name
+            start (int): Start of the span from `time.perf_counter_ns`
+            duration (int): Duration of the span in nanoseconds
+        """
+        thread_id = threading.get_ident()
+        with self.lock:
+            if thread_id not in self.thread_names:
+                self.thread_names[thread_id] = threading.current_thread().name
+            self.spans.append((name, start, duration, thread_id))
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = [0, 0]
+            stage[0] += 1
+            stage[1] += duration
+            if name == FRAME_SPAN:
+                self.frames.append((start + duration, duration))
+
+    def reset(self):
+        """
+        Remove all recorded spans, stage statistics and frames.
+        """
+        with self.lock:
+            self.spans.clear()
+            self.stages = {}
+            self.frames.clear()
+
+    def stage_stats(self):
+        """
+        Get the statistics of every stage since the last reset.
+
+        Returns:
+            dict: Count, total and mean duration in milliseconds by stage name
+        """
+        with self.lock:
+            stages = [(name, tuple(stage)) for name, stage in self.stages.items()]
+        return {
+            name: {"count": count, "total_ms": total / 1e6, "mean_ms": total / count / 1e6}
+            for name, (count, total) in sorted(stages, key=lambda item: -item[1][1])
+        }
+
+    def frame_stats(self):
+        """
+        Get the frame rate and frame latency percentiles over the last frames.
+
+        Returns:
+            dict: Frames per second and p50/p99 frame latency in milliseconds, None without frames
+        """
+        with self.lock:
+            frames = list(self.frames)
+        if not frames:
+            return None
+        durations = sorted(duration for _, duration in frames)
+        count = len(durations)
+        elapsed = frames[-1][0] - frames[0][0]
+        return {
+            "fps": (count - 1) * 1e9 / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": durations[(count - 1) // 2] / 1e6,
+            "p99_ms": durations[min(count - 1, int(count * 0.99))] / 1e6,
+        }
+
+    def hud_text(self):
+        """
+        Get the text of the performance overlay.
+
+        Returns:
+            str: The frame statistics, empty without frames
+        """
+        stats = self.frame_stats()
+        if stats is None:
+            return ""
+        return f"{stats['fps']:.0f} FPS  p50 {stats['p50_ms']:.1f} ms  p99 {stats['p99_ms']:.1f} ms"
+
+    def chrome_trace(self):
+        """
+        Get the recorded spans in the Chrome trace event format, as loaded by chrome://tracing and Perfetto.
+
+        Returns:
+            dict: The trace
+        """
+        pid = os.getpid()
+        with self.lock:
+            thread_names = list(self.thread_names.items())
+            spans = list(self.spans)
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}}
+            for thread_id, thread_name in thread_names
+        ]
+        for name, start, duration, thread_id in spans:
+            events.append({
+                "name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": thread_id,
+                "ts": (start - self.origin) / 1e3, "dur": duration / 1e3,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"stages": self.stage_stats()}}
+
+    def export_chrome_trace(self, path):
+        """
+        Write the recorded spans as a Chrome trace JSON file.
+
+        Args:
+            path (str): Path to the JSON file
+        """
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+# Recorder shared by the file handler, controller and view
+INSTRUMENTATION = Instrumentation()
+
+def span(name):
+    """
+    Get a context manager recording the duration of a block with the shared recorder.
+
+    Args:
+        name (str): The stage name
+
+    Returns:
+        Span or NullSpan: The context manager
+    """
+    return INSTRUMENTATION.span(name)
+
+def timed(name):
+    """
+    Decorator recording the duration of every call of a function with the shared recorder.
+
+    Args:
+        name (str): The stage name
+
+    Returns:
+        callable: The decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                INSTRUMENTATION.record(name, start, time.perf_counter_ns() - start)
+        return wrapper
+    return decorator
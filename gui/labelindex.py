@@ -0,0 +1,143 @@
+import numpy as np
+from gui.volume import iter_slabs
+
+# Largest (number of label columns * axis length) counted directly without remapping the labels first
+MAX_DIRECT_PRESENCE_ENTRIES = 1 << 24
+DIMENSIONS = ["x", "y", "z"]
+
+class LabelIndex:
+    """
+    Label ids, voxel counts and per-axis slice ranges of an integer label mask.
+    The background label 0 is always at position 0.
+
+    Args:
+        labels (np.ndarray): Sorted label ids
+        counts (np.ndarray): Number of voxels of each label
+        presence (dict): Boolean array of shape (axis length, number of labels) per dimension,
+            True where a slice contains the label
+    """
+    def __init__(self, labels, counts, presence):
+        self.labels = labels
+        self.counts = counts
+        self.presence = presence
+        self.positions = {int(label): position for position, label in enumerate(labels)}
+
+    @classmethod
+    def build(cls, mask, max_label):
+        """
+        Build the index with bincount passes over slabs of the mask instead of sorting it.
+        Masks with few labels are indexed in a single pass, large label ranges are remapped
+        to consecutive positions after a first counting pass.
+
+        Args:
+            mask (np.ndarray or LazyVolume): 3D mask with non-negative integer labels
+            max_label (int): The largest label in the mask
+
+        Returns:
+            LabelIndex: The index of the mask
+        """
+        shape = mask.shape[:3]
+        remap = None
+        columns = max_label + 1
+        if columns * max(shape) > MAX_DIRECT_PRESENCE_ENTRIES:
+            totals = np.zeros(columns, dtype=np.int64)
+            for _, slab in iter_slabs(mask):
+                totals += np.bincount(slab.ravel(), minlength=columns)
+            remap = np.zeros(columns, dtype=np.int64)
+            present = np.flatnonzero(totals)
+            remap[present] = np.arange(len(present))
+            columns = len(present)
+
+        # Only the presence of each label is kept, the per-slab counts are reduced to it at once
+        presence = {dim: np.zeros((size, columns), dtype=bool) for dim, size in zip(DIMENSIONS, shape)}
+        totals = np.zeros(columns, dtype=np.int64)
+        x_offsets = (np.arange(shape[0], dtype=np.int64) * columns)[:, None, None]
+        y_offsets = (np.arange(shape[1], dtype=np.int64) * columns)[None, :, None]
+        for start, slab in iter_slabs(mask):
+            positions = remap[slab] if remap is not None else slab.astype(np.int64)
+            depth = slab.shape[2]
+            z_offsets = (np.arange(depth, dtype=np.int64) * columns)[None, None, :]
+            presence["x"] |= np.bincount((positions + x_offsets).ravel(), minlength=shape[0] * columns).reshape(shape[0], columns) > 0
+            presence["y"] |= np.bincount((positions + y_offsets).ravel(), minlength=shape[1] * columns).reshape(shape[1], columns) > 0
+            z_counts = np.bincount((positions + z_offsets).ravel(), minlength=depth * columns).reshape(depth, columns)
+            presence["z"][start:start + depth] = z_counts > 0
+            totals += z_counts.sum(axis=0)
+
+        if remap is not None:
+            labels = present
+        else:
+            labels = np.flatnonzero(totals)
+            totals = totals[labels]
+            presence = {dim: dim_presence[:, labels] for dim, dim_presence in presence.items()}
+        if len(labels) == 0 or labels[0] != 0:
+            # Keep the background at position 0 even if the mask has no background voxels
+            labels = np.concatenate([[0], labels])
+            totals = np.concatenate([[0], totals])
+            presence = {dim: np.pad(dim_presence, ((0, 0), (1, 0))) for dim, dim_presence in presence.items()}
+        return cls(labels, totals, presence)
+
+    def position(self, label):
+        """
+        Get the position of a label id in `labels`.
+
+        Args:
+            label (int): The label id
+
+        Returns:
+            int: The position of the label, or None if the mask does not contain it
+        """
+        return self.positions.get(int(label))
+
+    def slice_range(self, label, dimension):
+        """
+        Get the first and last slice along a dimension that contain a label.
+
+        Args:
+            label (int): The label id
+            dimension (str): The dimension ("x", "y" or "z")
+
+        Returns:
+            tuple: First and last slice index, or None if the label has no voxels
+        """
+        position = self.position(label)
+        if position is None:
+            return None
+        slices = np.flatnonzero(self.presence[dimension][:, position])
+        if len(slices) == 0:
+            return None
+        return int(slices[0]), int(slices[-1])
+
+    def bounding_box(self, label):
+        """
+        Get the bounding box of a label.
+
+        Args:
+            label (int): The label id
+
+        Returns:
+            dict: First and last slice index per dimension, or None if the label has no voxels
+        """
+        ranges = {dim: self.slice_range(label, dim) for dim in DIMENSIONS}
+        if any(value is None for value in ranges.values()):
+            return None
+        return ranges
+
+    def next_slice(self, dimension, index, step, positions):
+        """
+        Find the next slice in a direction that contains any of the given labels.
+
+        Args:
+            dimension (str): The dimension ("x", "y" or "z")
+            index (int): The current slice index
+            step (int): 1 to search forward, -1 to search backward
+            positions (list): Positions of the labels to look for
+
+        Returns:
+            int: Index of the next slice containing one of the labels, or None if there is none
+        """
+        has_label = self.presence[dimension][:, positions].any(axis=1)
+        if step > 0:
+            slices = np.flatnonzero(has_label[index + 1:])
+            return index + 1 + int(slices[0]) if len(slices) else None
+        slices = np.flatnonzero(has_label[:max(index, 0)])
+        return int(slices[-1]) if len(slices) else None
@@ -0,0 +1,74 @@
+from PyQt5.QtCore import QObject, pyqtSignal
+from gui.filehandler import LoadCancelledError
+
+class NiftiLoadWorker(QObject):
+    """
+    Worker that loads a Nifti file and an optional mask into a file handler outside the GUI thread.
+    The file handler must not be used by other threads until `finished` is emitted.
+
+    Args:
+        file_handler (FileHandler): The empty file handler to load the files into
+        nifti_path (str): Path to the Nifti file to load
+        mask_path (str, optional): Path to the Nifti mask file to load
+    """
+    progress = pyqtSignal(int)
+    preview_ready = pyqtSignal(int, object)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, file_handler, nifti_path, mask_path=None):
+        super().__init__()
+        self.file_handler = file_handler
+        self.nifti_path = nifti_path
+        self.mask_path = mask_path
+        self.is_cancelled = False
+        self.is_preview_sent = False
+
+    def cancel(self):
+        """
+        Request the loading to stop at the next slab boundary.
+        """
+        self.is_cancelled = True
+
+    def run(self):
+        """
+        Load the files and emit `finished`, `cancelled` or `failed`.
+        """
+        image_share = 80 if self.mask_path else 100
+        try:
+            self.file_handler.load_nifti_file(
+                self.nifti_path,
+                progress_callback=lambda data, loaded, total: self.on_image_progress(data, loaded, total, image_share),
+                is_cancelled=lambda: self.is_cancelled,
+            )
+            if self.mask_path:
+                self.file_handler.load_nifti_mask(
+                    self.mask_path,
+                    progress_callback=lambda data, loaded, total: self.progress.emit(image_share + (100 - image_share) * loaded // total),
+                    is_cancelled=lambda: self.is_cancelled,
+                )
+        except LoadCancelledError:
+            self.cancelled.emit()
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.progress.emit(100)
+            self.finished.emit(self.file_handler)
+
+    def on_image_progress(self, data, loaded, total, share):
+        """
+        Report the image decoding progress and emit the middle slice as soon as it is decoded.
+
+        Args:
+            data (np.ndarray): The partially decoded image data
+            loaded (int): Number of slices decoded along the last spatial axis
+            total (int): Total number of slices along the last spatial axis
+            share (int): Percentage of the total progress taken by the image
+        """
+        self.progress.emit(share * loaded // total)
+        middle = total // 2
+        if not self.is_preview_sent and loaded > middle:
+            self.is_preview_sent = True
+            preview = data[:, :, middle] if data.ndim == 3 else data[:, :, middle, 0]
+            self.preview_ready.emit(middle, preview.copy())
@@ -0,0 +1,281 @@
+import collections
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Extra subfield with the total size of the member, written by `compress_member`
+SIZE_SUBFIELD = b"SZ"
+# Extra subfield of BGZF files (bgzip) with the total size of the block minus one
+BGZF_SUBFIELD = b"BC"
+GZIP_MAGIC = b"\x1f\x8b\x08"
+FLAG_HCRC = 2
+FLAG_EXTRA = 4
+FLAG_NAME = 8
+FLAG_COMMENT = 16
+# Compressed bytes read at once and largest output of a single inflate call on the sequential path
+READ_CHUNK_BYTES = 1024 * 1024
+INFLATE_CHUNK_BYTES = 4 * 1024 * 1024
+DEFAULT_DECOMPRESSION_THREADS = os.cpu_count() or 1
+
+def compress_member(block, level=6):
+    """
+    Compress a block as a gzip member whose header records the size of the member, so that readers
+    can find the next member without inflating this one. Other gzip readers ignore the extra field.
+
+    Args:
+        block (bytes): The uncompressed data
+        level (int, optional): The compression level
+
+    Returns:
+        bytes: The gzip member
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(block) + compressor.flush()
+    extra = SIZE_SUBFIELD + struct.pack("<H", 4)
+    header_size = 10 + 2 + len(extra) + 4
+    member_size = header_size + len(deflated) + 8
+    header = GZIP_MAGIC + bytes([FLAG_EXTRA]) + b"\x00\x00\x00\x00\x00\xff" + struct.pack("<H", len(extra) + 4) + extra
+    trailer = struct.pack("<II", zlib.crc32(block), len(block) & 0xFFFFFFFF)
+    return header + struct.pack("<I", member_size) + deflated + trailer
+
+def extra_member_size(extra):
+    """
+    Get the member size recorded in the extra field of a gzip header.
+
+    Args:
+        extra (bytes): The extra field, without its length
+
+    Returns:
+        int: The total size of the member, or None if no subfield records it
+    """
+    position = 0
+    member_size = None
+    while position + 4 <= len(extra):
+        subfield = bytes(extra[position:position + 2])
+        length = struct.unpack_from("<H", extra, position + 2)[0]
+        if position + 4 + length > len(extra):
+            return None
+        if subfield == SIZE_SUBFIELD and length == 4:
+            member_size = struct.unpack_from("<I", extra, position + 4)[0]
+        elif subfield == BGZF_SUBFIELD and length == 2:
+            member_size = struct.unpack_from("<H", extra, position + 4)[0] + 1
+        position += 4 + length
+    return member_size
+
+def parse_member_header(buffer):
+    """
+    Parse the header of a gzip member.
+
+    Args:
+        buffer (bytes): The start of the member, at least up to the end of its header
+
+    Returns:
+        tuple: The size of the header and the total size of the member, None if the header does not record it
+
+    Raises:
+        OSError: If the buffer does not start with a gzip header
+    """
+    if bytes(buffer[:3]) != GZIP_MAGIC:
+        raise OSError("Not a gzip file")
+    flags = buffer[3]
+    position = 10
+    member_size = None
+    if flags & FLAG_EXTRA:
+        position = 12 + struct.unpack_from("<H", buffer, 10)[0]
+        member_size = extra_member_size(buffer[12:position])
+    for flag in (FLAG_NAME, FLAG_COMMENT):
+        if flags & flag:
+            end = bytes(buffer).find(b"\x00", position)
+            if end < 0:
+                raise OSError("Truncated gzip header")
+            position = end + 1
+    if flags & FLAG_HCRC:
+        position += 2
+    return position, member_size
+
+def records_member_sizes(path):
+    """
+    Check whether the first member of a gzip file records its size, so that `decompress_into`
+    inflates the file in parallel.
+
+    Args:
+        path (str): Path to the gzip file
+
+    Returns:
+        bool: True if the first member records its size
+    """
+    with open(path, "rb") as file:
+        head = file.read(12)
+        if len(head) < 12 or head[:3] != GZIP_MAGIC or not head[3] & FLAG_EXTRA:
+            return False
+        extra_length = struct.unpack_from("<H", head, 10)[0]
+        extra = file.read(extra_length)
+    return len(extra) == extra_length and extra_member_size(extra) is not None
+
+def inflate_member(member):
+    """
+    Inflate a complete gzip member and check its CRC and size. Runs in worker threads, zlib releases
+    the GIL while inflating.
+
+    Args:
+        member (bytes): The gzip member
+
+    Returns:
+        bytes: The uncompressed data
+
+    Raises:
+        OSError: If the member is corrupt
+    """
+    header_size, _ = parse_member_header(member)
+    view = memoryview(member)
+    data = zlib.decompress(view[header_size:-8], -zlib.MAX_WBITS)
+    crc, size = struct.unpack("<II", view[-8:])
+    if zlib.crc32(data) != crc or len(data) & 0xFFFFFFFF != size:
+        raise OSError("CRC check failed on a gzip member")
+    return data
+
+def copy_range(destination, start, position, data):
+    """
+    Copy the part of a decoded range of the stream that falls into the destination.
+
+    Args:
+        destination (memoryview): The destination bytes, holding the stream from `start` on
+        start (int): Stream position of the first destination byte
+        position (int): Stream position of the first byte of `data`
+        data (bytes): The decoded bytes
+
+    Returns:
+        int: Number of bytes copied
+    """
+    first = max(position, start)
+    last = min(position + len(data), start + len(destination))
+    if last <= first:
+        return 0
+    destination[first - start:last - start] = memoryview(data)[first - position:last - position]
+    return last - first
+
+def decompress_into(path, destination, start=0, threads=DEFAULT_DECOMPRESSION_THREADS, progress_callback=None, is_cancelled=None):
+    """
+    Decompress a range of a gzip file directly into a buffer.
+    Members whose header records their size, as written by `compress_member` or bgzip, are inflated
+    in parallel. Other files are inflated sequentially from the first member without such a header,
+    still without buffering more than a few megabytes. No seek index is built for them, so an ordinary
+    single member file, as written by most scanners and tools, is inflated on one core at every open.
+
+    Args:
+        path (str): Path to the gzip file
+        destination (np.ndarray or memoryview): Writable bytes receiving the stream from `start` on
+        start (int, optional): Stream position of the first byte to decompress
+        threads (int, optional): Number of inflating threads
+        progress_callback (callable, optional): Called as `progress_callback(written, total)` with the
+            destination bytes written so far, which always form a prefix of the destination
+        is_cancelled (callable, optional): Polled between members and chunks, decompression stops when it returns True
+
+    Returns:
+        bool: True if the destination was filled, False if it was cancelled
+
+    Raises:
+        OSError: If the file is corrupt or shorter than the requested range
+    """
+    destination = memoryview(destination).cast("B")
+    end = start + len(destination)
+    written = 0
+    position = 0
+    threads = max(1, threads)
+    with open(path, "rb") as file, ThreadPoolExecutor(threads) as pool:
+        # Members in flight with their stream positions, completed in order so that progress is a prefix
+        pending = collections.deque()
+
+        def complete_member():
+            nonlocal written
+            member_position, future = pending.popleft()
+            written += copy_range(destination, start, member_position, future.result())
+            if progress_callback is not None:
+                progress_callback(written, len(destination))
+
+        while position < end:
+            if is_cancelled is not None and is_cancelled():
+                return False
+            member_offset = file.tell()
+            head = file.read(12)
+            if not head:
+                break
+            if len(head) < 12 or head[:3] != GZIP_MAGIC or not head[3] & FLAG_EXTRA:
+                file.seek(member_offset)
+                break
+            extra_length = struct.unpack_from("<H", head, 10)[0]
+            extra = file.read(extra_length)
+            # The size is taken from the extra field alone, the rest of the header is parsed with the whole member
+            member_size = extra_member_size(extra) if len(extra) == extra_length else None
+            if member_size is None or member_size < 12 + extra_length + 8:
+                # Members without a recorded size are inflated sequentially from this one on
+                file.seek(member_offset)
+                break
+            head += extra
+            member = head + file.read(member_size - len(head))
+            if len(member) < member_size:
+                raise OSError("Truncated gzip file")
+            size = struct.unpack_from("<I", member, len(member) - 4)[0]
+            if position + size > start:
+                pending.append((position, pool.submit(inflate_member, member)))
+            position += size
+            if len(pending) >= 2 * threads:
+                complete_member()
+        while pending:
+            complete_member()
+        if position < end:
+            # The rest of the file has no member sizes and is inflated in a single stream
+            if not inflate_sequential(file, destination, start, position, written, progress_callback, is_cancelled):
+                return False
+    return True
+
+def inflate_sequential(file, destination, start, position, written, progress_callback=None, is_cancelled=None):
+    """
+    Inflate the gzip members from the current file offset on, one after the other.
+
+    Args:
+        file: The open gzip file, positioned at the start of a member
+        destination (memoryview): The destination bytes, holding the stream from `start` on
+        start (int): Stream position of the first destination byte
+        position (int): Stream position at the current file offset
+        written (int): Number of destination bytes already written
+        progress_callback (callable, optional): Called as `progress_callback(written, total)`
+        is_cancelled (callable, optional): Polled between chunks
+
+    Returns:
+        bool: True if the destination was filled, False if it was cancelled
+
+    Raises:
+        OSError: If the file is corrupt or shorter than the requested range
+    """
+    end = start + len(destination)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while position < end:
+        if is_cancelled is not None and is_cancelled():
+            return False
+        data = file.read(READ_CHUNK_BYTES)
+        if not data:
+            break
+        while True:
+            try:
+                output = decompressor.decompress(data, INFLATE_CHUNK_BYTES)
+            except zlib.error as e:
+                raise OSError(f"Corrupt gzip file: {e}")
+            written += copy_range(destination, start, position, output)
+            position += len(output)
+            if decompressor.eof:
+                # Concatenated members continue with a new gzip header, trailing padding is ignored
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                if not data.startswith(GZIP_MAGIC[:1]):
+                    data = b""
+            else:
+                data = decompressor.unconsumed_tail
+            if not data and len(output) < INFLATE_CHUNK_BYTES:
+                break
+        if progress_callback is not None:
+            progress_callback(written, len(destination))
+    if position < end:
+        raise OSError("Truncated gzip file")
+    return True
@@ -0,0 +1,215 @@
+import numpy as np
+from PyQt5.QtCore import QObject, pyqtSignal
+from gui.instrumentation import timed
+from gui.volume import SLAB_SIZE, iter_slabs
+
+PROJECTION_MODES = ["MIP", "MinIP", "Mean"]
+# Mode of the mask projection: the bitwise OR of one bit per label along each ray
+LABEL_MODE = "Labels"
+# Masks with larger labels map them to bits through a lookup table
+LABEL_WORD_BITS = 64
+# Rotated projections are computed on a volume whose largest spatial axis has at most this many voxels
+ROTATION_MAX_SIZE = 192
+
+def rotation_source(volume, pyramid=None, channel=None, max_size=ROTATION_MAX_SIZE):
+    """
+    Get a reduced resolution copy of a volume to compute rotated projections on: the finest pyramid
+    level that fits into `max_size`, otherwise a strided read of the coarsest level available.
+
+    Args:
+        volume (np.ndarray or LazyVolume): 3D volume or 4D volume with a trailing channel axis
+        pyramid (VolumePyramid, optional): The pyramid of the volume
+        channel (int, optional): The channel of a 4D volume
+        max_size (int, optional): Largest size of a spatial axis
+
+    Returns:
+        np.ndarray: 3D volume
+    """
+    levels = pyramid.levels[:pyramid.available_levels] if pyramid is not None else [volume]
+    source = next((level for level in levels if max(level.shape[:3]) <= max_size), None)
+    if source is None:
+        step = -(-max(levels[-1].shape[:3]) // max_size)
+        source = levels[-1][::step, ::step, ::step]
+    source = np.asarray(source)
+    return source[..., channel] if channel is not None else source
+
+def rotation_rays(shape, angle):
+    """
+    Get the voxels sampled by the rays of a projection rotated about the z axis.
+    Ray `u` at angle 0 runs along the x axis through y = u, rays that miss the volume are dropped.
+
+    Args:
+        shape (tuple): The spatial shape of the volume
+        angle (float): The rotation in degrees
+
+    Returns:
+        tuple: x and y indices of shape (rays, samples) and a boolean array marking samples inside the volume
+    """
+    theta = np.deg2rad(angle)
+    size = int(np.ceil(np.hypot(shape[0], shape[1])))
+    offsets = np.arange(size) - (size - 1) / 2
+    u, t = np.meshgrid(offsets, offsets, indexing="ij")
+    x = np.rint((shape[0] - 1) / 2 + t * np.cos(theta) - u * np.sin(theta)).astype(np.intp)
+    y = np.rint((shape[1] - 1) / 2 + t * np.sin(theta) + u * np.cos(theta)).astype(np.intp)
+    valid = (x >= 0) & (x < shape[0]) & (y >= 0) & (y < shape[1])
+    hits = np.flatnonzero(valid.any(axis=1))
+    rays = slice(hits[0], hits[-1] + 1)
+    return np.clip(x[rays], 0, shape[0] - 1), np.clip(y[rays], 0, shape[1] - 1), valid[rays]
+
+def reduce_samples(samples, mode, valid=None):
+    """
+    Reduce the samples of each ray.
+
+    Args:
+        samples (np.ndarray): Samples of shape (rays, samples, depth) or (rays, samples, depth, words) for labels
+        mode (str): One of `PROJECTION_MODES` or `LABEL_MODE`
+        valid (np.ndarray, optional): Boolean array of shape (rays, samples), False for samples to ignore
+
+    Returns:
+        np.ndarray: The projection of shape (rays, depth) or (rays, depth, words)
+    """
+    if valid is not None:
+        if mode != LABEL_MODE:
+            samples = samples.astype(np.float32)
+        samples[~valid] = {"MIP": -np.inf, "MinIP": np.inf, "Mean": 0, LABEL_MODE: 0}[mode]
+    if mode == LABEL_MODE:
+        return np.bitwise_or.reduce(samples, axis=1)
+    if mode == "MIP":
+        return samples.max(axis=1)
+    if mode == "MinIP":
+        return samples.min(axis=1)
+    count = samples.shape[1] if valid is None else np.maximum(valid.sum(axis=1), 1)[:, None]
+    return samples.sum(axis=1, dtype=np.float32) / count
+
+@timed("projection.project")
+def project(volume, mode, angle, channel=None, source=None, bit_lut=None, bit_dtype=np.uint64):
+    """
+    Project a volume along a horizontal direction rotated by `angle` degrees about the z axis, starting
+    along the x axis. The projection has one row per ray and one column per z slice like an x slice.
+    Multiples of 90 degrees are projected from the full resolution volume in slabs along z, other angles
+    from the reduced resolution `source`.
+
+    Args:
+        volume (np.ndarray or LazyVolume): 3D volume or 4D volume with a trailing channel axis
+        mode (str): One of `PROJECTION_MODES` or `LABEL_MODE`
+        angle (int): The rotation in degrees
+        channel (int, optional): The channel of a 4D volume
+        source (np.ndarray, optional): 3D reduced resolution volume for angles that are not multiples of 90
+        bit_lut (np.ndarray, optional): Lookup table from labels to bit words for `LABEL_MODE`
+        bit_dtype (np.dtype, optional): Word type of `LABEL_MODE` projections without a lookup table,
+            which set bit `label` of a single word
+
+    Returns:
+        np.ndarray: The projection
+    """
+    angle = angle % 360
+    if angle % 90 == 0:
+        # Rays run along x for 0 and 180 degrees and along y for 90 and 270 degrees
+        along_x = angle in (0, 180)
+        parts = []
+        for _, slab in iter_slabs(volume, key=(channel,) if channel is not None else ()):
+            if mode == LABEL_MODE:
+                slab = label_bits(slab, bit_lut, bit_dtype)
+            parts.append(reduce_samples(slab.swapaxes(0, 1) if along_x else slab, mode))
+        projection = np.concatenate(parts, axis=1)
+        return projection[::-1] if angle in (90, 180) else projection
+
+    x, y, valid = rotation_rays(source.shape, angle)
+    parts = []
+    for start in range(0, source.shape[2], SLAB_SIZE):
+        samples = source[x, y, start:start + SLAB_SIZE]
+        if mode == LABEL_MODE:
+            samples = label_bits(samples, bit_lut, bit_dtype)
+        parts.append(reduce_samples(samples, mode, valid))
+    return np.concatenate(parts, axis=1)
+
+def label_bit_lut(labels, max_label):
+    """
+    Get the mapping from label ids to bits, so that a mask projection can be recolored for any label
+    visibility without recomputing it. Labels below `LABEL_WORD_BITS` are their own bit index in a single
+    word, which is computed with a shift. Otherwise the label at position p in `labels` is bit p % 64
+    of word p // 64, looked up in a table.
+
+    Args:
+        labels (np.ndarray): The label ids, with the background at position 0
+        max_label (int): The largest label id
+
+    Returns:
+        tuple: The uint64 lookup table of shape (max_label + 1, words), or None for shifted bits,
+            and the word type
+    """
+    if max_label < LABEL_WORD_BITS:
+        return None, np.min_scalar_type(1 << max_label)
+    lut = np.zeros((max_label + 1, -(-len(labels) // LABEL_WORD_BITS)), dtype=np.uint64)
+    for position, label in enumerate(labels):
+        lut[label, position // LABEL_WORD_BITS] = np.uint64(1) << np.uint64(position % LABEL_WORD_BITS)
+    return lut, np.dtype(np.uint64)
+
+def label_bits(values, bit_lut=None, bit_dtype=np.uint64):
+    """
+    Map label ids to bit words.
+
+    Args:
+        values (np.ndarray): The label ids
+        bit_lut (np.ndarray, optional): Lookup table from `label_bit_lut`
+        bit_dtype (np.dtype, optional): Word type used without a lookup table
+
+    Returns:
+        np.ndarray: The words with a trailing word axis
+    """
+    if bit_lut is not None:
+        return bit_lut[values]
+    return np.left_shift(np.dtype(bit_dtype).type(1), values)[..., np.newaxis]
+
+def colorize_labels(bits, colors):
+    """
+    Color a label projection with the color of the first visible label along each ray.
+
+    Args:
+        bits (np.ndarray): Label projection of shape (rays, depth, words)
+        colors (np.ndarray): uint8 RGBA colors per bit, bit b of word w at index w * word bits + b,
+            transparent for hidden labels
+
+    Returns:
+        np.ndarray: uint8 RGBA image of shape (rays, depth, 4)
+    """
+    word_bits = bits.dtype.itemsize * 8
+    one = bits.dtype.type(1)
+    indices = np.zeros(bits.shape[:2], dtype=np.intp)
+    found = np.zeros(bits.shape[:2], dtype=bool)
+    for word in range(bits.shape[2]):
+        visible = np.flatnonzero(colors[word * word_bits:(word + 1) * word_bits, 3])
+        if len(visible) == 0:
+            continue
+        masked = bits[..., word] & np.bitwise_or.reduce(np.left_shift(one, visible.astype(bits.dtype)))
+        # Isolate the lowest set bit, its log2 is exact for powers of two
+        lowest = masked & (~masked + one)
+        first = ~found & (lowest != 0)
+        indices[first] = word * word_bits + np.log2(lowest[first].astype(np.float64)).astype(np.intp)
+        found |= first
+    return np.where(found[..., np.newaxis], colors[indices], np.uint8(0))
+
+class ProjectionWorker(QObject):
+    """
+    Worker that computes projections outside the GUI thread.
+
+    Args:
+        tasks (dict): Functions without arguments computing a projection, by cache key
+    """
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, tasks):
+        super().__init__()
+        self.tasks = tasks
+
+    def run(self):
+        """
+        Compute the projections and emit `finished` with the results by cache key, or `failed`.
+        """
+        try:
+            results = {key: task() for key, task in self.tasks.items()}
+        except Exception as e:
+            self.failed.emit(str(e))
+        else:
+            self.finished.emit(results)
@@ -0,0 +1,131 @@
+import threading
+import numpy as np
+from gui.volume import SLAB_SIZE, iter_slabs
+
+# Levels are added while every spatial axis of the next level keeps at least this many voxels
+PYRAMID_MIN_SIZE = 64
+# Seconds waited for the build thread to finish its slab when building is stopped
+PYRAMID_STOP_TIMEOUT = 5
+
+class VolumePyramid:
+    """
+    Downsampled copies of a volume, each level halving every spatial axis, built in a background thread.
+    Level 0 is the volume itself. Image levels average 2x2x2 blocks, mask levels keep every second voxel
+    so that labels are not mixed.
+
+    Args:
+        volume (np.ndarray or LazyVolume): 3D volume or 4D volume with a trailing channel axis
+        is_mask (bool, optional): Downsample by picking voxels instead of averaging
+        min_size (int, optional): Smallest size of a spatial axis in the coarsest level
+    """
+    def __init__(self, volume, is_mask=False, min_size=PYRAMID_MIN_SIZE):
+        self.levels = [volume]
+        self.is_mask = is_mask
+        self.min_size = min_size
+        self.is_cancelled = False
+        self.thread = None
+
+    @property
+    def available_levels(self):
+        """
+        Number of levels that can be sliced, including the full resolution.
+        """
+        return len(self.levels)
+
+    @property
+    def planned_nbytes(self):
+        """
+        Number of bytes of all downsampled levels once they are built, known before building starts.
+        """
+        shape = tuple(self.levels[0].shape)
+        total = 0
+        while min(shape[:3]) // 2 >= self.min_size:
+            shape = tuple(size // 2 for size in shape[:3]) + shape[3:]
+            total += int(np.prod(shape)) * np.dtype(self.levels[0].dtype).itemsize
+        return total
+
+    def start(self):
+        """
+        Start building the levels in a background thread.
+        """
+        self.thread = threading.Thread(target=self.build, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        """
+        Stop building levels after the slab in progress.
+        """
+        self.is_cancelled = True
+
+    def join(self, timeout=PYRAMID_STOP_TIMEOUT):
+        """
+        Wait for the build thread to finish, e.g. after `cancel`, so that it no longer holds or fills a level.
+
+        Args:
+            timeout (float, optional): Seconds to wait at most
+
+        Returns:
+            bool: True if the thread has finished or was never started
+        """
+        if self.thread is None:
+            return True
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def build(self):
+        """
+        Build the levels one after the other, each from the previous one.
+        """
+        while not self.is_cancelled and min(self.levels[-1].shape[:3]) // 2 >= self.min_size:
+            level = self.downsample(self.levels[-1])
+            if level is None:
+                return
+            # Appending publishes the complete level to readers in other threads
+            self.levels.append(level)
+
+    def downsample(self, volume):
+        """
+        Halve every spatial axis of a volume, reading it in slabs along the last spatial axis.
+        Block means of integer volumes are rounded to the nearest value.
+
+        Args:
+            volume (np.ndarray or LazyVolume): The volume to downsample
+
+        Returns:
+            np.ndarray: The downsampled volume, or None if building was cancelled
+        """
+        shape = [size // 2 for size in volume.shape[:3]]
+        result = np.empty(tuple(shape) + tuple(volume.shape[3:]), dtype=volume.dtype)
+        # Slabs of an even number of input slices, the odd last slice of the volume is dropped
+        for input_start, slab in iter_slabs(volume, 2 * SLAB_SIZE):
+            if self.is_cancelled:
+                return None
+            start = input_start // 2
+            stop = min(start + slab.shape[2] // 2, shape[2])
+            if stop <= start:
+                break
+            slab = slab[:shape[0] * 2, :shape[1] * 2, :(stop - start) * 2]
+            if self.is_mask:
+                result[:, :, start:stop] = slab[::2, ::2, ::2]
+            else:
+                blocks = slab.reshape((shape[0], 2, shape[1], 2, stop - start, 2) + slab.shape[3:])
+                means = blocks.mean(axis=(1, 3, 5), dtype=np.float32)
+                result[:, :, start:stop] = np.rint(means) if result.dtype.kind in "iu" else means
+        return result
+
+    def level_slice(self, level, dimension, index):
+        """
+        Get a full resolution slice index mapped onto a level.
+
+        Args:
+            level (int): The level, clamped to the available levels
+            dimension (str): Dimension of the slice. Can be "x", "y" or "z"
+            index (int): Slice index at full resolution
+
+        Returns:
+            tuple: The level used, its volume and the slice index in that level
+        """
+        level = max(0, min(level, self.available_levels - 1))
+        volume = self.levels[level]
+        size = volume.shape[{"x": 0, "y": 1, "z": 2}[dimension]]
+        return level, volume, min(index >> level, size - 1)
@@ -0,0 +1,83 @@
+from PyQt5.QtCore import QElapsedTimer, QTimer
+
+# Minimum interval between two rendered frames (about 60 frames per second)
+FRAME_INTERVAL_MS = 16
+# Renderable panels, "3d" is the projection panel
+DIMENSION_ORDER = ["x", "y", "z", "3d"]
+
+class RenderScheduler:
+    """
+    Coalesce slice render requests so that only the latest requested state is rendered,
+    at most once per display frame.
+
+    Args:
+        render_callback (callable): Called with the list of dimensions to render
+        frame_interval_ms (int, optional): Minimum interval between two rendered frames in milliseconds
+    """
+    def __init__(self, render_callback, frame_interval_ms=FRAME_INTERVAL_MS):
+        self.render_callback = render_callback
+        self.frame_interval_ms = frame_interval_ms
+        self.pending_dimensions = set()
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+        self.frame_clock = QElapsedTimer()
+        self.requests = 0
+        self.frames = 0
+        self.dropped_frames = 0
+        self.late_frames = 0
+        self.last_frame_ms = 0
+
+    def request(self, dimensions):
+        """
+        Request the given dimensions to be rendered with the next frame.
+
+        Args:
+            dimensions (list): The dimensions to render ("x", "y", "z" and/or "3d")
+
+        Raises:
+            ValueError: If a dimension is not one of `DIMENSION_ORDER`
+        """
+        unknown = set(dimensions) - set(DIMENSION_ORDER)
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {sorted(unknown)}")
+        self.requests += 1
+        if self.pending_dimensions:
+            # The previously requested state is superseded before it was rendered
+            self.dropped_frames += 1
+        self.pending_dimensions.update(dimensions)
+        if not self.timer.isActive():
+            elapsed = self.frame_clock.elapsed() if self.frame_clock.isValid() else self.frame_interval_ms
+            self.timer.start(max(0, self.frame_interval_ms - elapsed))
+
+    def flush(self):
+        """
+        Render the pending dimensions immediately.
+        """
+        self.timer.stop()
+        if not self.pending_dimensions:
+            return
+        dimensions = [dim for dim in DIMENSION_ORDER if dim in self.pending_dimensions]
+        self.pending_dimensions = set()
+        self.frame_clock.start()
+        self.render_callback(dimensions)
+        self.last_frame_ms = self.frame_clock.elapsed()
+        self.frames += 1
+        if self.last_frame_ms > self.frame_interval_ms:
+            self.late_frames += 1
+
+    def stats(self):
+        """
+        Get the render statistics.
+
+        Returns:
+            dict: Number of requests, rendered frames, dropped (coalesced) frames, frames that took
+                longer than the frame interval and the duration of the last frame in milliseconds
+        """
+        return {
+            "requests": self.requests,
+            "frames": self.frames,
+            "dropped_frames": self.dropped_frames,
+            "late_frames": self.late_frames,
+            "last_frame_ms": self.last_frame_ms,
+        }
@@ -0,0 +1,84 @@
+import numpy as np
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt
+
+class SelectionListModel(QAbstractListModel):
+    """
+    List model over a selection store. Rows are formatted only when the view asks for them and
+    points are added and removed with row notifications, so the view never rebuilds its items.
+
+    Args:
+        selections (SelectionStore): The selected points
+    """
+    def __init__(self, selections):
+        super().__init__()
+        self.selections = selections
+        # Number of rows reported while removal notifications are sent after the store was compacted
+        self.removing_row_count = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.selections) if self.removing_row_count is None else self.removing_row_count
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid() or index.row() >= len(self.selections):
+            return None
+        dimension, slice_index, x, y, point_type = self.selections[index.row()]
+        return f"slice: {dimension}, layer: {slice_index}, x: {x}, y: {y}, Type: {point_type}"
+
+    def add_point(self, dimension, slice_index, x, y, point_type):
+        """
+        Add a point to the store and append its row.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y" or "z")
+            slice_index (int): The slice index
+            x (int): The column of the point
+            y (int): The y coordinate of the point, from the bottom of the slice
+            point_type (str): "P" for positive or "N" for negative points
+        """
+        row = len(self.selections)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.selections.add(dimension, slice_index, x, y, point_type)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """
+        Remove points. The store is compacted once, then the view is notified once per run of
+        consecutive rows, from the last run to the first.
+
+        Args:
+            rows (list): The rows of the points to remove
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.intp))
+        if len(rows) == 0:
+            return
+        breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+        firsts = rows[np.concatenate([[0], breaks])]
+        lasts = rows[np.concatenate([breaks - 1, [len(rows) - 1]])]
+        self.removing_row_count = len(self.selections)
+        self.selections.remove(rows)
+        for first, last in zip(firsts[::-1], lasts[::-1]):
+            self.beginRemoveRows(QModelIndex(), int(first), int(last))
+            self.removing_row_count -= int(last - first) + 1
+            self.endRemoveRows()
+        self.removing_row_count = None
+
+    def clear(self):
+        """
+        Remove all points.
+        """
+        self.beginResetModel()
+        self.selections.clear()
+        self.endResetModel()
+
+    def set_selections(self, selections):
+        """
+        Show another selection store.
+
+        Args:
+            selections (SelectionStore): The selected points
+        """
+        self.beginResetModel()
+        self.selections = selections
+        self.endResetModel()
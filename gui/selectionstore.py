@@ -0,0 +1,105 @@
+import numpy as np
+
+DIMENSIONS = ["x", "y", "z"]
+POINT_TYPES = ["P", "N"]
+POINT_DTYPE = np.dtype([("dimension", np.uint8), ("slice", np.int32), ("x", np.int32), ("y", np.int32), ("type", np.uint8)])
+INITIAL_CAPACITY = 64
+
+class SelectionStore:
+    """
+    Selected points in insertion order, stored in a compact structured array and indexed by
+    (dimension, slice) so that the points of a displayed slice are found without scanning all points.
+    Points are read back as `(dimension, slice, x, y, type)` tuples.
+    """
+    def __init__(self):
+        self.points = np.empty(INITIAL_CAPACITY, dtype=POINT_DTYPE)
+        self.count = 0
+        # Rows of the points on each (dimension index, slice)
+        self.index = {}
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.count:
+            raise IndexError(row)
+        point = self.points[row]
+        return (DIMENSIONS[point["dimension"]], int(point["slice"]), int(point["x"]), int(point["y"]), POINT_TYPES[point["type"]])
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield self[row]
+
+    def add(self, dimension, slice_index, x, y, point_type):
+        """
+        Add a point, doubling the capacity of the array when it is full.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y" or "z")
+            slice_index (int): The slice index
+            x (int): The column of the point
+            y (int): The y coordinate of the point, from the bottom of the slice
+            point_type (str): "P" for positive or "N" for negative points
+
+        Returns:
+            int: The row of the point
+        """
+        if self.count == len(self.points):
+            self.points = np.resize(self.points, 2 * len(self.points))
+        row = self.count
+        dimension_index = DIMENSIONS.index(dimension)
+        self.points[row] = (dimension_index, slice_index, x, y, POINT_TYPES.index(point_type))
+        self.index.setdefault((dimension_index, slice_index), []).append(row)
+        self.count += 1
+        return row
+
+    def remove(self, rows):
+        """
+        Remove points with a single compaction of the array and rebuild the slice index.
+
+        Args:
+            rows (list or np.ndarray): The rows of the points to remove
+        """
+        keep = np.ones(self.count, dtype=bool)
+        keep[np.asarray(rows, dtype=np.intp)] = False
+        remaining = self.points[:self.count][keep]
+        self.points = np.empty(max(INITIAL_CAPACITY, len(remaining)), dtype=POINT_DTYPE)
+        self.points[:len(remaining)] = remaining
+        self.count = len(remaining)
+        self.rebuild_index()
+
+    def clear(self):
+        """
+        Remove all points.
+        """
+        self.points = np.empty(INITIAL_CAPACITY, dtype=POINT_DTYPE)
+        self.count = 0
+        self.index = {}
+
+    def rebuild_index(self):
+        """
+        Rebuild the slice index from the point array.
+        """
+        self.index = {}
+        points = self.points[:self.count]
+        keys = points["dimension"].astype(np.int64) << 32 | points["slice"].astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        unique_keys, starts = np.unique(keys[order], return_index=True)
+        for key, rows in zip(unique_keys, np.split(order, starts[1:])):
+            self.index[(int(key >> 32), int(key & 0xFFFFFFFF))] = rows.tolist()
+
+    def points_on(self, dimension, slice_index):
+        """
+        Get the points on a slice.
+
+        Args:
+            dimension (str): The dimension of the slice ("x", "y" or "z")
+            slice_index (int): The slice index
+
+        Returns:
+            np.ndarray: The points of the slice as a structured array
+        """
+        rows = self.index.get((DIMENSIONS.index(dimension), slice_index))
+        if not rows:
+            return self.points[:0]
+        return self.points[rows]
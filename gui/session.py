@@ -0,0 +1,137 @@
+import os
+from gui.selectionstore import SelectionStore
+from gui.slicecache import DEFAULT_CACHE_BYTES, SliceCache
+
+DEFAULT_SESSION_BUDGET_BYTES = 4 * 1024 * 1024 * 1024
+PROJECTION_CACHE_BYTES = 128 * 1024 * 1024
+
+class Study:
+    """
+    An open study: its file handler, selection points and display caches.
+
+    Args:
+        file_handler (FileHandler): The file handler holding the loaded files
+        slice_cache_bytes (int, optional): Budget of the slice cache of the study
+        projection_cache_bytes (int, optional): Budget of the projection cache of the study
+    """
+    def __init__(self, file_handler, slice_cache_bytes=DEFAULT_CACHE_BYTES, projection_cache_bytes=PROJECTION_CACHE_BYTES):
+        self.file_handler = file_handler
+        self.nifti_path = file_handler.nii_path
+        self.mask_path = file_handler.nii_mask_path
+        self.selections = SelectionStore()
+        self.slice_cache = SliceCache(slice_cache_bytes)
+        self.projection_cache = SliceCache(projection_cache_bytes)
+        self.last_used = 0
+
+    @property
+    def name(self):
+        """
+        The file name of the image.
+        """
+        return os.path.basename(self.nifti_path) if self.nifti_path else "Untitled"
+
+    @property
+    def is_loaded(self):
+        """
+        Whether the volumes of the study are loaded, False once it was evicted.
+        """
+        return self.file_handler.nii_data is not None
+
+    def resident_bytes(self):
+        """
+        Get the number of bytes the study holds in RAM.
+
+        Returns:
+            int: The bytes of the volumes, axis copies, pyramids and caches
+        """
+        return self.file_handler.resident_bytes() + self.slice_cache.current_bytes + self.projection_cache.current_bytes
+
+    def downgrade(self):
+        """
+        Release the memory that can be recreated without reading the files again: caches, axis copies
+        and pyramids, and volumes that can be memory-mapped instead.
+        """
+        self.slice_cache.clear()
+        self.projection_cache.clear()
+        self.file_handler.release_memory()
+
+    def evict(self):
+        """
+        Drop the volumes of the study. The selections and display state are kept for a reload.
+        """
+        self.slice_cache.clear()
+        self.projection_cache.clear()
+        self.file_handler.unload()
+
+class StudySession:
+    """
+    Studies kept open at the same time so that switching between them does not reload files.
+    When the studies hold more than the budget in RAM, the least recently used ones are first
+    downgraded and then evicted. The active study is never touched.
+
+    Args:
+        budget_bytes (int, optional): RAM budget of all studies
+    """
+    def __init__(self, budget_bytes=DEFAULT_SESSION_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.studies = []
+        self.active = None
+        self.clock = 0
+
+    def activate(self, study):
+        """
+        Make a study the active one, adding it to the session if it is new, and enforce the budget on the others.
+
+        Args:
+            study (Study): The study
+        """
+        if study not in self.studies:
+            self.studies.append(study)
+        self.clock += 1
+        study.last_used = self.clock
+        self.active = study
+        self.enforce_budget()
+
+    def find(self, nifti_path, mask_path=None):
+        """
+        Find an open study of the given files.
+
+        Args:
+            nifti_path (str): Path to the image
+            mask_path (str, optional): Path to the mask
+
+        Returns:
+            Study: The study, or None
+        """
+        for study in self.studies:
+            if study.nifti_path == nifti_path and study.mask_path == mask_path:
+                return study
+        return None
+
+    def resident_bytes(self):
+        """
+        Get the number of bytes all studies hold in RAM.
+
+        Returns:
+            int: The resident bytes
+        """
+        return sum(study.resident_bytes() for study in self.studies)
+
+    def enforce_budget(self):
+        """
+        Downgrade, then evict the least recently used inactive studies until the session fits the budget.
+
+        Returns:
+            list: The evicted studies
+        """
+        inactive = sorted((study for study in self.studies if study is not self.active and study.is_loaded), key=lambda study: study.last_used)
+        evicted = []
+        for release in (Study.downgrade, Study.evict):
+            for study in inactive:
+                if self.resident_bytes() <= self.budget_bytes:
+                    return evicted
+                if study.is_loaded and study.resident_bytes() > 0:
+                    release(study)
+                    if not study.is_loaded:
+                        evicted.append(study)
+        return evicted
@@ -0,0 +1,86 @@
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+class SliceCache:
+    """
+    Least-recently-used cache of ready-to-display slice buffers, bounded by a byte budget.
+
+    Args:
+        max_bytes (int, optional): Maximum number of bytes held by the cached buffers.
+    """
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Get the buffers cached for a key and mark them as most recently used.
+
+        Args:
+            key (tuple): The cache key
+
+        Returns:
+            tuple: The cached buffers, or None on a miss
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Store the buffers for a key, evicting least recently used entries to stay within the budget.
+
+        Args:
+            key (tuple): The cache key
+            value (tuple): The buffers to cache, None entries are allowed
+        """
+        size = sum(buffer.nbytes for buffer in value if buffer is not None)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+    def clear(self):
+        """
+        Remove all cached buffers and reset the counters.
+        """
+        self.entries.clear()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """
+        Get the cache usage statistics.
+
+        Returns:
+            dict: Number of entries, bytes used, byte budget, hits, misses and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
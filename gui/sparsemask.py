@@ -0,0 +1,187 @@
+import numpy as np
+from gui.volume import SLAB_SIZE, iter_slabs
+
+class SparseMask:
+    """
+    Run-length encoded label mask whose memory scales with the labeled region instead of the volume.
+    Each row of voxels along the y axis is stored as runs of equal non-zero labels, sorted by
+    (z, x, y), so that the runs of a z slice or of an x row are found from an offset table.
+    Indexing decodes the requested region into a dense array like `np.ndarray` or `LazyVolume`.
+
+    Args:
+        shape (tuple): The 3D shape of the mask
+        dtype (np.dtype): The type of the labels
+        row_offsets (np.ndarray): First run of every (z, x) row, of length z * x + 1
+        run_y (np.ndarray): y index of the first voxel of each run
+        run_lengths (np.ndarray): Number of voxels of each run
+        run_labels (np.ndarray): Label of each run
+    """
+    def __init__(self, shape, dtype, row_offsets, run_y, run_lengths, run_labels):
+        self.shape = tuple(shape)
+        self.ndim = 3
+        self.dtype = np.dtype(dtype)
+        self.row_offsets = row_offsets
+        self.run_y = run_y
+        self.run_lengths = run_lengths
+        self.run_labels = run_labels
+        # Row of each run, z * x_size + x
+        self.run_rows = np.repeat(np.arange(len(row_offsets) - 1, dtype=np.int32), np.diff(row_offsets))
+
+    @classmethod
+    def from_volume(cls, volume, dtype=None, slab_size=SLAB_SIZE, is_cancelled=None):
+        """
+        Encode a mask, reading it in slabs along the third axis so that it is never dense in memory
+        as a whole if it is read lazily.
+
+        Args:
+            volume (np.ndarray or LazyVolume): 3D mask with non-negative integer labels
+            dtype (np.dtype, optional): The type of the labels, defaults to the type of the volume
+            slab_size (int, optional): Number of z slices encoded at once
+            is_cancelled (callable, optional): Polled before each slab, encoding stops when it returns True
+
+        Returns:
+            SparseMask: The encoded mask, or None if it was cancelled
+        """
+        shape = tuple(volume.shape[:3])
+        dtype = np.dtype(dtype or volume.dtype)
+        parts = {"rows": [], "y": [], "lengths": [], "labels": []}
+        for start, slab in iter_slabs(volume, slab_size):
+            if is_cancelled is not None and is_cancelled():
+                return None
+            slab = slab.astype(dtype, copy=False)
+            # One line per (z, x) row with y as the fastest axis
+            lines = np.ascontiguousarray(slab.transpose(2, 0, 1)).reshape(-1, shape[1])
+            changes = np.ones(lines.shape, dtype=bool)
+            changes[:, 1:] = lines[:, 1:] != lines[:, :-1]
+            boundaries = np.flatnonzero(changes)
+            lengths = np.diff(boundaries, append=lines.size)
+            labels = lines.ravel()[boundaries]
+            labeled = labels != 0
+            boundaries = boundaries[labeled]
+            parts["rows"].append((boundaries // shape[1] + start * shape[0]).astype(np.int32))
+            parts["y"].append((boundaries % shape[1]).astype(np.int32))
+            parts["lengths"].append(lengths[labeled].astype(np.int32))
+            parts["labels"].append(labels[labeled])
+        rows = np.concatenate(parts["rows"]) if parts["rows"] else np.zeros(0, dtype=np.int32)
+        row_offsets = np.zeros(shape[0] * shape[2] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0] * shape[2]), out=row_offsets[1:])
+        return cls(
+            shape, dtype, row_offsets,
+            np.concatenate(parts["y"]) if parts["y"] else np.zeros(0, dtype=np.int32),
+            np.concatenate(parts["lengths"]) if parts["lengths"] else np.zeros(0, dtype=np.int32),
+            np.concatenate(parts["labels"]) if parts["labels"] else np.zeros(0, dtype=dtype),
+        )
+
+    @property
+    def nbytes(self):
+        """
+        Number of bytes used by the runs and the offset table.
+        """
+        return sum(array.nbytes for array in (self.row_offsets, self.run_rows, self.run_y, self.run_lengths, self.run_labels))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(part is Ellipsis for part in key):
+            position = key.index(Ellipsis)
+            key = key[:position] + (slice(None),) * (4 - len(key)) + key[position + 1:]
+        key = key + (slice(None),) * (3 - len(key))
+        is_index = [isinstance(part, (int, np.integer)) for part in key]
+        is_full = [isinstance(part, slice) and part == slice(None) for part in key]
+        # Planes of the slice panels are decoded from the runs they intersect only
+        if is_index[0] and is_full[1] and is_full[2]:
+            return self.x_plane(key[0])
+        if is_index[1] and is_full[0] and is_full[2]:
+            return self.y_plane(key[1])
+        z_indices = np.arange(self.shape[2])[key[2]]
+        dense = self.decode_z(np.atleast_1d(z_indices))
+        if np.ndim(z_indices) == 0:
+            return dense[key[0], key[1], 0]
+        return dense[key[0], key[1]]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    def run_indices(self, rows):
+        """
+        Get the indices of the runs of some rows.
+
+        Args:
+            rows (np.ndarray): Row indices, z * x_size + x
+
+        Returns:
+            np.ndarray: The run indices, grouped by row in the order of `rows`
+        """
+        starts = self.row_offsets[rows]
+        counts = self.row_offsets[rows + 1] - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+    def scatter_runs(self, out, runs, line_starts):
+        """
+        Write runs into a flat array.
+
+        Args:
+            out (np.ndarray): The flat destination
+            runs (np.ndarray): The run indices
+            line_starts (np.ndarray): Position in `out` of y = 0 on the line of each run
+        """
+        lengths = self.run_lengths[runs]
+        starts = line_starts + self.run_y[runs]
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        out[positions] = np.repeat(self.run_labels[runs], lengths)
+
+    def decode_z(self, z_indices):
+        """
+        Decode z slices.
+
+        Args:
+            z_indices (np.ndarray): The z indices
+
+        Returns:
+            np.ndarray: The slices of shape (x, y, len(z_indices))
+        """
+        size_x, size_y, _ = self.shape
+        out = np.zeros((len(z_indices), size_x, size_y), dtype=self.dtype)
+        rows = (np.asarray(z_indices, dtype=np.int64)[:, None] * size_x + np.arange(size_x)).ravel()
+        runs = self.run_indices(rows)
+        # Rows are decoded in the order of `rows`, which is also their order in `out`
+        line_starts = np.repeat(np.arange(len(rows), dtype=np.int64) * size_y, self.row_offsets[rows + 1] - self.row_offsets[rows])
+        self.scatter_runs(out.reshape(-1), runs, line_starts)
+        return out.transpose(1, 2, 0)
+
+    def x_plane(self, index):
+        """
+        Decode the plane at an x index.
+
+        Args:
+            index (int): The x index
+
+        Returns:
+            np.ndarray: The plane of shape (y, z)
+        """
+        size_x, size_y, size_z = self.shape
+        index = range(size_x)[index]
+        out = np.zeros((size_z, size_y), dtype=self.dtype)
+        rows = np.arange(size_z, dtype=np.int64) * size_x + index
+        runs = self.run_indices(rows)
+        self.scatter_runs(out.reshape(-1), runs, (self.run_rows[runs] // size_x).astype(np.int64) * size_y)
+        return out.T
+
+    def y_plane(self, index):
+        """
+        Decode the plane at a y index from the runs that cover it.
+
+        Args:
+            index (int): The y index
+
+        Returns:
+            np.ndarray: The plane of shape (x, z)
+        """
+        size_x, size_y, size_z = self.shape
+        index = range(size_y)[index]
+        out = np.zeros((size_x, size_z), dtype=self.dtype)
+        covered = (self.run_y <= index) & (index < self.run_y + self.run_lengths)
+        rows = self.run_rows[covered]
+        out[rows % size_x, rows // size_x] = self.run_labels[covered]
+        return out
@@ -0,0 +1,58 @@
+import gzip
+import struct
+import zlib
+import numpy as np
+from gui.pargzip import FLAG_EXTRA, FLAG_NAME, GZIP_MAGIC, compress_member, decompress_into
+
+def plain_member(block, flags=0, extra=b"", name=b""):
+    """
+    Build a gzip member without a size subfield.
+
+    Args:
+        block (bytes): The uncompressed data
+        flags (int, optional): Header flags, FLAG_EXTRA and FLAG_NAME add `extra` and `name`
+        extra (bytes, optional): The extra field
+        name (bytes, optional): The file name, without its terminator
+
+    Returns:
+        bytes: The gzip member
+    """
+    header = GZIP_MAGIC + bytes([flags]) + b"\x00\x00\x00\x00\x00\xff"
+    if flags & FLAG_EXTRA:
+        header += struct.pack("<H", len(extra)) + extra
+    if flags & FLAG_NAME:
+        header += name + b"\x00"
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(block) + compressor.flush()
+    return header + deflated + struct.pack("<II", zlib.crc32(block), len(block))
+
+def check_roundtrip(tmp_path, members, blocks, start=0):
+    path = tmp_path / "volume.gz"
+    path.write_bytes(b"".join(members))
+    expected = b"".join(blocks)
+    assert gzip.decompress(path.read_bytes()) == expected
+    destination = np.zeros(len(expected) - start, dtype=np.uint8)
+    assert decompress_into(str(path), destination, start, threads=2)
+    assert destination.tobytes() == expected[start:]
+
+def blocks_of(count, size=50000):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 8, size, dtype=np.uint8).tobytes() for _ in range(count)]
+
+def test_extra_and_name_without_size(tmp_path):
+    blocks = blocks_of(1)
+    check_roundtrip(tmp_path, [plain_member(blocks[0], FLAG_EXTRA | FLAG_NAME, b"AB\x02\x00xy", b"volume.nii")], blocks)
+
+def test_extra_without_size(tmp_path):
+    blocks = blocks_of(2)
+    members = [plain_member(block, FLAG_EXTRA, b"AB\x00\x00") for block in blocks]
+    check_roundtrip(tmp_path, members, blocks)
+
+def test_mixed_sized_and_plain_members(tmp_path):
+    blocks = blocks_of(5)
+    members = [
+        compress_member(blocks[0]), compress_member(blocks[1]), plain_member(blocks[2], FLAG_NAME, name=b"part"),
+        compress_member(blocks[3]), plain_member(blocks[4]),
+    ]
+    check_roundtrip(tmp_path, members, blocks)
+    check_roundtrip(tmp_path, members, blocks, start=70000)
@@ -1,12 +1,15 @@
 import sys
 from PyQt5.QtWidgets import (
-    QLabel, QMainWindow, QWidget, QVBoxLayout, QSplitter, QMessageBox, QPushButton, QHBoxLayout, QAction, QCheckBox, QSlider, QListWidget
+    QLabel, QMainWindow, QWidget, QVBoxLayout, QSplitter, QMessageBox, QPushButton, QHBoxLayout, QAction, QCheckBox, QSlider, QListView,
+    QProgressBar, QAbstractItemView
 )
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPalette, QColor
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QPalette, QColor, QKeySequence
+import numpy as np
 from gui.guistyles import LIGHT_MODE_STYLES, DARK_MODE_STYLES
+from gui.imagepanel import ImagePanel
+from gui.instrumentation import span, timed
+from gui.selectionstore import POINT_TYPES
 
 # Constants
 WINDOW_TITLE = "Medical Segmentation"
@@ -15,6 +18,10 @@ WINDOW_HEIGHT = 600
 MAIN_SPLITTER_SIZES = [400, 400, 200]
 LEFT_SPLITTER_SIZES = [300, 300]
 RIGHT_SPLITTER_SIZES = [300, 300]
+# Slice panel implementations selectable at startup
+PANEL_BACKENDS = ["matplotlib", "qimage"]
+# Panel attributes and titles, in creation order
+PANEL_TITLES = [("panel1", "X-Slice"), ("panel4", "Z-Slice"), ("panel2", "Y-Slice"), ("panel3", "3D View")]
 
 class GuiView(QMainWindow):
     """
@@ -22,14 +29,30 @@ class GuiView(QMainWindow):
     Args:
         QMainWindow (QWidget): The main window of the application
     """
-    def __init__(self):
+    # Emitted when the deferred panels replaced their placeholders
+    panels_created = pyqtSignal()
+
+    def __init__(self, panel_backend="matplotlib", defer_panels=False):
         """
         Initialize the main window and its components.
+
+        Args:
+            panel_backend (str, optional): The slice panel implementation, one of `PANEL_BACKENDS`.
+                "qimage" paints the slices with QPainter instead of matplotlib.
+            defer_panels (bool, optional): Start with empty placeholder panels, so that the window can be shown
+                before matplotlib is imported, and create the matplotlib panels with `create_deferred_panels`.
         """
         super().__init__()
+        if panel_backend not in PANEL_BACKENDS:
+            raise ValueError(f"Unknown panel backend: {panel_backend}")
+        self.panel_backend = panel_backend
+        self.is_panels_deferred = defer_panels and panel_backend == "matplotlib"
         self.setWindowTitle(WINDOW_TITLE)
         self.setGeometry(100, 100, WINDOW_WIDTH, WINDOW_HEIGHT)
-
+        # Persistent image, overlay, marker and label artists per panel
+        self.panel_artists = {}
+        # Performance overlay text of the slice panels
+        self.hud_text = ""
 
         # Create the menu bar
         self.menu_bar = self.menuBar()
@@ -39,6 +62,11 @@ class GuiView(QMainWindow):
         self.modality_menu.setEnabled(False)
         self.mask_menu = self.menu_bar.addMenu("Mask")
         self.mask_menu.setEnabled(False)
+        self.window_menu = self.menu_bar.addMenu("Window")
+        self.window_menu.setEnabled(False)
+        self.projection_menu = self.menu_bar.addMenu("3D View")
+        self.projection_menu.setEnabled(False)
+        self.studies_menu = self.menu_bar.addMenu("Studies")
 
         # File menu actions
         self.load_action = QAction("Load", self)
@@ -52,6 +80,13 @@ class GuiView(QMainWindow):
         # Settings menu actions
         self.dark_mode_action = QAction("Dark Mode", self, checkable=True)
         self.settings_menu.addAction(self.dark_mode_action)
+        self.settings_menu.addSeparator()
+        self.record_timings_action = QAction("Record Timings", self, checkable=True)
+        self.hud_action = QAction("Performance HUD", self, checkable=True)
+        self.export_trace_action = QAction("Export Trace...", self)
+        self.settings_menu.addAction(self.record_timings_action)
+        self.settings_menu.addAction(self.hud_action)
+        self.settings_menu.addAction(self.export_trace_action)
 
         # Central widget
         self.central_widget = QWidget()
@@ -69,11 +104,9 @@ class GuiView(QMainWindow):
         self.left_splitter = QSplitter(Qt.Vertical)
         self.main_splitter.addWidget(self.left_splitter)
 
-        # Panels with matplotlib
-        self.panel1 = self.create_plot_panel("X-Slice")
-        self.panel4 = self.create_plot_panel("Z-Slice")
-        self.panel2 = self.create_plot_panel("Y-Slice")
-        self.panel3 = self.create_plot_panel("3D View")
+        # Panels with matplotlib or QPainter
+        for name, title in PANEL_TITLES:
+            setattr(self, name, self.create_panel(title))
 
 
         self.side_options = QWidget()
@@ -88,6 +121,10 @@ class GuiView(QMainWindow):
         self.side_options.layout().addWidget(self.checkbox_selection_mode)
         self.checkbox_selection_mode.setChecked(False)
 
+        self.checkbox_skip_empty = QCheckBox("Skip slices without mask")
+        self.side_options.layout().addWidget(self.checkbox_skip_empty)
+        self.checkbox_skip_empty.setChecked(False)
+
         self.reset_layers_button = QPushButton("Reset Layers")
         self.side_options.layout().addWidget(self.reset_layers_button)
 
@@ -128,8 +165,16 @@ class GuiView(QMainWindow):
         self.reset_selection_button = QPushButton("Reset Selection")
         self.side_options_layout.addWidget(self.reset_selection_button)
 
-        # Create the list view
-        self.list_view = QListWidget()
+        # Create the list view with rows of the same height, laid out in batches between events
+        # instead of all at once after every inserted row
+        self.list_view = QListView()
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setLayoutMode(QListView.Batched)
+        self.list_view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.delete_selection_action = QAction("Delete", self.list_view)
+        self.delete_selection_action.setShortcut(QKeySequence.Delete)
+        self.delete_selection_action.setShortcutContext(Qt.WidgetShortcut)
+        self.list_view.addAction(self.delete_selection_action)
         self.side_options_layout.addWidget(self.list_view)
 
         self.side_options_layout.addStretch()
@@ -147,6 +192,56 @@ class GuiView(QMainWindow):
         self.left_splitter.setSizes(LEFT_SPLITTER_SIZES)
         self.right_splitter.setSizes(RIGHT_SPLITTER_SIZES)
 
+        # Loading progress in the status bar
+        self.load_progress_bar = QProgressBar()
+        self.load_progress_bar.setRange(0, 100)
+        self.load_progress_bar.setMaximumWidth(200)
+        self.cancel_load_button = QPushButton("Cancel")
+        self.statusBar().addPermanentWidget(self.load_progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_load_button)
+        self.hide_load_progress()
+
+        # Saving progress in the status bar, separate so that loading and saving can be cancelled independently
+        self.save_progress_bar = QProgressBar()
+        self.save_progress_bar.setRange(0, 100)
+        self.save_progress_bar.setMaximumWidth(200)
+        self.cancel_save_button = QPushButton("Cancel Save")
+        self.statusBar().addPermanentWidget(self.save_progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_save_button)
+        self.hide_save_progress()
+
+    def create_panel(self, title):
+        """
+        Create a panel with the configured panel backend.
+
+        Args:
+            title (str): The title of the panel.
+
+        Returns:
+            FigureCanvas or ImagePanel: The panel.
+        """
+        if self.panel_backend == "qimage" or self.is_panels_deferred:
+            # Empty image panels look the same as empty plot panels and serve as placeholders
+            return ImagePanel(title)
+        return self.create_plot_panel(title)
+
+    def create_deferred_panels(self):
+        """
+        Replace the placeholder panels by matplotlib panels, keeping their place and size in the splitters.
+        Meant to be called once the window is shown.
+        """
+        if not self.is_panels_deferred:
+            return
+        self.is_panels_deferred = False
+        for name, title in PANEL_TITLES:
+            placeholder = getattr(self, name)
+            panel = self.create_plot_panel(title)
+            splitter = placeholder.parentWidget()
+            splitter.replaceWidget(splitter.indexOf(placeholder), panel)
+            placeholder.deleteLater()
+            setattr(self, name, panel)
+        self.panels_created.emit()
+
     def create_plot_panel(self, title): #DO NOT TOUCH
         """
         Create a panel with a matplotlib plot.
@@ -157,61 +252,246 @@ class GuiView(QMainWindow):
         Returns:
             FigureCanvas: The panel with the plot.
         """
-        canvas = FigureCanvas(plt.figure())
+        # matplotlib is imported with the first plot panel, so that QImage panels start without it.
+        # The figure is not registered with pyplot, whose global state the panels do not need.
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+        from matplotlib.figure import Figure
+        canvas = FigureCanvas(Figure())
         canvas.figure.text(0.05, 0.05, title, color='white', fontsize=12, ha='left', va='bottom')
         canvas.figure.patch.set_facecolor('black')
         canvas.figure.text(0.5,0.5, "No data", color='white', fontsize=12, ha='center', va='center')
         return canvas
 
-    def update_slice(self, panel, slice_data, slice_index, mask_data=None, selection_list=None):
+    @timed("view.update_slice")
+    def update_slice(self, panel, slice_data, slice_index, mask_data=None, selections=None, full_shape=None, label=None):
         """
         Update the slice data displayed in a panel.
+        The panel artists are created once per slice shape and afterwards only their data is updated
+        and blitted onto the cached panel background.
 
         Args:
-            panel (FigureCanvas): The panel to update.
+            panel (FigureCanvas or ImagePanel): The panel to update.
             slice_data (np.ndarray): The slice data to display.
             slice_index (int): The slice index.
             mask_data (np.ndarray, optional): The mask data to overlay. Defaults to None.
-            selection_list (list, optional): The list of selected points. Defaults to None.
+            selections (SelectionStore, optional): The selected points. Defaults to None.
+            full_shape (tuple, optional): The full resolution shape of the slice when `slice_data` and
+                `mask_data` are downsampled. Defaults to the shape of `slice_data`.
+            label (str, optional): The text shown in the lower right corner. Defaults to the slice index.
+        """
+        # Display "No Data" message if slice_data is None
+        if slice_data is None:
+            self.clear_panel(panel)
+            return
+
+        shape = tuple(full_shape) if full_shape is not None else slice_data.shape
+        positive, negative = self.visible_points(panel, slice_index, selections, shape[0])
+        if label is None:
+            label = f"Slice: {slice_index}"
+        if isinstance(panel, ImagePanel):
+            panel.set_slice(slice_data, mask_data, positive, negative, label, shape)
+            return
+
+        artists = self.panel_artists.get(panel)
+        if artists is None or artists["shape"] != shape:
+            artists = self.create_panel_artists(panel, shape)
+
+        with span("view.imshow_set_data"):
+            artists["image"].set_data(slice_data)
+            if slice_data.dtype == np.uint8:
+                # Display slices are already windowed, no need to rescan them
+                artists["image"].set_clim(0, 255)
+            else:
+                artists["image"].set_clim(slice_data.min(), slice_data.max())
+
+            # Overlay the mask, if provided
+            if mask_data is not None:
+                artists["overlay"].set_data(mask_data)
+            artists["overlay"].set_visible(mask_data is not None)
+
+        # Overlay the selected points, if any
+        artists["positive"].set_data(*positive)
+        artists["negative"].set_data(*negative)
+
+        artists["label"].set_text(label)
+        self.blit_panel(panel)
+
+    def visible_points(self, panel, slice_index, selections, height):
+        """
+        Get the selected points on the slice displayed in a panel in display coordinates.
+
+        Args:
+            panel (FigureCanvas or ImagePanel): The panel.
+            slice_index (int): The slice index.
+            selections (SelectionStore): The selected points, or None.
+            height (int): The height of the slice.
+
+        Returns:
+            tuple: Column and row arrays of the positive points and of the negative points
+        """
+        dimension = {self.panel1: "x", self.panel2: "y", self.panel4: "z"}.get(panel)
+        if selections is None or dimension is None:
+            return ([], []), ([], [])
+        points = selections.points_on(dimension, slice_index)
+        is_positive = points["type"] == POINT_TYPES.index("P")
+        positive = (points["x"][is_positive], height - points["y"][is_positive])
+        negative = (points["x"][~is_positive], height - points["y"][~is_positive])
+        return positive, negative
+
+    def create_panel_artists(self, panel, shape):
+        """
+        Create the persistent artists of a panel for slices of a given shape.
+
+        Args:
+            panel (FigureCanvas): The panel to create the artists for.
+            shape (tuple): The (height, width) of the slices displayed in the panel.
+
+        Returns:
+            dict: The artists of the panel.
         """
         canvas = panel
+        if panel not in self.panel_artists:
+            canvas.mpl_connect("draw_event", lambda event, panel=panel: self.on_panel_draw(panel))
+
         # Clear panel text
         canvas.figure.texts = [canvas.figure.texts[0]]
-        panel.figure.text(0.95, 0.05, f"Slice: {slice_index}", color="white", fontsize=12, ha='right', va='bottom')
-
         ax = canvas.figure.gca()
         ax.clear()
 
-        # Display the slice data if it is not None
-        if slice_data is not None:
-            # Set the extent to match the pixel dimensions of the slice
-            height, width = slice_data.shape
-            extent = (0, width, height, 0)
-            # Display the slice
-            ax.imshow(slice_data, cmap="gray", aspect='equal', extent=extent)
+        # Set the extent to match the pixel dimensions of the slice
+        height, width = shape
+        extent = (0, width, height, 0)
+        artists = {
+            "shape": shape,
+            "background": None,
+            "image": ax.imshow(np.zeros(shape), cmap="gray", aspect='equal', extent=extent, animated=True),
+            "overlay": ax.imshow(np.zeros((height, width, 4), dtype=np.uint8), alpha=0.4, aspect='equal', extent=extent, animated=True),
+            "positive": ax.plot([], [], 'go', animated=True)[0],
+            "negative": ax.plot([], [], 'ro', animated=True)[0],
+            "label": canvas.figure.text(0.95, 0.05, "", color="white", fontsize=12, ha='right', va='bottom', animated=True),
+            "hud": canvas.figure.text(0.05, 0.95, self.hud_text, color="yellow", fontsize=10, ha='left', va='top', animated=True),
+        }
+        ax.set_xlim(0, width)
+        ax.set_ylim(height, 0)
+        ax.axis("off")
+        self.panel_artists[panel] = artists
+        return artists
 
-            # Overlay the mask, if provided
-            if mask_data is not None:
-                ax.imshow(mask_data, alpha=0.4, aspect='equal', extent=extent)
-
-            # Overlay the selected points, if any
-            if selection_list is not None:
-                for dimension, slice_number, x, y, t, in selection_list:
-                    if (panel == self.panel1 and dimension == "x") or \
-                    (panel == self.panel2 and dimension == "y") or \
-                    (panel == self.panel4 and dimension == "z"):
-                        if slice_number == slice_index:
-                            if t == "P":
-                                ax.plot(x, height-y, 'go')
-                            else:
-                                ax.plot(x, height-y, 'ro')
-        else:
-            # Display "No Data" message if slice_data is None
-            ax.text(0.5, 0.5, 'No Data', color='red', fontsize=20, ha='center', va='center')
+    def on_panel_draw(self, panel):
+        """
+        Cache the static background of a panel after a full redraw and draw its artists on top.
 
+        Args:
+            panel (FigureCanvas): The panel that was redrawn.
+        """
+        artists = self.panel_artists.get(panel)
+        if artists is None:
+            return
+        artists["background"] = panel.copy_from_bbox(panel.figure.bbox)
+        self.draw_panel_artists(panel)
+
+    def draw_panel_artists(self, panel):
+        """
+        Draw the animated artists of a panel onto its canvas.
+
+        Args:
+            panel (FigureCanvas): The panel to draw.
+        """
+        artists = self.panel_artists[panel]
+        for name in ("image", "overlay", "positive", "negative", "label", "hud"):
+            panel.figure.draw_artist(artists[name])
+
+    def blit_panel(self, panel):
+        """
+        Redraw only the artists of a panel by restoring its cached background and blitting.
+        Falls back to a full redraw when no background has been cached yet.
+
+        Args:
+            panel (FigureCanvas): The panel to redraw.
+        """
+        background = self.panel_artists[panel]["background"]
+        if background is None:
+            with span("view.canvas_draw"):
+                panel.draw()
+            return
+        with span("view.blit"):
+            panel.restore_region(background)
+            self.draw_panel_artists(panel)
+            panel.blit(panel.figure.bbox)
+
+    def clear_panel(self, panel):
+        """
+        Remove the slice artists of a panel and display a "No Data" message.
+
+        Args:
+            panel (FigureCanvas or ImagePanel): The panel to clear.
+        """
+        if isinstance(panel, ImagePanel):
+            panel.clear()
+            return
+        canvas = panel
+        self.panel_artists[panel] = None
+        canvas.figure.texts = [canvas.figure.texts[0]]
+        ax = canvas.figure.gca()
+        ax.clear()
+        ax.text(0.5, 0.5, 'No Data', color='red', fontsize=20, ha='center', va='center')
         ax.axis("off")
         canvas.draw()
 
+    def set_hud_text(self, text):
+        """
+        Set the performance overlay text of the slice panels.
+
+        Args:
+            text (str): The text, empty to hide the overlay.
+        """
+        self.hud_text = text
+        for panel in (self.panel1, self.panel2, self.panel4):
+            if isinstance(panel, ImagePanel):
+                panel.set_hud(text)
+            elif self.panel_artists.get(panel) is not None:
+                self.panel_artists[panel]["hud"].set_text(text)
+
+    def show_load_progress(self, value):
+        """
+        Show the loading progress in the status bar.
+
+        Args:
+            value (int): The progress in percent.
+        """
+        self.load_progress_bar.setValue(value)
+        self.load_progress_bar.show()
+        self.cancel_load_button.show()
+        self.statusBar().showMessage("Loading...")
+
+    def hide_load_progress(self):
+        """
+        Hide the loading progress from the status bar.
+        """
+        self.load_progress_bar.hide()
+        self.cancel_load_button.hide()
+        self.statusBar().clearMessage()
+
+    def show_save_progress(self, value):
+        """
+        Show the saving progress in the status bar.
+
+        Args:
+            value (int): The progress in percent.
+        """
+        self.save_progress_bar.setValue(value)
+        self.save_progress_bar.show()
+        self.cancel_save_button.show()
+        self.statusBar().showMessage("Saving...")
+
+    def hide_save_progress(self):
+        """
+        Hide the saving progress from the status bar.
+        """
+        self.save_progress_bar.hide()
+        self.cancel_save_button.hide()
+        self.statusBar().clearMessage()
+
     def display_error(self, message):
         """
         Display an error message in a message box.
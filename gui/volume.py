@@ -0,0 +1,146 @@
+import mmap
+import numpy as np
+
+# Slices read at once when a volume is processed in slabs along its third spatial axis
+SLAB_SIZE = 16
+
+class LazyVolume:
+    """
+    Read-only view over a nibabel array proxy that only reads the indexed region from disk.
+
+    Slicing a `LazyVolume` goes through the proxy, so uncompressed files are memory-mapped and
+    scl_slope/scl_inter are applied to the requested region only.
+
+    Args:
+        proxy: The nibabel array proxy (`nifti_img.dataobj`) to read from.
+        add_channel_axis (bool, optional): Expose a 3D proxy as 4D with a single trailing channel.
+        dtype (np.dtype, optional): Type each read region is converted to. Defaults to the on-disk
+            dtype, or float32 if the proxy applies read scaling.
+    """
+    def __init__(self, proxy, add_channel_axis=False, dtype=None):
+        self.proxy = proxy
+        self.add_channel_axis = add_channel_axis and len(proxy.shape) == 3
+        self.shape = tuple(proxy.shape) + ((1,) if self.add_channel_axis else ())
+        self.ndim = len(self.shape)
+        if dtype is None:
+            dtype = np.float32 if self.is_scaled else proxy.dtype
+        self.dtype = np.dtype(dtype)
+        # Regions of unscaled uncompressed files are sliced from a memory map, the proxy would read
+        # strided planes one small segment at a time
+        self.memmap = None
+        file_like = getattr(proxy, "file_like", None)
+        if not self.is_scaled and isinstance(file_like, str) and not file_like.endswith(".gz"):
+            unscaled = proxy.get_unscaled()
+            if isinstance(unscaled, np.memmap):
+                self.memmap = unscaled
+
+    @property
+    def is_scaled(self):
+        """
+        Whether the proxy applies scl_slope/scl_inter on read.
+        """
+        slope = getattr(self.proxy, "slope", 1.0)
+        inter = getattr(self.proxy, "inter", 0.0)
+        return slope != 1.0 or inter != 0.0
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if self.add_channel_axis:
+            key = key + (slice(None),) * (4 - len(key))
+            data = self._read(key[:3])
+            return data[..., np.newaxis][..., key[3]]
+        return self._read(key)
+
+    def _read(self, key):
+        data = np.asarray(self.memmap[key] if self.memmap is not None else self.proxy[key])
+        if np.issubdtype(self.dtype, np.integer) and not np.issubdtype(data.dtype, np.integer):
+            data = np.rint(data)
+        return data.astype(self.dtype, copy=False)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+def iter_slabs(volume, slab_size=SLAB_SIZE, key=()):
+    """
+    Iterate over a volume in slabs along the third spatial axis, so that a lazily read volume is never
+    resident as a whole.
+
+    Args:
+        volume (np.ndarray, LazyVolume or SparseMask): 3D or 4D volume
+        slab_size (int, optional): Number of slices per slab
+        key (tuple, optional): Index applied to the axes after the spatial ones, such as a channel
+
+    Yields:
+        tuple: Start index of the slab and the slab data
+    """
+    for start in range(0, volume.shape[2], slab_size):
+        yield start, np.asarray(volume[(slice(None), slice(None), slice(start, start + slab_size)) + key])
+
+def build_axis_copies(volume, budget_bytes):
+    """
+    Build contiguous copies of a volume so that planes along strided spatial axes can be read
+    as one contiguous block. The axis whose planes are already contiguous is never copied.
+
+    Args:
+        volume (np.ndarray): 3D volume or 4D volume with a trailing channel axis
+        budget_bytes (int): Maximum number of bytes the copies may use
+
+    Returns:
+        dict: Copies by spatial axis index. A 4D copy is indexed as `copy[channel, index]`,
+            a 3D copy as `copy[index]`, with the remaining axes in their original order.
+    """
+    copies = {}
+    if not isinstance(volume, np.ndarray):
+        return copies
+    # Planes along the axis with the largest stride are contiguous, the others are gathers
+    strided_axes = sorted(range(3), key=lambda axis: abs(volume.strides[axis]))[:-1]
+    used_bytes = 0
+    for axis in strided_axes:
+        if used_bytes + volume.nbytes > budget_bytes:
+            break
+        order = [axis] + [other for other in range(3) if other != axis]
+        if volume.ndim == 4:
+            order = [3] + order
+        copies[axis] = np.ascontiguousarray(volume.transpose(order))
+        used_bytes += volume.nbytes
+    return copies
+
+def take_plane(volume, axis, index):
+    """
+    Get the plane of a volume at an index along a spatial axis.
+
+    Args:
+        volume (np.ndarray): 3D or 4D volume
+        axis (int): The spatial axis
+        index (int): Index of the plane along the axis
+
+    Returns:
+        np.ndarray: The plane, with the channel axis last for 4D volumes
+    """
+    key = [slice(None)] * 3
+    key[axis] = index
+    return volume[tuple(key)]
+
+def resident_nbytes(volume):
+    """
+    Get the number of bytes of a volume held in RAM. Memory maps and on-disk proxies count as 0,
+    their pages can be dropped and read again by the operating system.
+
+    Args:
+        volume (np.ndarray, LazyVolume or SparseMask): The volume, or None
+
+    Returns:
+        int: The resident bytes
+    """
+    if volume is None or isinstance(volume, LazyVolume):
+        return 0
+    if not isinstance(volume, np.ndarray):
+        return getattr(volume, "nbytes", 0)
+    base = volume
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return 0
+        base = getattr(base, "base", None)
+    return volume.nbytes
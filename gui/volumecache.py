@@ -0,0 +1,156 @@
+import hashlib
+import os
+import numpy as np
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "medical-segmentation", "volumes"
+)
+DEFAULT_CACHE_BYTES = 10 * 1024 * 1024 * 1024
+CACHE_SUFFIX = ".npy"
+
+class VolumeCache:
+    """
+    On-disk cache of decoded volumes stored as uncompressed `.npy` files, so that reopening a compressed
+    or scaled study memory-maps the decoded data instead of decoding the file again.
+    Entries are keyed by the absolute path, size and modification time of the source file, which
+    invalidates them when the file changes. The least recently used entries are evicted to keep the
+    cache within its size.
+
+    Args:
+        directory (str, optional): Directory of the cache files, created if needed
+        max_bytes (int, optional): Maximum total size of the cache files
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def entry_path(self, path):
+        """
+        Get the cache file of a source file in its current version.
+
+        Args:
+            path (str): Path to the source file
+
+        Returns:
+            str: Path to the cache file
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = hashlib.sha1(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, path):
+        """
+        Get the decoded volume of a source file if it is cached, and mark it as recently used.
+
+        Args:
+            path (str): Path to the source file
+
+        Returns:
+            np.memmap: Read-only memory map of the decoded volume, or None on a miss
+        """
+        entry_path = self.entry_path(path)
+        if not os.path.exists(entry_path):
+            return None
+        try:
+            data = np.load(entry_path, mmap_mode="r")
+        except (OSError, ValueError):
+            # Remove entries that were truncated or written by an incompatible version
+            self.remove(entry_path)
+            return None
+        # The modification time of an entry records its last use for the eviction order
+        os.utime(entry_path)
+        return data
+
+    def put(self, path, data):
+        """
+        Store the decoded volume of a source file and evict old entries to stay within the size.
+        Volumes larger than the cache are not stored.
+
+        Args:
+            path (str): Path to the source file
+            data (np.ndarray): The decoded volume
+
+        Returns:
+            bool: True if the volume was stored
+        """
+        if data.nbytes > self.max_bytes:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        entry_path = self.entry_path(path)
+        self.evict(self.max_bytes - data.nbytes)
+        # Write next to the entry and rename, so that readers never see a partial file
+        temporary_path = f"{entry_path}.{os.getpid()}.part"
+        try:
+            with open(temporary_path, "wb") as file:
+                np.lib.format.write_array(file, data, allow_pickle=False)
+            os.replace(temporary_path, entry_path)
+        except BaseException:
+            self.remove(temporary_path)
+            raise
+        return True
+
+    def entries(self):
+        """
+        Get the cache files from the least to the most recently used.
+
+        Returns:
+            list: Tuples of path, size in bytes and last use time
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            entry_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry_path)
+            except FileNotFoundError:
+                continue
+            entries.append((entry_path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size(self):
+        """
+        Get the total size of the cache files.
+
+        Returns:
+            int: The size in bytes
+        """
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes):
+        """
+        Remove the least recently used entries until the cache holds at most `max_bytes`.
+        Volumes that are memory-mapped stay readable until they are closed.
+
+        Args:
+            max_bytes (int): The size to shrink the cache to
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for entry_path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            self.remove(entry_path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        self.evict(0)
+
+    @staticmethod
+    def remove(path):
+        """
+        Remove a cache file if it exists.
+
+        Args:
+            path (str): The cache file
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,202 @@
+import numpy as np
+from gui.volume import iter_slabs
+
+HISTOGRAM_BINS = 1024
+# Integer channels whose value range fits are mapped through a lookup table instead of arithmetic
+MAX_LUT_ENTRIES = 1 << 16
+DEFAULT_PERCENTILES = (0.5, 99.5)
+# Value range of channels without finite values, e.g. all NaN
+DEFAULT_RANGE = (0.0, 1.0)
+
+# (width, level) in Hounsfield units
+CT_PRESETS = {
+    "CT Brain": (80, 40),
+    "CT Subdural": (200, 75),
+    "CT Abdomen": (400, 50),
+    "CT Mediastinum": (350, 50),
+    "CT Lung": (1500, -600),
+    "CT Bone": (2000, 300),
+}
+# (lower, upper) percentiles of the channel histogram
+PERCENTILE_PRESETS = {
+    "Full Range": (0, 100),
+    "Robust (0.5-99.5%)": DEFAULT_PERCENTILES,
+    "MR (1-99%)": (1, 99),
+    "MR Tight (5-95%)": (5, 95),
+}
+
+class ChannelStatistics:
+    """
+    Intensity statistics of one image channel.
+
+    Args:
+        minimum (float): Smallest value of the channel
+        maximum (float): Largest value of the channel
+        histogram (np.ndarray): Number of values per histogram bin
+        bin_edges (np.ndarray): Lower edges of the bins followed by the upper edge of the last bin
+    """
+    def __init__(self, minimum, maximum, histogram, bin_edges):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.histogram = histogram
+        self.bin_edges = bin_edges
+
+    @classmethod
+    def compute_all(cls, volume, max_slices=None):
+        """
+        Compute the statistics of every channel of a 4D volume in streaming passes over slabs.
+        Channels of 8 or 16 bit integers get an exact histogram in a single pass, other types need
+        a first pass for the value range.
+
+        Args:
+            volume (np.ndarray or LazyVolume): 4D volume with a trailing channel axis
+            max_slices (int, optional): Only sample this many evenly spread slices along the last
+                spatial axis instead of reading the whole volume
+
+        Returns:
+            list: The statistics of each channel
+        """
+        depth = volume.shape[2]
+        if max_slices is not None and max_slices < depth:
+            indices = np.unique(np.linspace(0, depth - 1, max_slices).astype(int))
+            slabs = lambda: ((volume[:, :, index:index + 1]) for index in indices)
+        else:
+            slabs = lambda: (slab for _, slab in iter_slabs(volume))
+        channels = volume.shape[3]
+
+        if np.dtype(volume.dtype).kind in "iu" and np.dtype(volume.dtype).itemsize <= 2:
+            info = np.iinfo(volume.dtype)
+            counts = np.zeros((channels, int(info.max) - int(info.min) + 1), dtype=np.int64)
+            for slab in slabs():
+                for channel in range(channels):
+                    values = np.asarray(slab[..., channel]).ravel().astype(np.int32) - int(info.min)
+                    counts[channel] += np.bincount(values, minlength=counts.shape[1])
+            statistics = []
+            for channel_counts in counts:
+                present = np.flatnonzero(channel_counts)
+                first, last = (present[0], present[-1]) if len(present) else (0, 0)
+                edges = np.arange(first, last + 2, dtype=np.float64) + info.min
+                statistics.append(cls(edges[0], edges[-2], channel_counts[first:last + 1], edges))
+            return statistics
+
+        minimum = np.full(channels, np.inf)
+        maximum = np.full(channels, -np.inf)
+        for slab in slabs():
+            slab = np.asarray(slab)
+            # fmin and fmax skip NaN without warning about all-NaN slabs
+            minimum = np.fmin(minimum, np.fmin.reduce(slab, axis=(0, 1, 2)))
+            maximum = np.fmax(maximum, np.fmax.reduce(slab, axis=(0, 1, 2)))
+        empty = ~(np.isfinite(minimum) & np.isfinite(maximum))
+        minimum[empty], maximum[empty] = DEFAULT_RANGE
+        histograms = np.zeros((channels, HISTOGRAM_BINS), dtype=np.int64)
+        edges = [np.linspace(low, high if high > low else low + 1, HISTOGRAM_BINS + 1) for low, high in zip(minimum, maximum)]
+        for slab in slabs():
+            for channel in range(channels):
+                histograms[channel] += np.histogram(np.asarray(slab[..., channel]), bins=edges[channel])[0]
+        return [cls(float(minimum[c]), float(maximum[c]), histograms[c], edges[c]) for c in range(channels)]
+
+    def percentile(self, q):
+        """
+        Estimate a percentile of the channel values from the histogram.
+
+        Args:
+            q (float): The percentile between 0 and 100
+
+        Returns:
+            float: The estimated value
+        """
+        total = self.histogram.sum()
+        if total == 0:
+            return float(self.minimum)
+        cumulative = np.cumsum(self.histogram) / total
+        index = min(int(np.searchsorted(cumulative, q / 100)), len(self.histogram) - 1)
+        return float(self.bin_edges[index])
+
+class WindowLevel:
+    """
+    Window/level mapping of one image channel to uint8 display values.
+
+    Args:
+        statistics (ChannelStatistics): The statistics of the channel
+    """
+    def __init__(self, statistics):
+        self.statistics = statistics
+        self._lut = None
+        self._lut_key = None
+        self.set_percentile_window(*DEFAULT_PERCENTILES)
+
+    @property
+    def key(self):
+        """
+        The current window as a hashable key.
+        """
+        return (self.width, self.level)
+
+    def set_window(self, width, level):
+        """
+        Set the window width and level.
+
+        Args:
+            width (float): The width of the window, at least 1
+            level (float): The center of the window
+        """
+        self.width = max(float(width), 1.0)
+        self.level = float(level)
+
+    def set_percentile_window(self, lower, upper):
+        """
+        Set the window to span two percentiles of the channel values.
+
+        Args:
+            lower (float): The lower percentile
+            upper (float): The upper percentile
+        """
+        low = self.statistics.percentile(lower)
+        high = self.statistics.percentile(upper)
+        self.set_window(high - low, (low + high) / 2)
+
+    def set_preset(self, name):
+        """
+        Apply a named CT or percentile preset.
+
+        Args:
+            name (str): The name of the preset in `CT_PRESETS` or `PERCENTILE_PRESETS`
+        """
+        if name in CT_PRESETS:
+            self.set_window(*CT_PRESETS[name])
+        else:
+            self.set_percentile_window(*PERCENTILE_PRESETS[name])
+
+    def drag(self, delta_x, delta_y):
+        """
+        Adjust the window for a mouse drag: horizontal changes the width, vertical the level.
+
+        Args:
+            delta_x (float): Horizontal drag distance in pixels
+            delta_y (float): Vertical drag distance in pixels, positive downwards
+        """
+        step = max(self.statistics.maximum - self.statistics.minimum, 1.0) / 500
+        self.set_window(self.width + delta_x * step, self.level - delta_y * step)
+
+    def apply(self, slice_data):
+        """
+        Map a slice of the channel to display values.
+
+        Args:
+            slice_data (np.ndarray): The slice of the channel
+
+        Returns:
+            np.ndarray: uint8 slice, 0 below and 255 above the window
+        """
+        low = self.level - self.width / 2
+        if slice_data.dtype.kind in "iu":
+            offset = int(self.statistics.minimum)
+            entries = int(self.statistics.maximum) - offset + 1
+            if entries <= MAX_LUT_ENTRIES:
+                if self._lut is None or self._lut_key != self.key:
+                    values = np.arange(entries, dtype=np.float32) + offset
+                    self._lut = np.clip((values - low) * (255 / self.width), 0, 255).astype(np.uint8)
+                    self._lut_key = self.key
+                return np.take(self._lut, slice_data.astype(np.int32) - offset, mode="clip")
+        scaled = (slice_data.astype(np.float32) - np.float32(low)) * np.float32(255 / self.width)
+        return np.clip(scaled, 0, 255, out=scaled).astype(np.uint8)
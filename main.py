@@ -1,16 +1,80 @@
+import time
+# Process start of the startup report, taken before the imports
+STARTUP_TIME = time.perf_counter()
+
+import argparse
+import json
 import sys
 from PyQt5.QtWidgets import QApplication
 from gui.controller import GuiController
 from gui.filehandler import FileHandler
-from gui.view import GuiView
+from gui.instrumentation import INSTRUMENTATION
+from gui.session import StudySession
+from gui.view import GuiView, PANEL_BACKENDS
+from gui.volumecache import DEFAULT_CACHE_DIRECTORY, VolumeCache
+
+
+def startup_report(marks):
+    """
+    Build the startup timing report.
+
+    Args:
+        marks (list): Tuples of phase name and `time.perf_counter` at the end of the phase, in order
+
+    Returns:
+        dict: Duration of every phase and time to the end of every phase in milliseconds, and whether
+            the heavy optional modules were imported
+    """
+    phases = {}
+    previous = STARTUP_TIME
+    for name, end in marks:
+        phases[name] = {"ms": (end - previous) * 1e3, "since_start_ms": (end - STARTUP_TIME) * 1e3}
+        previous = end
+    return {
+        "phases": phases,
+        "imported": {module: module in sys.modules for module in ("matplotlib", "matplotlib.pyplot", "nibabel")},
+    }
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Medical Segmentation")
+    parser.add_argument("--panels", choices=PANEL_BACKENDS, default="matplotlib", help="Slice panel implementation")
+    parser.add_argument("--sparse-mask", action="store_true", help="Keep masks run-length encoded in memory")
+    parser.add_argument(
+        "--cache-dir", nargs="?", const=DEFAULT_CACHE_DIRECTORY,
+        help=f"Cache decoded compressed or scaled volumes in this directory (default when given without a value: {DEFAULT_CACHE_DIRECTORY}). "
+        "Disabled by default, the first load of a file also writes its decoded copy",
+    )
+    parser.add_argument("--cache-size-gb", type=float, default=10, help="Size of the decoded volume cache")
+    parser.add_argument("--session-budget-gb", type=float, default=4, help="RAM kept for open studies before older ones are released")
+    parser.add_argument("--trace", help="Record stage timings and write them as a Chrome trace to this file on exit")
+    parser.add_argument("--startup-report", action="store_true", help="Print the time spent in every startup phase as JSON")
+    parser.add_argument("--exit-after-startup", action="store_true", help="Quit once the window is shown and the panels are created")
+    args, qt_args = parser.parse_known_args()
+    marks = [("imports", time.perf_counter())]
+    app = QApplication(sys.argv[:1] + qt_args)
+    marks.append(("application", time.perf_counter()))
 
-    file_handler = FileHandler()
-    view = GuiView()
-    controller = GuiController(file_handler, view)
+    volume_cache = VolumeCache(args.cache_dir, int(args.cache_size_gb * 1024 ** 3)) if args.cache_dir else None
+    file_handler = FileHandler(
+        lazy=True, axis_layout_budget=512 * 1024 * 1024, pyramid=True, sparse_mask=args.sparse_mask, volume_cache=volume_cache,
+    )
+    # The matplotlib panels are created once the window is on screen
+    view = GuiView(panel_backend=args.panels, defer_panels=True)
+    controller = GuiController(file_handler, view, session=StudySession(int(args.session_budget_gb * 1024 ** 3)))
+    if args.trace:
+        view.record_timings_action.setChecked(True)
+        app.aboutToQuit.connect(lambda: INSTRUMENTATION.export_chrome_trace(args.trace))
+    marks.append(("window", time.perf_counter()))
 
     view.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    app.processEvents()
+    marks.append(("first_paint", time.perf_counter()))
+    view.create_deferred_panels()
+    app.processEvents()
+    marks.append(("panels", time.perf_counter()))
+    if args.startup_report:
+        print(json.dumps(startup_report(marks), indent=2))
+    if args.exit_after_startup:
+        sys.exit(0)
+    sys.exit(app.exec_())